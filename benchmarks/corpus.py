@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+# Synthetic replays for benchmarking.
+#
+# The games are random walks: the mouse moves towards a random cell in small
+# steps and clicks it. Nobody would mistake them for real games, but they
+# have the same event mix as real replays (mostly moves, which RMV v2 stores
+# as reduced moves), and the files are laid out exactly like the ones the
+# clients write, so they exercise the same code paths in the parsers.
+#
+# Everything is derived from a seed, so the same seed always gives the same
+# bytes.
+
+from itertools import islice
+import os
+import random
+from struct import Struct
+
+from sweeping_view.rmv import BOARD, MOUSE_EVENT, SECTION_SIZES
+from sweeping_view.evf import EVENT, HEADER
+
+# cols, rows, number of mines, number of mouse events, game time in ms
+SIZES = {
+    "beginner": (8, 8, 10, 500, 10000),
+    "intermediate": (16, 16, 40, 2000, 40000),
+    "expert": (30, 16, 99, 6000, 100000),
+    "custom": (60, 40, 480, 60000, 600000),
+    # an hour-long game
+    "marathon": (100, 100, 2000, 1000000, 3600000),
+}
+
+STANDARD_BOARDS = {
+    (8, 8, 10): "beginner",
+    (16, 16, 40): "intermediate",
+    (30, 16, 99): "expert",
+}
+
+CELL_SIZE = 16
+
+NAME = "bench"
+VERSION_INFO = "sweeping-view benchmark corpus"
+
+UINT16 = Struct(">H")
+UINT32 = Struct(">I")
+
+
+def place_mines(rng, cols, rows, num_mines):
+    # (row, col) pairs, column by column like the parsers return them
+    cells = rng.sample(range(cols * rows), num_mines)
+    return sorted(
+        ((cell % rows, cell // rows) for cell in cells), key=lambda m: m[::-1]
+    )
+
+
+def game(rng, cols, rows, duration, num_events, cell_size=CELL_SIZE):
+    # Infinite stream of mouse events as
+    # (subtype, gametime, x, y, number of flags, board events), where the
+    # board events are (subtype, row, col) tuples. The pace is chosen so that
+    # num_events events take about duration ms.
+    max_dt = max(2 * duration // num_events, 1)
+    gametime = 0
+    # the first event is on the board's top left cell, at time 0
+    xpos = ypos = cell_size // 2
+    flags = 0
+    yield "move", gametime, xpos, ypos, flags, ()
+    while True:
+        row = rng.randrange(rows)
+        col = rng.randrange(cols)
+        target_x = col * cell_size + rng.randrange(cell_size)
+        target_y = row * cell_size + rng.randrange(cell_size)
+        while xpos != target_x or ypos != target_y:
+            xpos += max(-8, min(7, target_x - xpos))
+            ypos += max(-8, min(7, target_y - ypos))
+            gametime += rng.randrange(max_dt)
+            yield "move", gametime, xpos, ypos, flags, ()
+        if rng.random() < 0.1:
+            flags += 1
+            gametime += rng.randrange(max_dt)
+            yield "rmb_down", gametime, xpos, ypos, flags, (("flag", row, col),)
+            gametime += rng.randrange(max_dt)
+            yield "rmb_up", gametime, xpos, ypos, flags, ()
+        else:
+            gametime += rng.randrange(max_dt)
+            yield "lmb_down", gametime, xpos, ypos, flags, (("pressed", row, col),)
+            gametime += rng.randrange(max_dt)
+            opened = "open_{}".format(rng.randrange(9))
+            yield "lmb_up", gametime, xpos, ypos, flags, ((opened, row, col),)
+
+
+RMV_MOUSE_CODES = {"move": 1, "lmb_down": 2, "lmb_up": 3, "rmb_down": 4, "rmb_up": 5}
+RMV_BOARD_CODES = {
+    "pressed": 9,
+    "flag": 13,
+    "open_0": 18,
+    "open_1": 19,
+    "open_2": 20,
+    "open_3": 21,
+    "open_4": 22,
+    "open_5": 23,
+    "open_6": 24,
+    "open_7": 25,
+    "open_8": 26,
+}
+RMV_LEVELS = {"beginner": 0, "intermediate": 1, "expert": 2}
+
+
+def rmv(rng, cols, rows, num_mines, num_events, duration, version=2, reduced=None):
+    # reduced moves (event 28) are used for small moves if reduced is set,
+    # which is the default for v2
+    if reduced is None:
+        reduced = version >= 2
+    mines = place_mines(rng, cols, rows, num_mines)
+    level = STANDARD_BOARDS.get((cols, rows, num_mines))
+    bbbv = rng.randrange(num_mines, 2 * num_mines + 2)
+    timestamp = 1600000000 + rng.randrange(10**8)
+
+    # v1 coordinates are relative to the client area, not the board
+    xoffs, yoffs = (12, 56) if version == 1 else (0, 0)
+    video = bytearray()
+    last_time = last_x = last_y = None
+    gametime = 0
+    pack_mouse = MOUSE_EVENT.pack
+    for subtype, gametime, xpos, ypos, flags, board in islice(
+        game(rng, cols, rows, duration, num_events), num_events
+    ):
+        xpos += xoffs
+        ypos += yoffs
+        if (
+            reduced
+            and subtype == "move"
+            and last_time is not None
+            and gametime - last_time <= 255
+            and -8 <= xpos - last_x <= 7
+            and -8 <= ypos - last_y <= 7
+        ):
+            video += bytes(
+                (
+                    28,
+                    gametime - last_time,
+                    ((xpos - last_x) & 15) << 4 | (ypos - last_y) & 15,
+                )
+            )
+        else:
+            video.append(RMV_MOUSE_CODES[subtype])
+            video += pack_mouse(gametime << 8 | min(flags, 255), xpos, ypos)
+        last_time, last_x, last_y = gametime, xpos, ypos
+        for board_subtype, row, col in board:
+            video += bytes((RMV_BOARD_CODES[board_subtype], col, row))
+    # win, then timeth, two unknown bytes and timeth again
+    timeth = gametime.to_bytes(3, "big")
+    video.append(16)
+    video += timeth + b"\0\0" + timeth
+
+    version_info = VERSION_INFO.encode()
+    if version == 1:
+        player_fields = [NAME]
+    else:
+        player_fields = [NAME, NAME, "", ""]
+    player_info = UINT16.pack(len(player_fields))
+    for field in player_fields:
+        player_info += bytes((len(field),)) + field.encode()
+    board_info = BOARD.pack(timestamp, cols, rows, num_mines)
+    board_info += bytes(value for row, col in mines for value in (col, row))
+    # no preflags
+    preflags = b"\0\0"
+    properties = bytes((0, 0, 0, RMV_LEVELS.get(level, 3)))
+    if version >= 2:
+        properties += bytes((bbbv & 0xFF, bbbv >> 8, CELL_SIZE))
+    checksum = bytes(rng.randrange(256) for _ in range(18))
+
+    if version == 1:
+        result_str = "#LEVEL:{}#NAME:{}#NICK:{}#3BV:{}#TIMESTAMP:{}#".format(
+            (level or "custom").title(), NAME, NAME, bbbv, timestamp
+        ).encode()
+        sections = [result_str, version_info, player_info, board_info, preflags]
+        sections += [properties]
+        sizes = [len(section) for section in sections]
+        header = b"*rmv" + UINT16.pack(1)
+    else:
+        extension_properties = b"\0\0"
+        sections = [version_info, player_info, board_info, preflags, properties]
+        sections += [extension_properties]
+        sizes = [len(section) for section in sections]
+        # Viennasweeper 5
+        header = b"*rmv" + UINT16.pack(2) + bytes((1, 5))
+    sections += [video, checksum]
+    sizes += [len(video), len(checksum)]
+    body = SECTION_SIZES.pack(*sizes) + b"".join(sections)
+    # v2's extra header bytes aren't counted
+    return header + UINT32.pack(10 + len(body)) + body
+
+
+EVF_MOUSE_CODES = {"move": 1, "lmb_down": 2, "lmb_up": 3, "rmb_down": 4, "rmb_up": 5}
+
+
+def evf(rng, cols, rows, num_mines, num_events, duration):
+    mines = place_mines(rng, cols, rows, num_mines)
+    bbbv = rng.randrange(num_mines, 2 * num_mines + 2)
+    start = 1700000000000000 + rng.randrange(10**12)
+
+    events = bytearray()
+    gametime = 0
+    pack_event = EVENT.pack
+    for subtype, gametime, xpos, ypos, _, _ in islice(
+        game(rng, cols, rows, duration, num_events), num_events
+    ):
+        events += pack_event(EVF_MOUSE_CODES[subtype] << 24 | gametime, xpos, ypos)
+
+    board = bytearray((cols * rows - 1) // 8 + 1)
+    for row, col in mines:
+        bit_index = row * cols + col
+        board[bit_index // 8] |= 128 >> (bit_index % 8)
+    strings = [
+        VERSION_INFO,
+        NAME,
+        NAME,
+        NAME,
+        str(start),
+        str(start + 1000 * gametime),
+        "XX",
+        "{:032x}".format(rng.getrandbits(128)),
+    ]
+    return b"".join(
+        [
+            b"\3",
+            # completed, default settings, normal mode
+            HEADER.pack(0x80, 0, rows, cols, num_mines, CELL_SIZE, 0, bbbv),
+            gametime.to_bytes(3, "big"),
+            b"".join(string.encode() + b"\0" for string in strings),
+            board,
+            events,
+            # terminator and checksum
+            b"\0",
+            bytes(rng.randrange(256) for _ in range(32)),
+        ]
+    )
+
+
+AVF_MOUSE_CODES = {"move": 1, "lmb_down": 3, "lmb_up": 5, "rmb_down": 9, "rmb_up": 17}
+AVF_LEVELS = {"beginner": 3, "intermediate": 4, "expert": 5}
+
+
+def avf(rng, cols, rows, num_mines, num_events, duration, freesweeper=False):
+    mines = place_mines(rng, cols, rows, num_mines)
+    level = STANDARD_BOARDS.get((cols, rows, num_mines))
+    bbbv = rng.randrange(num_mines, 2 * num_mines + 2)
+
+    if level is None:
+        board = bytes((6, cols - 1, rows - 1)) + UINT16.pack(num_mines)
+    else:
+        board = bytes((AVF_LEVELS[level],))
+    # 1-based (row, col)
+    board += bytes(value + 1 for mine in mines for value in mine)
+
+    events = bytearray()
+    thousandths = bytearray()
+    gametime = 0
+    for subtype, gametime, xpos, ypos, _, _ in islice(
+        game(rng, cols, rows, duration, num_events), num_events
+    ):
+        sec, rest = divmod(gametime, 1000)
+        # the second count is stored + 1, so that the last record can have -1
+        sec += 1
+        events += bytes(
+            (
+                AVF_MOUSE_CODES[subtype],
+                xpos >> 8,
+                sec & 0xFF,
+                xpos & 0xFF,
+                rest // 10,
+                ypos >> 8,
+                sec >> 8,
+                ypos & 0xFF,
+            )
+        )
+        thousandths.append(rest % 10)
+    events += b"\1\0\0\0\0\0\0\0"
+    thousandths.append(0)
+
+    # arbiter's peculiar way of writing milliseconds, see AVFReplay
+    ms = rng.randrange(1000)
+    ms_str = "{}{}{}".format(ms // 100, ms // 10, ms % 10)
+    boardgen = "{}.{}.{}.{}:{}:{}:{}".format(
+        rng.randrange(1, 29),
+        rng.randrange(1, 13),
+        rng.randrange(2005, 2025),
+        rng.randrange(24),
+        rng.randrange(60),
+        rng.randrange(60),
+        ms_str,
+    )
+    ts_fields = ["0", boardgen, "22.16:39:11:3325", "HS"]
+    if level is None:
+        ts_fields.insert(1, "{}x{}x{}".format(cols, rows, num_mines))
+    ts_fields.append(
+        "B{}T{}.{:02}".format(bbbv, gametime // 1000, gametime // 10 % 100)
+    )
+    ts_info = "[{}]".format("|".join(ts_fields)).encode()
+
+    if freesweeper:
+        trailer = b"cs=" + thousandths + bytes(17) + b"\r"
+        version_info = "Freesweeper 1.0"
+    else:
+        trailer = b"cs=" + bytes(rng.randrange(256) for _ in range(17))
+        version_info = "Minesweeper Arbiter 0.52.3. Copyright 2005-2006"
+    footer = "RealTime: {:.2f}\rSkin: 3.1\r{}\r{}".format(
+        gametime / 1000, NAME, version_info
+    )
+    return b"".join(
+        [
+            b"\0" if freesweeper else b"\x34",
+            b"\x13\x07\x09\x0d",
+            board,
+            # some unknown bytes, and the question mark setting right before
+            # the timestamp block
+            b"\x06\x08\x09\x06\xd3\xd3\xd7\xee\x02\x05\x27\x42\x40\x40\x4c\x04\x09",
+            b"\x11\x38",
+            ts_info,
+            b"\x0c\x0b\x09\x09\x09",
+            events,
+            b"4019222712048689528722031010",
+            trailer,
+            footer.encode("cp1252"),
+        ]
+    )
+
+
+# name: (function, keyword arguments, extension)
+VARIANTS = {
+    "rmv1": (rmv, {"version": 1}, ".rmv"),
+    "rmv2": (rmv, {"version": 2}, ".rmv"),
+    "evf": (evf, {}, ".evf"),
+    "arbiter": (avf, {}, ".avf"),
+    "freesweeper": (avf, {"freesweeper": True}, ".avf"),
+}
+
+
+def generate(variant, size, seed=0):
+    function, kwargs, _ = VARIANTS[variant]
+    cols, rows, num_mines, num_events, duration = SIZES[size]
+    rng = random.Random("{}:{}:{}".format(variant, size, seed))
+    return function(rng, cols, rows, num_mines, num_events, duration, **kwargs)
+
+
+def filename(variant, size, seed=0):
+    return "{}-{}-{}{}".format(size, variant, seed, VARIANTS[variant][2])
+
+
+def write_corpus(directory, variants=None, sizes=None, seed=0):
+    # writes the replays that aren't there yet, and returns
+    # (variant, size, path) for all of them
+    os.makedirs(directory, exist_ok=True)
+    result = []
+    for size in sizes or SIZES:
+        for variant in variants or VARIANTS:
+            path = os.path.join(directory, filename(variant, size, seed))
+            if not os.path.exists(path):
+                data = generate(variant, size, seed)
+                with open(path + ".tmp", "wb") as file:
+                    file.write(data)
+                os.replace(path + ".tmp", path)
+            result.append((variant, size, path))
+    return result
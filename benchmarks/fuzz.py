@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# A fuzzing harness for the parsers.
+#
+#     python -m benchmarks.fuzz --iterations 100000
+#
+# Replays from the synthetic corpus (see corpus.py) are mutated at random -
+# bytes changed, cut off, inserted, zeroed and duplicated - and parsed in every
+# mode (full, metadata only, event table, streamed and incremental). Parsers
+# may only fail with the library's exceptions, anything else is reported with
+# the seed that reproduces it:
+#
+#     mutate(generate(variant, "beginner"), random.Random(seed))
+#
+# After that, parse times are measured for replays of growing size, and for
+# replays followed or interrupted by growing amounts of random data, to show
+# that they stay linear in the input size. The exit status is 1 if anything
+# unexpected was raised, or if the time per byte of the biggest input is more
+# than --tolerance times that of the smallest one.
+
+import argparse
+import io
+import random
+import sys
+import timeit
+import traceback
+
+from sweeping_view.base import NO_LIMITS
+from sweeping_view.exceptions import SweepingViewException
+from sweeping_view.incremental import IncrementalParser
+from sweeping_view.mime_types import detect
+
+from .corpus import VARIANTS, generate
+
+MODES = ("full", "metadata_only", "event_table", "iter_events", "incremental")
+
+# for the linearity checks: corpus sizes, and how much random data to add
+SIZES = ("beginner", "intermediate", "expert", "custom")
+GARBAGE = (1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20)
+
+
+def random_bytes(rng, size):
+    return rng.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def mutate(data, rng):
+    data = bytearray(data)
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.randrange(5)
+        pos = rng.randrange(len(data) + 1)
+        if kind == 0 and pos < len(data):
+            data[pos] = rng.randrange(256)
+        elif kind == 1:
+            del data[pos:]
+        elif kind == 2:
+            data[pos:pos] = random_bytes(rng, rng.randint(1, 16))
+        elif kind == 3:
+            end = min(len(data), pos + rng.randint(1, 64))
+            data[pos:end] = bytes(end - pos)
+        else:
+            end = min(len(data), pos + rng.randint(1, 256))
+            data[end:end] = data[pos:end]
+    return bytes(data)
+
+
+def parse(cls, data, mode, limits=None):
+    if mode == "iter_events":
+        with cls.iter_events(data) as stream:
+            for _ in stream:
+                pass
+    elif mode == "incremental":
+        parser = IncrementalParser(cls, limits=limits)
+        for start in range(0, len(data), 4096):
+            parser.feed(data[start : start + 4096])
+        parser.close()
+    else:
+        kwargs = {} if mode == "full" else {mode: True}
+        cls.from_bytes(data, limits=limits, **kwargs)
+
+
+def fuzz(iterations, seed=0, variants=None, log=None):
+    # (variant, seed, mode, formatted exception) of everything unexpected
+    originals = {
+        variant: generate(variant, "beginner") for variant in variants or VARIANTS
+    }
+    classes = {variant: detect(io.BytesIO(data)) for variant, data in originals.items()}
+    findings = []
+    for iteration in range(iterations):
+        variant = sorted(originals)[iteration % len(originals)]
+        mutation_seed = seed * iterations + iteration
+        data = mutate(originals[variant], random.Random(mutation_seed))
+        for mode in MODES:
+            try:
+                parse(classes[variant], data, mode)
+            except SweepingViewException:
+                pass
+            except Exception:
+                finding = (variant, mutation_seed, mode, traceback.format_exc())
+                findings.append(finding)
+                if log is not None:
+                    log(finding)
+    return findings
+
+
+def inputs(variant, seed=0):
+    # (description, bytes) of growing size
+    for size in SIZES:
+        yield size, generate(variant, size, seed)
+    data = generate(variant, "beginner", seed)
+    rng = random.Random(seed)
+    for amount in GARBAGE:
+        garbage = random_bytes(rng, amount)
+        yield "+{} random".format(amount), data + garbage
+        # in the middle of the header, where the parsers search for markers
+        yield "{} random inside".format(amount), data[:64] + garbage + data[64:]
+
+
+def linearity(variant, repeat=3, seed=0, log=None):
+    # (description, bytes, seconds) of parsing each of inputs() without
+    # limits, and how much more time per byte the biggest input took than
+    # the smallest one
+    results = []
+    for description, data in inputs(variant, seed):
+        cls = detect(io.BytesIO(data[:4096]))
+
+        def run():
+            try:
+                parse(cls, data, "full", NO_LIMITS)
+            except SweepingViewException:
+                pass
+
+        seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+        result = (description, len(data), seconds)
+        results.append(result)
+        if log is not None:
+            log(variant, result)
+    smallest = min(results, key=lambda result: result[1])
+    biggest = max(results, key=lambda result: result[1])
+    ratio = (biggest[2] / biggest[1]) / (smallest[2] / smallest[1])
+    return results, ratio
+
+
+def print_finding(finding):
+    variant, seed, mode, formatted = finding
+    print("{} seed {} ({}):\n{}".format(variant, seed, mode, formatted), flush=True)
+
+
+def print_timing(variant, result):
+    description, size, seconds = result
+    print(
+        "{:>12} {:>22} {:>10} {:>10.2f} {:>10.2f}".format(
+            variant, description, size, seconds * 1000, seconds / size * 1e9
+        ),
+        flush=True,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzz the replay parsers.")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--variants",
+        type=lambda value: value.split(","),
+        help="comma separated, out of {}".format(",".join(VARIANTS)),
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=4.0,
+        help="allowed ratio of time per byte, biggest input to smallest",
+    )
+    args = parser.parse_args(argv)
+    variants = args.variants or list(VARIANTS)
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        parser.error("unknown variants: {}".format(", ".join(sorted(unknown))))
+
+    findings = fuzz(args.iterations, args.seed, variants, log=print_finding)
+    print(
+        "{} iterations, {} unexpected exceptions".format(args.iterations, len(findings))
+    )
+    print()
+
+    print(
+        "{:>12} {:>22} {:>10} {:>10} {:>10}".format(
+            "variant", "input", "bytes", "ms", "ns/byte"
+        )
+    )
+    nonlinear = []
+    for variant in variants:
+        _, ratio = linearity(variant, args.repeat, args.seed, log=print_timing)
+        if ratio > args.tolerance:
+            nonlinear.append((variant, ratio))
+    for variant, ratio in nonlinear:
+        print(
+            "{}: {:.1f}x more time per byte for the biggest input".format(
+                variant, ratio
+            )
+        )
+    return 1 if findings or nonlinear else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Import time benchmarks: how long a fresh interpreter takes to import each of
+# MODULES, and which of the package's modules (and setuptools_scm) that pulls
+# in. Short-lived workers pay this on every start.
+#
+#     python -m benchmarks.imports --output imports.json
+#     python -m benchmarks.imports --compare imports.json
+#
+# Every import is timed in its own interpreter, --repeat times, and the best
+# time is reported. With --compare, the exit status is 1 if any import got
+# slower by more than --tolerance.
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+MODULES = (
+    "sweeping_view",
+    "sweeping_view.mime_types",
+    "sweeping_view.rmv",
+    "sweeping_view.evf",
+    "sweeping_view.avf",
+    "sweeping_view.batch",
+)
+
+# runs in the child interpreter
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "modules": sorted(
+        name for name in sys.modules
+        if name.startswith("sweeping_view.") or name == "setuptools_scm"
+    ),
+}}))
+"""
+
+
+def time_import(module):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module)],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return json.loads(output.decode("utf-8"))
+
+
+def run(modules=MODULES, repeat=10, log=None):
+    results = []
+    for module in modules:
+        runs = [time_import(module) for _ in range(repeat)]
+        result = {
+            "module": module,
+            "seconds": min(run["seconds"] for run in runs),
+            "modules": runs[0]["modules"],
+        }
+        results.append(result)
+        if log is not None:
+            log(result)
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    # (module, seconds / baseline seconds) for everything in both, and
+    # whether anything got slower than the tolerance allows
+    old = {result["module"]: result["seconds"] for result in baseline["results"]}
+    ratios = [
+        (result["module"], result["seconds"] / old[result["module"]])
+        for result in results["results"]
+        if result["module"] in old
+    ]
+    return ratios, any(ratio > 1 + tolerance for _, ratio in ratios)
+
+
+def print_result(result):
+    print(
+        "{module:>26} {ms:>8.2f}  {modules}".format(
+            module=result["module"],
+            ms=result["seconds"] * 1000,
+            modules=" ".join(result["modules"]) or "-",
+        ),
+        flush=True,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark import times.")
+    parser.add_argument(
+        "--modules",
+        type=lambda value: value.split(","),
+        default=MODULES,
+        help="comma separated (default: {})".format(",".join(MODULES)),
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    print("{:>26} {:>8}  {}".format("module", "ms", "imports"))
+    results = run(args.modules, args.repeat, log=print_result)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        ratios, regressed = compare(results, baseline, args.tolerance)
+        print()
+        for module, ratio in ratios:
+            print(
+                "{:>26} {:>7.2f}x{}".format(
+                    module, ratio, "  SLOWER" if ratio > 1 + args.tolerance else ""
+                )
+            )
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+# Parser benchmarks on a synthetic corpus (see corpus.py).
+#
+#     python -m benchmarks.run --output results.json
+#     python -m benchmarks.run --sizes beginner,expert --compare results.json
+#
+# For every replay and parse mode, this reports the best of --repeat timings
+# as files/s, MB/s and events/s, and the peak memory allocated by Python
+# while parsing (measured separately with tracemalloc, since that slows
+# parsing down). Memory mapped file contents don't count towards the peak.
+#
+# With --compare, the timings are compared to an earlier results file, and
+# the exit status is 1 if anything got slower by more than --tolerance.
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from sweeping_view import __version__
+from sweeping_view.mime_types import detect
+
+from .corpus import SIZES, VARIANTS, write_corpus
+
+MODES = {
+    "events": {},
+    "event_table": {"event_table": True},
+    "metadata_only": {"metadata_only": True},
+}
+
+
+def peak_memory(parse):
+    tracemalloc.start()
+    try:
+        parse()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(path, mode, repeat=5):
+    cls = detect(path)
+    kwargs = MODES[mode]
+
+    def parse():
+        return cls.from_file(path, **kwargs)
+
+    replay = parse()
+    num_events = len(cls.from_file(path).events)
+    timer = timeit.Timer(parse)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+    size = os.path.getsize(path)
+    return {
+        "file": os.path.basename(path),
+        "parser": cls.__name__,
+        "mode": mode,
+        "bytes": size,
+        "events": num_events,
+        "seconds": seconds,
+        "files_per_s": 1 / seconds,
+        "mb_per_s": size / seconds / 1e6,
+        # metadata_only parses skip the events
+        "events_per_s": None if replay.events is None else num_events / seconds,
+        "peak_memory": peak_memory(parse),
+    }
+
+
+def run(corpus, variants=None, sizes=None, modes=None, repeat=5, seed=0, log=None):
+    results = []
+    for variant, size, path in write_corpus(corpus, variants, sizes, seed):
+        for mode in modes or MODES:
+            result = benchmark(path, mode, repeat)
+            result["variant"] = variant
+            result["size"] = size
+            results.append(result)
+            if log is not None:
+                log(result)
+    return {
+        "sweeping_view": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    # (variant, size, mode, seconds / baseline seconds) for everything in
+    # both, and whether anything got slower than the tolerance allows
+    old = {
+        (result["variant"], result["size"], result["mode"]): result["seconds"]
+        for result in baseline["results"]
+    }
+    ratios = []
+    for result in results["results"]:
+        key = (result["variant"], result["size"], result["mode"])
+        if key in old:
+            ratios.append(key + (result["seconds"] / old[key],))
+    return ratios, any(ratio > 1 + tolerance for *_, ratio in ratios)
+
+
+def print_result(result):
+    events_per_s = result["events_per_s"]
+    print(
+        "{variant:>12} {size:>12} {mode:>13} {files:>10.1f} {mb:>8.1f} {events:>10} "
+        "{memory:>9.2f}".format(
+            variant=result["variant"],
+            size=result["size"],
+            mode=result["mode"],
+            files=result["files_per_s"],
+            mb=result["mb_per_s"],
+            events="-" if events_per_s is None else "{:.0f}".format(events_per_s),
+            memory=result["peak_memory"] / 1e6,
+        ),
+        flush=True,
+    )
+
+
+def parse_list(value):
+    return value.split(",")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the replay parsers.")
+    parser.add_argument(
+        "--corpus",
+        help="directory for the generated replays, reused between runs "
+        "(default: a temporary directory)",
+    )
+    parser.add_argument(
+        "--variants",
+        type=parse_list,
+        help="comma separated, out of {}".format(",".join(VARIANTS)),
+    )
+    parser.add_argument(
+        "--sizes",
+        type=parse_list,
+        help="comma separated, out of {}".format(",".join(SIZES)),
+    )
+    parser.add_argument(
+        "--modes",
+        type=parse_list,
+        help="comma separated, out of {}".format(",".join(MODES)),
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    for option, known in (
+        ("variants", VARIANTS),
+        ("sizes", SIZES),
+        ("modes", MODES),
+    ):
+        unknown = set(getattr(args, option) or ()) - set(known)
+        if unknown:
+            parser.error("unknown {}: {}".format(option, ", ".join(sorted(unknown))))
+
+    print(
+        "{:>12} {:>12} {:>13} {:>10} {:>8} {:>10} {:>9}".format(
+            "variant", "size", "mode", "files/s", "MB/s", "events/s", "peak MB"
+        )
+    )
+    kwargs = dict(
+        variants=args.variants,
+        sizes=args.sizes,
+        modes=args.modes,
+        repeat=args.repeat,
+        seed=args.seed,
+        log=print_result,
+    )
+    if args.corpus:
+        results = run(args.corpus, **kwargs)
+    else:
+        with tempfile.TemporaryDirectory() as corpus:
+            results = run(corpus, **kwargs)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        ratios, regressed = compare(results, baseline, args.tolerance)
+        print()
+        print("compared to sweeping_view {}:".format(baseline["sweeping_view"]))
+        for variant, size, mode, ratio in ratios:
+            print(
+                "{:>12} {:>12} {:>13} {:>7.2f}x{}".format(
+                    variant,
+                    size,
+                    mode,
+                    ratio,
+                    "  SLOWER" if ratio > 1 + args.tolerance else "",
+                )
+            )
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
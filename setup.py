@@ -14,6 +14,11 @@ setup(
     author_email="thomaskolar90@gmail.com",
     url="https://github.com/ralokt/sweeping-view/",
     packages=["sweeping_view"],
+    entry_points={
+        "console_scripts": [
+            "sweeping-view=sweeping_view.cli:main",
+        ],
+    },
     platforms=["all"],
     classifiers=[
         "Development Status :: 3 - Alpha",
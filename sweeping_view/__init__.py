@@ -1,6 +1,26 @@
-try:
-    from ._version import version as __version__
-except ImportError:
-    from setuptools_scm import get_version
+import sys
 
-    __version__ = get_version(root="..", relative_to=__file__)
+
+def _get_version():
+    try:
+        from ._version import version
+    except ImportError:
+        from setuptools_scm import get_version
+
+        version = get_version(root="..", relative_to=__file__)
+    return version
+
+
+def __getattr__(name):
+    # __version__ is only looked up when it's used: without _version.py,
+    # that means running setuptools_scm, which is slow
+    if name == "__version__":
+        global __version__
+        __version__ = _get_version()
+        return __version__
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__ (PEP 562)
+    __version__ = _get_version()
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
-
-from io import SEEK_CUR
-from itertools import count
+from operator import length_hint
+from struct import Struct
 
 from .base import BaseReplay
-from .exceptions import InvalidReplayError
+from .board import MineList
+from .exceptions import InvalidReplayError, TruncatedReplayError
+from .reader import UINT16
+
+# event record: mouse event type, x (high byte), seconds + 1 (low byte),
+# x (low byte), hundredths, y (high byte), seconds + 1 (high byte), y (low byte)
+RECORD = Struct("8B")
 
 
 class AVFReplay(BaseReplay):
@@ -30,15 +35,62 @@ class AVFReplay(BaseReplay):
         6: "custom",
     }
 
-    def process_buffer(self, data):
+    CELL_BASE = 1
+
+    # the timestamp block starts shortly after the mines
+    SNIFF_TIMESTAMP_DISTANCE = 64
+
+    @classmethod
+    def sniff_board(cls, header):
+        # (rows, cols, number of mines, offset of the mines) or None
+        if len(header) < 6:
+            return None
+        level = header[5]
+        if level == 3:
+            return 8, 8, 10, 6
+        if level == 4:
+            return 16, 16, 40, 6
+        if level == 5:
+            return 16, 30, 99, 6
+        if level == 6 and len(header) >= 10:
+            return header[7] + 1, header[6] + 1, UINT16.unpack_from(header, 8)[0], 10
+        return None
+
+    @classmethod
+    def sniff_size(cls, header):
+        board = cls.sniff_board(header)
+        if board is None:
+            return cls.SNIFF_SIZE
+        _, _, num_mines, offset = board
+        return max(
+            cls.SNIFF_SIZE, offset + 2 * num_mines + cls.SNIFF_TIMESTAMP_DISTANCE
+        )
+
+    @classmethod
+    def sniff(cls, header):
+        board = cls.sniff_board(header)
+        if board is None:
+            return False
+        rows, cols, num_mines, offset = board
+        end = offset + 2 * num_mines
+        mines = header[offset:end]
+        if len(mines) < 2 * num_mines:
+            return False
+        # mine coordinates start at 1
+        if not all(1 <= coord <= max(rows, cols) for coord in mines):
+            return False
+        bracket = header.find(b"[", end, end + cls.SNIFF_TIMESTAMP_DISTANCE)
+        return bracket >= 0 and header.find(b"|", bracket, bracket + 16) >= 0
+
+    def process_header(self, data):
         self.properties = {}
         # version
-        self.version = ord(data.read(1))
+        self.version = data.uint8()
         self.is_freesweeper = not self.version
 
         # no idea what these bytes do
-        data.read(4)
-        level = ord(data.read(1))
+        data.skip(4)
+        level = data.uint8()
         try:
             self.properties["level"] = self.LEVELS[level]
         except KeyError:
@@ -57,36 +109,31 @@ class AVFReplay(BaseReplay):
             self.rows = 16
             self.num_mines = 99
         elif level == 6:
-            self.cols = ord(data.read(1)) + 1
-            self.rows = ord(data.read(1)) + 1
-            self.num_mines = self.read_int(data.read(2))
-
-        self.mines = []
-        for ii in range(self.num_mines):
-            row = ord(data.read(1))
-            col = ord(data.read(1))
-            self.mines.append((row, col))
+            self.cols = data.uint8() + 1
+            self.rows = data.uint8() + 1
+            self.num_mines = data.uint16()
 
-        while data.read(1) != b"[":
-            pass
+        # (row, col) byte pairs
+        self.mark("board", data)
+        mines = data.read(2 * self.num_mines)
+        self.mines = MineList(self.rows, self.cols, bytes(mines), base=1, replay=self)
 
-        data.seek(-3, SEEK_CUR)
-        self.properties["questionmarks"] = ord(data.read(1)) == 17
+        self.mark("properties", data)
+        bracket = data.search(b"[", "timestamp block")
+        if bracket < 2:
+            raise data.truncated("timestamp block")
+        data.seek(bracket - 2)
+        self.properties["questionmarks"] = data.uint8() == 17
 
         # read past opening "["
-        data.read(2)
-
-        info = b""
-        while True:
-            char = data.read(1)
-            if char == b"]":
-                break
-            info += char
+        data.skip(2)
+
+        info = data.read_until(b"]", "timestamp block")
         # TODO: make sure this is always correct/add encoding param
         # TODO: split this info into bits and make usable
-        self.ts_info = info.decode("cp1252")
+        self.ts_info = bytes(info).decode("cp1252")
         ts_fields = self.ts_info.split("|")
-        self.bbbv = ts_fields[-1][1:].split("T")[0]
+        self.bbbv = int(ts_fields[-1][1:].split("T")[0])
         # cus [<mode>|<custom_data>|<timestamp>]
         # beg/int/exp [<mode>|<timestamp>]
         ts_boardgen = ts_fields[2 if level == 6 else 1]
@@ -111,52 +158,137 @@ class AVFReplay(BaseReplay):
         microseconds = int(milliseconds_str[-3:]) * 1000
         self.boardgen_time = datetime(year, month, day, *time_parts[:3], microseconds)
 
-        last = ord(data.read(1))
-        while True:
-            cur = ord(data.read(1))
-            if last == 0 and cur == 1:
-                break
-            last = cur
-        data.seek(-3, SEEK_CUR)
-
-        self.events = []
-        while True:
-            mouse, x1, s2, x2, hun, y1, s1, y2 = tuple(data.read(8))
-            xpos = (x1 << 8) + x2
-            ypos = (y1 << 8) + y2
-            sec = (s1 << 8) + s2 - 1
-            gametime = 1000 * sec + 10 * hun
-            self.events.append(
-                {
-                    "type": "mouse",
-                    "subtype": self.MOUSE_EVENT_TYPES[mouse],
-                    "gametime": gametime,
-                    "xpos": xpos,
-                    "ypos": ypos,
-                }
-            )
-            if sec < 0:
-                break
-
-        last2, last1 = data.read(2)
-        ref = tuple(b"cs=")
-        while True:
-            cur = ord(data.read(1))
-            if cur == b"":
-                raise InvalidReplayError(self)
-            if (last2, last1, cur) == ref:
-                break
-            last2, last1 = last1, cur
+        # the first event happens in second 0, stored as 1 (see
+        # decode_events), and its x coordinate is < 256
+        start = data.search(b"\0\1", "events")
+        self.events_offset = start - 1
+        data.seek(self.events_offset)
+
+    def process_body(self, data):
+        if self.metadata_only:
+            self.events = None
+            num_events, self.timeth = self.skip_events(data)
+            self.mark("footer", data)
+            thousandths = self.read_trailer(data, num_events)
+            if thousandths:
+                self.timeth += thousandths[-2] & 0xF
+            self.read_footer(data.read_rest())
+        else:
+            self.events = self.new_events()
+            self.decode_all(data, self.events)
+            self.mark("footer", data)
+            self.finish_events(data)
+
+    def finish_events(self, data):
+        # decode_events already set timeth
+        self.read_trailer(data, len(self.events))
+        self.read_footer(data.read_rest())
+
+    def event_record(self, buf, pos):
+        # freesweeper's events can't be decoded before the thousandths of
+        # seconds that follow them
         if self.is_freesweeper:
-            for event in self.events:
-                ths = ord(data.read(1)) & 0xF
-                event["gametime"] += ths
-        data.read(17)
+            return None
+        if pos + 8 > len(buf):
+            return 8, False
+        # the last record has a negative second count
+        return 8, buf[pos + 2] == 0 and buf[pos + 6] == 0
+
+    def decode_events(self, data, events, state=None):
+        start = data.tell()
+        # freesweeper stores the thousandths of seconds after the events
+        thousandths = None
+        if self.is_freesweeper:
+            num_events, _ = self.skip_events(data)
+            thousandths = self.read_trailer(data, num_events)
+            data.seek(start)
+        # every complete record up to the end of data, the last one is
+        # searched for while they are decoded
+        records = data.view((data.size - start) // 8 * 8)
+        unpacked = RECORD.iter_unpack(records)
+        if thousandths is not None:
+            thousandths = iter(thousandths)
+        mouse_event_types = self.MOUSE_EVENT_TYPES
+        add_mouse = events.add_mouse
+        if state is None:
+            state = {}
+        # the game time of the last event so far
+        timeth = state.get("timeth")
+        try:
+            for mouse, x1, s2, x2, hun, y1, s1, y2 in unpacked:
+                sec = (s1 << 8) + s2 - 1
+                gametime = 1000 * sec + 10 * hun
+                if thousandths is not None:
+                    gametime += next(thousandths) & 0xF
+                try:
+                    subtype = mouse_event_types[mouse]
+                except KeyError:
+                    raise InvalidReplayError(
+                        self, message="Unknown mouse event {}".format(mouse)
+                    )
+                if sec < 0:
+                    yield add_mouse(subtype, gametime, (x1 << 8) + x2, (y1 << 8) + y2)
+                    break
+                timeth = gametime
+                yield add_mouse(subtype, gametime, (x1 << 8) + x2, (y1 << 8) + y2)
+            else:
+                raise data.truncated("events")
+        finally:
+            # right after the last record unpacked
+            end = start + len(records) - 8 * length_hint(unpacked)
+            # which holds on to records
+            del unpacked
+            records.release()
+            state["timeth"] = timeth
+        if timeth is None:
+            raise InvalidReplayError(self, message="No events!")
+        # the last event has -1 seconds to signal the end of the events
+        # section, the game time is that of the one before it
+        self.timeth = timeth
+        data.seek(end)
+
+    def skip_events(self, data):
+        # walks the event records without decoding them, returns the number of
+        # events and the game time of the second to last one
+        buf = data.data
+        pos = data.tell()
+        # the last record has a negative second count
+        while buf[pos + 2 : pos + 3] != b"\0" or buf[pos + 6 : pos + 7] != b"\0":
+            pos += 8
+            if pos + 8 > data.size:
+                raise data.truncated("events")
+        if pos + 8 > data.size:
+            raise data.truncated("events")
+        num_events = (pos - data.tell()) // 8 + 1
+        if num_events < 2:
+            raise InvalidReplayError(self, message="No events!")
+        _, _, s2, _, hun, _, s1, _ = RECORD.unpack_from(buf, pos - 8)
+        data.seek(pos + 8)
+        return num_events, 1000 * ((s1 << 8) + s2 - 1) + 10 * hun
+
+    def read_trailer(self, data, num_events):
+        # everything after the events up to the footer: the checksum (the
+        # 17 bytes after "cs=", None if there is none), and for freesweeper
+        # the thousandths of seconds (one byte per event) before it, which
+        # are returned
+        try:
+            cs = data.search(b"cs=", "checksum")
+        except TruncatedReplayError:
+            # the footer starts after the line the events end on
+            self.checksum = None
+            data.read_until(b"\r", "footer")
+            return None
+        data.seek(cs + 3)
+        thousandths = None
         if self.is_freesweeper:
-            while ord(data.read(1)) != 13:
-                pass
-        footer = data.read()
-        footer_fields = footer.split(b"\r")
+            thousandths = data.read(num_events)
+        self.checksum = bytes(data.read(17))
+        if self.is_freesweeper:
+            data.read_until(b"\r", "footer")
+        return thousandths
+
+    def read_footer(self, footer):
+        footer_fields = bytes(footer).split(b"\r")
         footer_meta_info = {}
         footer_positional = []
         for field in footer_fields:
@@ -168,17 +300,14 @@ class AVFReplay(BaseReplay):
             else:
                 # TODO: make sure this is always correct/add encoding param
                 footer_positional.append(key.decode("cp1252"))
-        # the last event will have -1 to signal the end of the events
-        # section => extract game time from the second to last event
-        self.timeth = self.events[-2]["gametime"]
         self.name, self.version_info = footer_positional
 
     def get_best_token_source(self):
         return self.name
 
+    def get_player_name(self):
+        # read_footer replaces the file name with the player's
+        return self.name
+
     def get_boardgen_time(self):
         return self.boardgen_time
-
-
-if __name__ == "__main__":
-    main()
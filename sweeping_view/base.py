@@ -1,27 +1,396 @@
 # -*- coding: utf-8 -*-
 
-from io import BytesIO
+from array import array
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from itertools import islice
+from os import PathLike
+
+from .board import Bitboard, MineList
+from .events import COLUMNS, EventDicts, EventList, EventTable, cell_column
+from .exceptions import InvalidReplayError, LimitExceededError
+from .reader import BufferReader, map_file, mapped_file, try_map
+
+# Limits on the files that are parsed, so that hostile or broken ones fail
+# fast with a LimitExceededError instead of using up time and memory. None is
+# no limit.
+#
+#   max_file_size: in bytes
+#   max_events: stored events - streamed ones (see iter_events) aren't limited
+#   max_scan_distance: how far parsers search for markers, like the start of
+#       AVF's timestamp block or strings' null terminators
+Limits = namedtuple("Limits", ("max_file_size", "max_events", "max_scan_distance"))
+
+# far beyond anything real: a replay of an hour-long game has about a million
+# events, and some ten MB
+DEFAULT_LIMITS = Limits(
+    max_file_size=256 << 20, max_events=10**7, max_scan_distance=64 << 10
+)
+NO_LIMITS = Limits(None, None, None)
+
+_END = object()
+
+
+def consume(iterator):
+    deque(iterator, maxlen=0)
 
 
 class BaseReplay:
-    def __init__(self, data_buffer, name=None):
+    def __init__(
+        self,
+        data_buffer,
+        name=None,
+        metadata_only=False,
+        event_table=False,
+        limits=None,
+        instrument=None,
+    ):
+        self.setup(name, metadata_only, event_table, limits)
+        # see instrumentation.Collector
+        if instrument is None:
+            instrument = self.INSTRUMENT
+        if instrument is not None:
+            self.profile = instrument.start(self)
+        self.process_buffer(self.make_reader(data_buffer))
+
+    def setup(self, name=None, metadata_only=False, event_table=False, limits=None):
         self.name = name
-        self.process_buffer(data_buffer)
+        # where the replay came from. AVFReplay replaces name with the
+        # player's name, this keeps it.
+        self.source_name = name
+        # if set, parsers only read the header, board and whatever is needed
+        # to find timeth and the checksum, and leave self.events as None
+        self.metadata_only = metadata_only
+        # if set, self.events is an EventTable instead of a list of dicts
+        self.event_table = event_table
+        self.limits = self.LIMITS if limits is None else limits
+        # the instrumentation.ParseProfile of this parse, if it is timed
+        self.profile = None
+
+    def make_reader(self, data_buffer):
+        # data_buffer can be a binary file object, bytes-like, or a
+        # BufferReader that is already positioned at the start of the replay
+        if isinstance(data_buffer, BufferReader):
+            data_buffer.replay = self
+            data = data_buffer
+        else:
+            if hasattr(data_buffer, "read"):
+                max_file_size = self.limits.max_file_size
+                # one more byte than allowed is enough to know it's too much
+                data_buffer = data_buffer.read(
+                    -1 if max_file_size is None else max_file_size + 1
+                )
+            data = BufferReader(data_buffer, self)
+        self.check_size(data.size)
+        data.max_scan = self.limits.max_scan_distance
+        return data
+
+    def check_size(self, size):
+        max_file_size = self.limits.max_file_size
+        if max_file_size is not None and size > max_file_size:
+            raise LimitExceededError(
+                self, "more than the limit of {} bytes".format(max_file_size)
+            )
+
+    def check_events(self, count):
+        max_events = self.limits.max_events
+        if max_events is not None and count > max_events:
+            raise LimitExceededError(
+                self, "more than the limit of {} events".format(max_events)
+            )
+
+    def decode_all(self, data, events):
+        # decodes all events into events, or as many as limits.max_events
+        # allows before raising
+        decoder = self.decode_events(data, events)
+        max_events = self.limits.max_events
+        if max_events is None:
+            consume(decoder)
+            return
+        consume(islice(decoder, max_events))
+        if next(decoder, _END) is not _END:
+            decoder.close()
+            self.check_events(max_events + 1)
 
     def process_buffer(self, data):
+        # data is a BufferReader
+        profile = self.profile
+        if profile is not None:
+            profile.start(data.tell())
+        try:
+            with self.invalid_data():
+                self.process_header(data)
+                self.mark("events", data)
+                self.process_body(data)
+        except Exception as exc:
+            if profile is not None:
+                profile.finish(data.tell(), error=exc)
+            raise
+        if profile is not None:
+            profile.finish(data.tell(), self.events)
+
+    def mark(self, section, data):
+        # parsers call this when data reaches the start of a section (see
+        # instrumentation.SECTIONS), for timing them
+        if self.profile is not None:
+            self.profile.mark(section, data.tell())
+
+    @contextmanager
+    def invalid_data(self):
+        # fields that can't be decoded (numbers that aren't, text in the
+        # wrong encoding, missing keys) make the replay invalid, rather than
+        # raising whatever decoding them raised
+        try:
+            yield
+        except (ValueError, KeyError, IndexError) as exc:
+            raise InvalidReplayError(
+                self, "{}: {}".format(type(exc).__name__, exc)
+            ) from exc
+
+    def process_header(self, data):
+        # everything up to the events, which start at self.events_offset -
+        # data is left positioned there
+        raise NotImplementedError
+
+    def process_body(self, data):
+        # the events (unless metadata_only) and everything after them
+        raise NotImplementedError
+
+    def finish_events(self, data):
+        # everything after the events, with data positioned right after them
+        pass
+
+    def decode_events(self, data, events, state=None):
+        # a generator that decodes the events from data (positioned at
+        # self.events_offset) into events, yielding after each one, and
+        # leaves data right after them. Decoders that are closed early
+        # leave whatever the next one needs to carry on in the state dict,
+        # so that one passed the same state can resume where it stopped
+        # (see incremental.py).
         raise NotImplementedError
 
+    def event_record(self, buf, pos):
+        # (size, whether it's the last one) of the event record starting at
+        # pos, for decoding events as they arrive (see incremental.py), or
+        # None if the events can't be decoded before the whole file is there
+        return None
+
+    # index of the first row/column in self.mines
+    CELL_BASE = 0
+
+    # the Limits used unless others are passed
+    LIMITS = DEFAULT_LIMITS
+
+    # the instrumentation.Collector used unless another one is passed
+    INSTRUMENT = None
+
+    # how many bytes from the start of a file sniff() needs to look at
+    SNIFF_SIZE = 512
+
+    # from_stream parses replays at least this big in an executor
+    STREAM_EXECUTOR_THRESHOLD = 256 << 10
+
+    @classmethod
+    def sniff(cls, header):
+        # quick check whether header (the first sniff_size() bytes of a file,
+        # or less if the file is shorter) could be a replay in this format
+        raise NotImplementedError
+
+    @classmethod
+    def sniff_size(cls, header):
+        return cls.SNIFF_SIZE
+
+    @property
+    def board(self):
+        # the mines as a board.Bitboard, with 0-based cells
+        if isinstance(self.mines, MineList):
+            return self.mines.board
+        return Bitboard.from_cells(
+            self.rows, self.cols, self.mines, self.CELL_BASE, replay=self
+        )
+
+    def get_cell_size(self):
+        # the size of a cell in the coordinates of mouse events
+        return 16
+
+    def cell_column(self):
+        # the cell of each event, see events.cell_column
+        if self.events is None:
+            raise ValueError("{} has no events".format(self))
+        return cell_column(self.events, self.rows, self.cols, self.get_cell_size())
+
+    def new_events(self):
+        return EventTable() if self.event_table else EventList()
+
+    def pack(self):
+        # The replay as (state, columns), which is small and quick to pickle:
+        # its attributes without the events, and the columns of its events
+        # as bytes (None without events). unpack() makes it again, with the
+        # same kind of events.
+        state = dict(vars(self))
+        events = state.pop("events", None)
+        if events is not None:
+            events = {
+                name: column.tobytes()
+                for name, column in EventTable.from_events(events).columns().items()
+            }
+        return state, events
+
+    @classmethod
+    def unpack(cls, state, events):
+        replay = cls.__new__(cls)
+        vars(replay).update(state)
+        if events is not None:
+            columns = {}
+            for name, typecode, _ in COLUMNS:
+                columns[name] = array(typecode)
+                columns[name].frombytes(events[name])
+            events = EventTable.from_columns(columns)
+            if not replay.event_table:
+                events = EventList(events)
+        replay.events = events
+        return replay
+
     def __str__(self):
-        return "{}({})".format(type(self).__name__, self.name)
+        return "{}({})".format(type(self).__name__, self.source_name)
+
+    @classmethod
+    def from_file(cls, filename, use_mmap=True, cache=None, **kwargs):
+        # the file is memory mapped while it's parsed, unless use_mmap is
+        # False. cache is an optional sweeping_view.cache.ReplayCache
+        with mapped_file(filename, use_mmap) as data:
+            if cache is not None:
+                return cache.parse(cls, data, name=filename, **kwargs)
+            return cls(data, name=filename, **kwargs)
+
+    @classmethod
+    def from_bytes(cls, data, name=None, cache=None, **kwargs):
+        if cache is not None:
+            return cache.parse(cls, data, name=name, **kwargs)
+        return cls(data, name=name, **kwargs)
+
+    @classmethod
+    async def from_stream(
+        cls,
+        reader,
+        name=None,
+        executor=None,
+        threshold=None,
+        chunk_size=64 << 10,
+        cache=None,
+        **kwargs
+    ):
+        # Reads a replay from an asyncio.StreamReader (or anything else with
+        # a coroutine read(n)) until EOF, and parses it as it arrives (see
+        # incremental.py). The first threshold bytes (default
+        # STREAM_EXECUTOR_THRESHOLD) are parsed right away, anything after
+        # them - chunk by chunk, and whatever can only be parsed once the
+        # stream ended - in executor (default: the loop's), so that big
+        # replays don't block the event loop.
+        #
+        # With a cache, metadata_only or instrument, the replay is parsed
+        # once it is complete instead, in executor if it has at least
+        # threshold bytes.
+        #
+        # The start of the stream is sniffed as soon as it arrives, so that
+        # anything that isn't a replay in this format is rejected with an
+        # InvalidReplayError without reading the rest.
+        import asyncio
+
+        from .incremental import IncrementalParser
+
+        if threshold is None:
+            threshold = cls.STREAM_EXECUTOR_THRESHOLD
+        loop = asyncio.get_event_loop()
+        limits = kwargs.get("limits") or cls.LIMITS
+        incremental = cache is None and not any(
+            value
+            for option, value in kwargs.items()
+            if option not in ("event_table", "limits")
+        )
+        if incremental:
+            parser = IncrementalParser(
+                cls, name, kwargs.get("event_table", False), limits
+            )
+            take = parser.feed
+        else:
+            data = bytearray()
+            take = data.extend
+
+        async def give(chunk):
+            if incremental and size >= threshold:
+                await loop.run_in_executor(executor, take, chunk)
+            else:
+                take(chunk)
+
+        # the start of the stream, until it is sniffed
+        header = bytearray()
+        size = 0
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if limits.max_file_size is not None and size > limits.max_file_size:
+                # stops reading right away
+                raise LimitExceededError(
+                    name, "more than the limit of {} bytes".format(limits.max_file_size)
+                )
+            if header is not None:
+                header += chunk
+                if len(header) < cls.sniff_size(header):
+                    continue
+                cls.check_sniff(header, name)
+                chunk = bytes(header)
+                header = None
+            await give(chunk)
+        if header is not None:
+            cls.check_sniff(header, name)
+            await give(bytes(header))
+
+        if incremental:
+
+            def parse():
+                parser.close()
+                return parser.replay
+
+        else:
+            data = bytes(data)
+
+            def parse():
+                return cls.from_bytes(data, name=name, cache=cache, **kwargs)
+
+        if size < threshold:
+            return parse()
+        return await loop.run_in_executor(executor, parse)
+
+    @classmethod
+    def check_sniff(cls, header, name):
+        if not cls.sniff(bytes(header[: cls.sniff_size(header)])):
+            raise InvalidReplayError(
+                name, message="not a {} replay".format(cls.__name__)
+            )
 
     @classmethod
-    def from_file(cls, filename):
-        with open(filename, "rb") as file:
-            return cls(file, name=filename)
+    def iter_events(cls, source, name=None, chunk_size=64 << 10):
+        return EventStream(cls, source, name=name, chunk_size=chunk_size)
 
     @classmethod
-    def from_bytes(cls, data, name=None):
-        return cls(BytesIO(data), name=name)
+    def encode(cls, replay):
+        # encodes replay, which may be in another format, in this class's
+        # format and returns the bytes
+        raise NotImplementedError
+
+    def to_bytes(self):
+        return self.encode(self)
+
+    def to_file(self, filename):
+        with open(filename, "wb") as file:
+            file.write(self.to_bytes())
+
+    def stream_events(self, data):
+        # data needs to be positioned at self.events_offset
+        return self.decode_events(data, EventDicts())
 
     @staticmethod
     def read_int(binstr):
@@ -30,3 +399,92 @@ class BaseReplay:
             res <<= 8
             res += char
         return res
+
+
+class EventStream:
+    # Parses the header of a replay right away, and then yields its events one
+    # by one, without keeping them around. The parsed header (with events set
+    # to None) is available as .replay
+    #
+    # source can be a filename, bytes or a binary file object. Files are
+    # memory mapped until all events are read, or until close() is called.
+    # File objects that can't be mapped (pipes, sockets, file-likes without
+    # fileno()) are read chunk_size bytes at a time with an
+    # IncrementalParser, and their events yielded as they arrive - what
+    # follows the events (like timeth) is only set on .replay once they are
+    # all read.
+
+    def __init__(self, cls, source, name=None, chunk_size=64 << 10):
+        self.file = None
+        self.mapped = None
+        self.events = None
+        try:
+            if isinstance(source, (str, PathLike)):
+                if name is None:
+                    name = source
+                self.file = open(source, "rb")
+                source = self.mapped = map_file(self.file)
+            elif hasattr(source, "read"):
+                self.mapped = try_map(source)
+                if self.mapped is None:
+                    self.events = self.read_chunks(cls, source, name, chunk_size)
+                    # parses the header
+                    next(self.events)
+                    return
+                source = self.mapped
+            data = BufferReader(source)
+            self.replay = cls(data, name=name, metadata_only=True)
+            data.seek(self.replay.events_offset)
+            self.events = self.replay.stream_events(data)
+        except BaseException:
+            self.close()
+            raise
+
+    def read_chunks(self, cls, file, name, chunk_size):
+        # yields once the header is parsed (and .replay set), then the events
+        from .incremental import IncrementalParser
+
+        parser = IncrementalParser(cls, name, keep_events=False)
+        events = []
+        while parser.replay is None:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                events = parser.close()
+                break
+            events = parser.feed(chunk)
+        self.replay = parser.replay
+        yield
+        for event in events:
+            yield event
+        while not parser.closed:
+            chunk = file.read(chunk_size)
+            for event in parser.feed(chunk) if chunk else parser.close():
+                yield event
+        self.replay.events = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.events)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.events is not None:
+            # releases any views the generator holds on the mapped file
+            self.events.close()
+        if hasattr(self.mapped, "close"):
+            self.mapped.close()
+        self.mapped = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
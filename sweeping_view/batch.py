@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque, namedtuple
+from itertools import islice
+import os
+
+from .exceptions import UnknownMimeType
+from .mime_types import detect, get_class_for_filename
+
+# error is None if the replay was parsed, replay is None if it wasn't
+ParseResult = namedtuple("ParseResult", ("path", "replay", "error"))
+
+# chunks queued per worker - enough to keep them busy without reading all
+# paths up front
+CHUNKS_PER_WORKER = 4
+
+
+def detect_class(path):
+    # by content first, since extensions are often missing or wrong
+    try:
+        return detect(path)
+    except UnknownMimeType:
+        return get_class_for_filename(path)
+
+
+def parse_file(path, cls=None, metadata_only=False, event_table=True):
+    # parses one file, returning any error instead of raising it
+    try:
+        if cls is None:
+            cls = detect_class(path)
+        replay = cls.from_file(
+            path, metadata_only=metadata_only, event_table=event_table
+        )
+    except Exception as exc:
+        return ParseResult(path, None, exc)
+    return ParseResult(path, replay, None)
+
+
+def _pack(path, cls, metadata_only, event_table):
+    # parse_file in a worker, with what is sent back kept small - see
+    # BaseReplay.pack
+    result = parse_file(path, cls, metadata_only, event_table)
+    replay = result.replay
+    if replay is None:
+        return result
+    return (path, type(replay)) + replay.pack()
+
+
+def _unpack(packed):
+    # the ParseResult _pack was made from
+    if isinstance(packed, ParseResult):
+        return packed
+    path, cls, state, events = packed
+    return ParseResult(path, cls.unpack(state, events), None)
+
+
+def scan(root, extensions=None):
+    # (path, os.stat_result) of every file below root (or root itself, if it
+    # isn't a directory) with one of the extensions - or any, if extensions
+    # is None - without following symlinks. Directories that can't be read
+    # are skipped.
+    if not os.path.isdir(root):
+        yield root, os.stat(root)
+        return
+    directories = [root]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif (
+                    extensions is None
+                    or os.path.splitext(entry.name)[1].lower() in extensions
+                ):
+                    try:
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                    except OSError:
+                        pass
+
+
+def _run_chunk(function, paths, args):
+    return [function(path, *args) for path in paths]
+
+
+def _chunks(paths, chunksize):
+    paths = iter(paths)
+    while True:
+        chunk = list(islice(paths, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_many(
+    paths,
+    workers=None,
+    chunksize=16,
+    metadata_only=False,
+    ordered=True,
+    cls=None,
+    event_table=True,
+):
+    # Parses many replays in a process pool, and yields a ParseResult for
+    # each path - in the order of paths if ordered is set, otherwise as soon
+    # as they are done.
+    #
+    # The class is detected from the file's content (falling back to its
+    # extension) unless cls is given. Parse errors are returned as
+    # ParseResult.error instead of being raised. Events are returned as
+    # EventTables by default, since those are a lot cheaper to send back from
+    # the workers than lists of dicts.
+    #
+    # paths can be any iterable, it is consumed lazily. workers defaults to
+    # the number of CPUs, and workers=1 parses in this process.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for path in paths:
+            yield parse_file(path, cls, metadata_only, event_table)
+        return
+    for packed in map_files(
+        _pack,
+        paths,
+        (cls, metadata_only, event_table),
+        workers=workers,
+        chunksize=chunksize,
+        ordered=ordered,
+    ):
+        yield _unpack(packed)
+
+
+def map_files(function, paths, args=(), workers=None, chunksize=16, ordered=True):
+    # Yields function(path, *args) for each path, computed in a process pool
+    # like parse_many does it. function needs to be picklable (defined at
+    # module level), and should return errors rather than raise them.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for path in paths:
+            yield function(path, *args)
+        return
+
+    # only imported when needed, multiprocessing takes a while to import
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    chunks = _chunks(paths, chunksize)
+    max_pending = workers * CHUNKS_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def submit(chunk):
+            return executor.submit(_run_chunk, function, chunk, args)
+
+        pending = deque(submit(chunk) for chunk in islice(chunks, max_pending))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                for result in future.result():
+                    yield result
+                for chunk in islice(chunks, 1):
+                    pending.append(submit(chunk))
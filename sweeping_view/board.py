@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+# Boards, and metrics computed from their mines: 3BV, openings, islands and
+# the numbers on the cells.
+#
+# Boards are handled as bitsets in Python ints, one bit per cell, row by row.
+# Every row has a spare bit at the end, so that shifting a row to the left or
+# right never spills into the next one. Growing a set of cells by their
+# neighbours is a handful of shifts on the whole board at once, which makes
+# flood fills cheap enough to check every replay's 3BV.
+
+from collections import namedtuple
+from collections.abc import Sequence
+from functools import lru_cache
+
+from .exceptions import InvalidReplayError
+
+BoardMetrics = namedtuple("BoardMetrics", ("bbbv", "openings", "islands"))
+
+# in the numbers returned by numbers()
+MINE = 9
+
+# hex digits of numbers() nibbles to byte values
+DIGITS = bytes.maketrans(b"0123456789", bytes(range(10)))
+
+# every byte with its bits in reverse order
+REVERSED_BITS = bytes(int("{:08b}".format(byte)[::-1], 2) for byte in range(256))
+
+
+class BitGrid:
+    # the bit layout of a board with the given size, and bitset operations on
+    # it
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.width = cols + 1
+        row = (1 << cols) - 1
+        self.all = 0
+        for index in range(rows):
+            self.all |= row << (index * self.width)
+
+    def bit(self, row, col):
+        return 1 << (row * self.width + col)
+
+    def from_cells(self, cells, base=0, replay=None):
+        # cells outside the board would spill into the spare bits or the
+        # next row, so they make replay invalid
+        width = self.width
+        offset = base * (width + 1)
+        end_row = self.rows + base
+        end_col = self.cols + base
+        result = 0
+        for row, col in cells:
+            if not (base <= row < end_row and base <= col < end_col):
+                raise outside(replay, row, col, self.rows, self.cols)
+            result |= 1 << (row * width + col - offset)
+        return result
+
+    def from_pairs(self, data, row_first=True, base=0, replay=None):
+        # from (row, col) or (col, row) byte pairs
+        rows, cols = (data[::2], data[1::2]) if row_first else (data[1::2], data[::2])
+        return self.from_cells(zip(rows, cols), base, replay)
+
+    def from_bitfield(self, data):
+        # from one bit per cell without spare bits, most significant bit
+        # first (like EVF)
+        cols = self.cols
+        width = self.width
+        dense = int.from_bytes(bytes(data).translate(REVERSED_BITS), "little")
+        row_mask = (1 << cols) - 1
+        result = 0
+        for row in range(self.rows):
+            result |= (dense >> (row * cols) & row_mask) << (row * width)
+        return result
+
+    def to_bitfield(self, bits):
+        # the reverse of from_bitfield
+        cols = self.cols
+        width = self.width
+        row_mask = (1 << cols) - 1
+        dense = 0
+        for row in range(self.rows):
+            dense |= (bits >> (row * width) & row_mask) << (row * cols)
+        size = (self.rows * cols - 1) // 8 + 1
+        return dense.to_bytes(size, "little").translate(REVERSED_BITS)
+
+    def cells(self, bits):
+        # (row, col) for every set bit, row by row
+        width = self.width
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(divmod(low.bit_length() - 1, width))
+            bits ^= low
+        return result
+
+    def grow(self, bits):
+        # bits and all their neighbours
+        bits |= bits << 1 | bits >> 1
+        width = self.width
+        return (bits | bits << width | bits >> width) & self.all
+
+    def components(self, bits):
+        # number of 8-connected groups of cells in bits. Same as grow(), but
+        # inlined since this is where the time goes.
+        width = self.width
+        count = 0
+        while bits:
+            region = bits & -bits
+            while True:
+                grown = region | region << 1 | region >> 1
+                grown = (grown | grown << width | grown >> width) & bits
+                if grown == region:
+                    break
+                region = grown
+            bits ^= region
+            count += 1
+        return count
+
+    def numbers(self, bits):
+        # The number of every cell, row by row (index row * cols + col), with
+        # MINE for mines.
+        #
+        # This uses the same layout, but with 4 bits per cell: the sum of the
+        # mines shifted to each of the 8 neighbours is then the number of
+        # every cell at once. It never exceeds 8, so there are no carries
+        # from one cell into the next.
+        width = self.width
+        mine_nibbles = 0
+        while bits:
+            low = bits & -bits
+            mine_nibbles |= 1 << 4 * (low.bit_length() - 1)
+            bits ^= low
+        counts = 0
+        for shift in (1, width - 1, width, width + 1):
+            counts += mine_nibbles << 4 * shift
+            counts += mine_nibbles >> 4 * shift
+        size = self.rows * width
+        counts &= (1 << 4 * size) - 1
+        # mines are MINE, the spare cells at the end of each row 0xF
+        counts = counts & ~(mine_nibbles * 0xF) | mine_nibbles * MINE
+        for row in range(1, self.rows + 1):
+            counts |= 0xF << 4 * (row * width - 1)
+        # cell 0 is the lowest nibble, so the last hex digit
+        digits = "{:0{}x}".format(counts, size)[::-1].encode()
+        return bytearray(digits.translate(DIGITS, b"f"))
+
+    def metrics(self, mines):
+        # cells without mines around them, and the cells they open
+        zeros = self.all & ~self.grow(mines)
+        opened = self.grow(zeros)
+        # numbers that need a click of their own
+        isolated = self.all & ~mines & ~opened
+        openings = self.components(zeros)
+        return BoardMetrics(
+            bbbv=openings + popcount(isolated),
+            openings=openings,
+            islands=self.components(isolated),
+        )
+
+
+bit_grid = lru_cache(maxsize=256)(BitGrid)
+
+
+def outside(replay, row, col, rows, cols):
+    return InvalidReplayError(
+        replay, "mine {} is outside the {}x{} board".format((row, col), cols, rows)
+    )
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class Bitboard:
+    # The mines of a board as a bitset, with 0-based (row, col) cells.
+    # Lookups (cell in board, board[cell]) are O(1), numbers and metrics are
+    # computed once. Bitboards are immutable and hashable.
+
+    def __init__(self, rows, cols, bits=0):
+        self.rows = rows
+        self.cols = cols
+        self.bits = bits
+        self._len = None
+        self._numbers = None
+        self._metrics = None
+
+    @property
+    def grid(self):
+        return bit_grid(self.rows, self.cols)
+
+    @classmethod
+    def from_cells(cls, rows, cols, cells, base=0, replay=None):
+        # cells are (row, col) pairs, base the index of the first row/column.
+        # Cells outside the board raise InvalidReplayError (for replay).
+        return cls(rows, cols, bit_grid(rows, cols).from_cells(cells, base, replay))
+
+    @classmethod
+    def from_pairs(cls, rows, cols, data, row_first=True, base=0, replay=None):
+        return cls(
+            rows, cols, bit_grid(rows, cols).from_pairs(data, row_first, base, replay)
+        )
+
+    @classmethod
+    def from_bitfield(cls, rows, cols, data):
+        return cls(rows, cols, bit_grid(rows, cols).from_bitfield(data))
+
+    def to_bitfield(self):
+        return self.grid.to_bitfield(self.bits)
+
+    def __contains__(self, cell):
+        row, col = cell
+        return (
+            0 <= row < self.rows
+            and 0 <= col < self.cols
+            and bool(self.bits >> (row * (self.cols + 1) + col) & 1)
+        )
+
+    def __getitem__(self, cell):
+        return cell in self
+
+    def __len__(self):
+        if self._len is None:
+            self._len = popcount(self.bits)
+        return self._len
+
+    def __iter__(self):
+        # row by row
+        return iter(self.grid.cells(self.bits))
+
+    def __eq__(self, other):
+        if not isinstance(other, Bitboard):
+            return NotImplemented
+        return (self.rows, self.cols, self.bits) == (other.rows, other.cols, other.bits)
+
+    def __hash__(self):
+        return hash((self.rows, self.cols, self.bits))
+
+    def __repr__(self):
+        return "Bitboard({}x{}, {} mines)".format(self.cols, self.rows, len(self))
+
+    def numbers(self):
+        # see BitGrid.numbers
+        if self._numbers is None:
+            self._numbers = self.grid.numbers(self.bits)
+        return self._numbers
+
+    def number(self, row, col):
+        return self.numbers()[row * self.cols + col]
+
+    def metrics(self):
+        if self._metrics is None:
+            self._metrics = self.grid.metrics(self.bits)
+        return self._metrics
+
+
+class MineList(Sequence):
+    # The mines of a replay as (row, col) tuples, in the replay's CELL_BASE
+    # and in the order of the file. They are decoded from the file's byte
+    # pairs on first use, and so is the Bitboard that `in` uses. Mines
+    # outside the board raise InvalidReplayError (for replay) right away.
+
+    def __init__(
+        self, rows, cols, data=b"", row_first=True, base=0, board=None, replay=None
+    ):
+        self.rows = rows
+        self.cols = cols
+        self.data = data
+        self.row_first = row_first
+        self.base = base
+        self._board = board
+        self._mines = None
+        if data:
+            row_values, col_values = (
+                (data[::2], data[1::2]) if row_first else (data[1::2], data[::2])
+            )
+            if (
+                min(row_values) < base
+                or max(row_values) >= rows + base
+                or min(col_values) < base
+                or max(col_values) >= cols + base
+            ):
+                # finds the first one
+                bit_grid(rows, cols).from_pairs(data, row_first, base, replay)
+
+    @classmethod
+    def from_board(cls, board, base=0):
+        # for formats that don't list the mines - column by column
+        return cls(board.rows, board.cols, None, base=base, board=board)
+
+    @property
+    def board(self):
+        if self._board is None:
+            self._board = Bitboard.from_pairs(
+                self.rows, self.cols, self.data, self.row_first, self.base
+            )
+        return self._board
+
+    @property
+    def mines(self):
+        if self._mines is None:
+            base = self.base
+            if self.data is None:
+                mines = sorted(self._board, key=lambda mine: (mine[1], mine[0]))
+                if base:
+                    mines = [(row + base, col + base) for row, col in mines]
+            elif self.row_first:
+                mines = list(zip(self.data[::2], self.data[1::2]))
+            else:
+                mines = list(zip(self.data[1::2], self.data[::2]))
+            self._mines = mines
+        return self._mines
+
+    def __len__(self):
+        if self.data is None:
+            return len(self._board)
+        return len(self.data) // 2
+
+    def __getitem__(self, index):
+        return self.mines[index]
+
+    def __iter__(self):
+        return iter(self.mines)
+
+    def __contains__(self, cell):
+        row, col = cell
+        return (row - self.base, col - self.base) in self.board
+
+    def __eq__(self, other):
+        if isinstance(other, (MineList, list, tuple)):
+            return self.mines == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.mines)
+
+
+def analyze(mines, rows, cols, base=0):
+    # mines is a sequence of (row, col), base the index of the first row and
+    # column (like the replays' CELL_BASE)
+    return Bitboard.from_cells(rows, cols, mines, base).metrics()
+
+
+def analyze_replay(replay):
+    return replay.board.metrics()
+
+
+def numbers(mines, rows, cols, base=0):
+    # see BitGrid.numbers
+    return Bitboard.from_cells(rows, cols, mines, base).numbers()
+
+
+# (path, BoardMetrics or None, bbbv as stated by the replay, error or None)
+BoardReport = namedtuple("BoardReport", ("path", "metrics", "claimed_bbbv", "error"))
+
+
+def analyze_files(paths, **kwargs):
+    # Computes the metrics of many replays, and reports the 3BV they claim
+    # next to them. Replays are parsed with batch.parse_many (which gets
+    # kwargs), only their headers are read.
+    from .batch import parse_many
+
+    for result in parse_many(paths, metadata_only=True, **kwargs):
+        if result.error is not None:
+            yield BoardReport(result.path, None, None, result.error)
+            continue
+        replay = result.replay
+        try:
+            metrics = analyze_replay(replay)
+        except Exception as exc:
+            yield BoardReport(result.path, None, replay.bbbv, exc)
+            continue
+        yield BoardReport(result.path, metrics, replay.bbbv, None)
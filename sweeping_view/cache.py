@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from hashlib import sha256
+import pickle
+import sqlite3
+import threading
+import time
+
+from . import __version__
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replays (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS replays_last_access ON replays (last_access);
+"""
+
+# parse options that change the result, and are therefore part of the key.
+# So is limits.max_scan_distance, since whether markers were found within it
+# can't be told from a parsed replay - the other limits are checked on hits.
+KEY_OPTIONS = ("metadata_only", "event_table")
+
+
+class ReplayCache:
+    # A cache of parsed replays, keyed by a hash of the raw replay, the
+    # library version, the replay class and the parse options.
+    #
+    # Entries are replays as BaseReplay.pack() makes them (with the events as
+    # columns of bytes), pickled. They are stored in an SQLite database at
+    # path (if given), which is kept below max_size bytes by evicting the
+    # least recently used entries. The most recently used entries are also kept in memory, up to
+    # memory_size bytes.
+    #
+    # Since entries are pickles, only point this at databases you trust.
+    #
+    # Use it by passing cache=... to from_file/from_bytes, or call parse()
+    # directly. instrument isn't part of the key: hits aren't parsed, so they
+    # aren't timed, and their profile is None.
+
+    def __init__(self, path=None, max_size=1 << 30, memory_size=64 << 20):
+        self.path = path
+        self.max_size = max_size
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(str(path), check_same_thread=False)
+            self.db.executescript(SCHEMA)
+            (self.disk_used,) = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM replays"
+            ).fetchone()
+
+    @staticmethod
+    def key(cls, data, **kwargs):
+        digest = sha256(data).hexdigest()
+        options = ",".join(
+            "{}={}".format(option, bool(kwargs.get(option))) for option in KEY_OPTIONS
+        )
+        limits = kwargs.get("limits") or cls.LIMITS
+        options += ",max_scan_distance={}".format(limits.max_scan_distance)
+        return "{}:{}.{}:{}:{}".format(
+            __version__, cls.__module__, cls.__qualname__, options, digest
+        )
+
+    def parse(self, cls, data, name=None, **kwargs):
+        # data is the raw replay, bytes-like (including mmap)
+        key = self.key(cls, data, **kwargs)
+        blob = self.get(key)
+        if blob is not None:
+            self.hits += 1
+            replay = cls.unpack(*pickle.loads(blob))
+            # nothing was parsed, so there is nothing to instrument
+            replay.profile = None
+            # name is only the source's name if the format doesn't use it
+            # for something else (like AVFReplay, for the player's name)
+            if replay.name == replay.source_name:
+                replay.name = name
+            replay.source_name = name
+            # it may have been parsed with other limits
+            replay.limits = kwargs.get("limits") or cls.LIMITS
+            replay.check_size(len(data))
+            if replay.events is not None:
+                replay.check_events(len(replay.events))
+            return replay
+        self.misses += 1
+        replay = cls(data, name=name, **kwargs)
+        self.put(key, pickle.dumps(replay.pack(), protocol=pickle.HIGHEST_PROTOCOL))
+        return replay
+
+    def get(self, key):
+        with self.lock:
+            blob = self.memory.get(key, None)
+            if blob is not None:
+                self.memory.move_to_end(key)
+                return blob
+            if self.db is None:
+                return None
+            row = self.db.execute(
+                "SELECT value FROM replays WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self.db:
+                self.db.execute(
+                    "UPDATE replays SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            blob = bytes(row[0])
+            self._remember(key, blob)
+            return blob
+
+    def put(self, key, blob):
+        with self.lock:
+            self._remember(key, blob)
+            if self.db is None or len(blob) > self.max_size:
+                return
+            with self.db:
+                old = self.db.execute(
+                    "SELECT size FROM replays WHERE key = ?", (key,)
+                ).fetchone()
+                if old is not None:
+                    self.disk_used -= old[0]
+                self.db.execute(
+                    "INSERT OR REPLACE INTO replays VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), time.time()),
+                )
+                self.disk_used += len(blob)
+                if self.disk_used > self.max_size:
+                    self._evict()
+
+    def _remember(self, key, blob):
+        if len(blob) > self.memory_size:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_used -= len(old)
+        self.memory[key] = blob
+        self.memory_used += len(blob)
+        while self.memory_used > self.memory_size:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted)
+
+    def _evict(self):
+        # other processes may share the database, so don't trust our own
+        # running total when deciding how much to delete
+        (self.disk_used,) = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM replays"
+        ).fetchone()
+        rows = self.db.execute("SELECT key, size FROM replays ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if self.disk_used <= self.max_size:
+                break
+            evicted.append((key,))
+            self.disk_used -= size
+        self.db.executemany("DELETE FROM replays WHERE key = ?", evicted)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+            if self.db is not None:
+                with self.db:
+                    self.db.execute("DELETE FROM replays")
+                self.disk_used = 0
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
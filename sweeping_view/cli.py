@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+# The sweeping-view command: parses every replay in some directories,
+# archives or files, and writes one JSON object per replay and line.
+#
+#     sweeping-view scan replays/ old_replays.zip --headers-only > replays.jsonl
+#
+# Files are parsed in a process pool, and only as many are in flight at once
+# as it takes to keep the workers busy, so memory use doesn't depend on the
+# number of files.
+
+import argparse
+import json
+import os
+import sys
+import tarfile
+import zipfile
+
+from .batch import map_files, scan
+from .exceptions import UnknownMimeType
+from .mime_types import EXTENSIONS, detect, get_class_for_filename, supported
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# separates an archive's path from the name of one of its members
+MEMBER_SEPARATOR = "::"
+
+
+def replay_extensions():
+    return {
+        extension
+        for extension, mime_type in EXTENSIONS.items()
+        if mime_type in supported()
+    }
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def archive_members(path, extensions):
+    # (name, data) of the members of an archive, one at a time
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and wanted(info.filename, extensions):
+                    yield member_name(path, info.filename), archive.read(info)
+        return
+    # streaming, so that compressed tars aren't decompressed over and over
+    with tarfile.open(path, "r|*") as archive:
+        for info in archive:
+            if info.isfile() and wanted(info.name, extensions):
+                yield member_name(path, info.name), archive.extractfile(info).read()
+
+
+def member_name(path, name):
+    return "{}{}{}".format(path, MEMBER_SEPARATOR, name)
+
+
+def wanted(name, extensions):
+    return extensions is None or os.path.splitext(name)[1].lower() in extensions
+
+
+def sources(paths, extensions, archives=True, errors=None):
+    # What there is to parse below paths: file names, and (name, data) for
+    # archive members. Archives that can't be read are reported to errors
+    # instead.
+    for root in paths:
+        try:
+            files = scan(root)
+            for path, _ in files:
+                if archives and is_archive(path):
+                    try:
+                        for member in archive_members(path, extensions):
+                            yield member
+                    except (OSError, zipfile.BadZipFile, tarfile.TarError) as exc:
+                        if errors is not None:
+                            errors(path, exc)
+                elif wanted(path, extensions):
+                    yield path
+        except OSError as exc:
+            if errors is not None:
+                errors(root, exc)
+
+
+def describe(replay):
+    # what is written about a replay
+    try:
+        token = replay.get_best_token_source()
+    except (KeyError, AttributeError):
+        token = None
+    return {
+        "format": type(replay).__name__,
+        "properties": replay.properties,
+        "rows": replay.rows,
+        "cols": replay.cols,
+        "mines": replay.num_mines,
+        "bbbv": replay.bbbv,
+        "timeth": replay.timeth,
+        "player": replay.get_player_name(),
+        "token": token,
+        "boardgen_time": replay.get_boardgen_time().isoformat(),
+    }
+
+
+def describe_error(path, error):
+    return {"path": path, "error": "{}: {}".format(type(error).__name__, error)}
+
+
+def describe_source(source, metadata_only):
+    # runs in the workers: parses a file name or (name, data), and returns
+    # the dict for its line
+    if isinstance(source, tuple):
+        path, data = source
+    else:
+        path = data = source
+    try:
+        try:
+            cls = detect(data)
+        except UnknownMimeType:
+            cls = get_class_for_filename(path)
+        if isinstance(source, tuple):
+            replay = cls.from_bytes(
+                data, name=path, metadata_only=metadata_only, event_table=True
+            )
+        else:
+            replay = cls.from_file(path, metadata_only=metadata_only, event_table=True)
+        result = {"path": path}
+        result.update(describe(replay))
+    except Exception as exc:
+        return describe_error(path, exc)
+    if not metadata_only:
+        result["events"] = len(replay.events)
+    return result
+
+
+def scan_command(args, output):
+    extensions = None if args.all_files else replay_extensions()
+    counts = {"replays": 0, "errors": 0}
+
+    def write(record):
+        output.write(json.dumps(record, ensure_ascii=False))
+        output.write("\n")
+        counts["errors" if "error" in record else "replays"] += 1
+
+    def unreadable(path, error):
+        write(describe_error(path, error))
+
+    results = map_files(
+        describe_source,
+        sources(args.paths, extensions, not args.no_archives, unreadable),
+        (args.headers_only,),
+        workers=args.workers,
+        chunksize=args.chunksize,
+        ordered=args.ordered,
+    )
+    for result in results:
+        write(result)
+    output.flush()
+    if not args.quiet:
+        print(
+            "{replays} replays, {errors} errors".format(**counts),
+            file=sys.stderr,
+        )
+    return 1 if counts["errors"] else 0
+
+
+class VersionAction(argparse.Action):
+    # like action="version", but only looks the version up when asked
+
+    def __init__(self, option_strings, dest, **kwargs):
+        super().__init__(option_strings, dest, nargs=0, help="show the version")
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        import sweeping_view
+
+        print(parser.prog, sweeping_view.__version__)
+        parser.exit()
+
+
+def main(argv=None, output=None):
+    parser = argparse.ArgumentParser(
+        prog="sweeping-view", description="Read Minesweeper replays."
+    )
+    parser.add_argument("--version", action=VersionAction)
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    scan_parser = commands.add_parser(
+        "scan",
+        help="write one JSON line per replay",
+        description="Parse every replay in some directories (recursively), "
+        "archives (zip and tar) or files, detecting their format, and write one "
+        "JSON object per replay and line: its path, format, properties, size, "
+        "mines, 3BV, timeth, player, token and board generation time - or the "
+        "error it couldn't be parsed with. Archive members are named "
+        "ARCHIVE{}MEMBER. The exit status is 1 if anything failed.".format(
+            MEMBER_SEPARATOR
+        ),
+    )
+    scan_parser.add_argument("paths", nargs="+", help="directories, archives or files")
+    scan_parser.add_argument(
+        "--headers-only",
+        action="store_true",
+        help="only parse the headers, not the events (much faster)",
+    )
+    scan_parser.add_argument(
+        "--workers", type=int, help="worker processes (default: one per CPU)"
+    )
+    scan_parser.add_argument(
+        "--chunksize", type=int, default=16, help="files per task (default: 16)"
+    )
+    scan_parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="write results in the order the files were found, not as they are done",
+    )
+    scan_parser.add_argument(
+        "--all-files",
+        action="store_true",
+        help="try every file, not only those with a replay file extension",
+    )
+    scan_parser.add_argument(
+        "--no-archives", action="store_true", help="don't look into archives"
+    )
+    scan_parser.add_argument(
+        "-o", "--output", help="write the lines to this file instead of stdout"
+    )
+    scan_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="don't print a summary to stderr"
+    )
+    args = parser.parse_args(argv)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            return scan_command(args, file)
+    if output is not None:
+        return scan_command(args, output)
+    try:
+        return scan_command(args, sys.stdout)
+    except BrokenPipeError:
+        # piped into something like head, which is fine. stdout is pointed at
+        # devnull, so that flushing it at exit doesn't fail again.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
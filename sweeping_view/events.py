@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from collections.abc import Sequence
+
+TYPES = (
+    "mouse",
+    "board",
+    "terminate",
+    "timestamp_change",
+)
+
+# shared by all formats, so that codes mean the same thing no matter where an
+# event came from. Only ever append to this, the codes may end up on disk.
+SUBTYPES = (
+    # mouse
+    "move",
+    "lmb_down",
+    "lmb_up",
+    "rmb_down",
+    "rmb_up",
+    "mmb_down",
+    "mmb_up",
+    "preflag",
+    "chord",
+    "lmb",
+    "rmb",
+    "mmb",
+    "shift_lmb_down",
+    # board
+    "pressed",
+    "pressed_qm",
+    "closed",
+    "qm",
+    "flag",
+    "open",
+    "open_0",
+    "open_1",
+    "open_2",
+    "open_3",
+    "open_4",
+    "open_5",
+    "open_6",
+    "open_7",
+    "open_8",
+    "open_blast",
+    # terminate
+    "blast",
+    "win",
+    "other",
+)
+
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+SUBTYPE_CODES = {name: code for code, name in enumerate(SUBTYPES)}
+
+MOUSE, BOARD, TERMINATE, TIMESTAMP_CHANGE = range(len(TYPES))
+
+# name, array typecode, numpy dtype
+COLUMNS = (
+    ("type", "b", "i1"),
+    ("subtype", "b", "i1"),
+    ("gametime", "q", "i8"),
+    ("xpos", "i", "i4"),
+    ("ypos", "i", "i4"),
+    ("nflags", "h", "i2"),
+    ("row", "h", "i2"),
+    ("col", "h", "i2"),
+)
+
+# used in columns that don't apply to an event
+MISSING = -1
+
+
+class EventDicts:
+    # builds event dicts without storing them, used for streaming
+
+    def add_mouse(self, subtype, gametime, xpos, ypos, nflags=None):
+        if nflags is None:
+            return {
+                "type": "mouse",
+                "subtype": subtype,
+                "gametime": gametime,
+                "xpos": xpos,
+                "ypos": ypos,
+            }
+        return {
+            "type": "mouse",
+            "subtype": subtype,
+            "gametime": gametime,
+            "nFlags": nflags,
+            "xpos": xpos,
+            "ypos": ypos,
+        }
+
+    def add_board(self, subtype, row, col):
+        return {
+            "type": "board",
+            "subtype": subtype,
+            "col": col,
+            "row": row,
+        }
+
+    def add_terminate(self, how):
+        return {
+            "type": "terminate",
+            "how": how,
+        }
+
+    def add_timestamp_change(self, new_timestamp):
+        return {
+            "type": "timestamp_change",
+            "new_timestamp": new_timestamp,
+        }
+
+
+class EventList(EventDicts, list):
+    # the default event storage: a plain list of dicts
+    #
+    # this is the hot path when parsing, hence the duplication
+
+    def add_mouse(self, subtype, gametime, xpos, ypos, nflags=None):
+        if nflags is None:
+            event = {
+                "type": "mouse",
+                "subtype": subtype,
+                "gametime": gametime,
+                "xpos": xpos,
+                "ypos": ypos,
+            }
+        else:
+            event = {
+                "type": "mouse",
+                "subtype": subtype,
+                "gametime": gametime,
+                "nFlags": nflags,
+                "xpos": xpos,
+                "ypos": ypos,
+            }
+        self.append(event)
+        return event
+
+    def add_board(self, subtype, row, col):
+        event = {
+            "type": "board",
+            "subtype": subtype,
+            "col": col,
+            "row": row,
+        }
+        self.append(event)
+        return event
+
+    def add_terminate(self, how):
+        event = {
+            "type": "terminate",
+            "how": how,
+        }
+        self.append(event)
+        return event
+
+    def add_timestamp_change(self, new_timestamp):
+        event = {
+            "type": "timestamp_change",
+            "new_timestamp": new_timestamp,
+        }
+        self.append(event)
+        return event
+
+
+class EventTable(Sequence):
+    # columnar event storage: one array per column, one entry per event.
+    # Indexing/iterating produces the same dicts EventList stores, built on
+    # the fly. The add_* methods don't return anything.
+
+    def __init__(self):
+        for name, typecode, _ in COLUMNS:
+            setattr(self, name, array(typecode))
+
+    @classmethod
+    def from_columns(cls, columns):
+        # a table over existing columns - anything indexable with the
+        # column's item type, like memoryviews - without copying them. Such
+        # tables can't be added to unless the columns are arrays.
+        table = cls.__new__(cls)
+        for name, _, _ in COLUMNS:
+            setattr(table, name, columns[name])
+        return table
+
+    @classmethod
+    def from_events(cls, events):
+        # from event dicts, or anything else that yields them
+        if isinstance(events, EventTable):
+            return events
+        table = cls()
+        for event in events:
+            type_ = event["type"]
+            if type_ == "mouse":
+                table.add_mouse(
+                    event["subtype"],
+                    event["gametime"],
+                    event["xpos"],
+                    event["ypos"],
+                    event.get("nFlags"),
+                )
+            elif type_ == "board":
+                table.add_board(event["subtype"], event["row"], event["col"])
+            elif type_ == "terminate":
+                table.add_terminate(event["how"])
+            else:
+                table.add_timestamp_change(event["new_timestamp"])
+        return table
+
+    def _append(self, type_, subtype, gametime, xpos, ypos, nflags, row, col):
+        self.type.append(type_)
+        self.subtype.append(subtype)
+        self.gametime.append(gametime)
+        self.xpos.append(xpos)
+        self.ypos.append(ypos)
+        self.nflags.append(nflags)
+        self.row.append(row)
+        self.col.append(col)
+
+    def add_mouse(self, subtype, gametime, xpos, ypos, nflags=None):
+        # the hot path, so no _append here
+        self.type.append(MOUSE)
+        self.subtype.append(SUBTYPE_CODES[subtype])
+        self.gametime.append(gametime)
+        self.xpos.append(xpos)
+        self.ypos.append(ypos)
+        self.nflags.append(MISSING if nflags is None else nflags)
+        self.row.append(MISSING)
+        self.col.append(MISSING)
+
+    def add_board(self, subtype, row, col):
+        self._append(
+            BOARD, SUBTYPE_CODES[subtype], MISSING, MISSING, MISSING, MISSING, row, col
+        )
+
+    def add_terminate(self, how):
+        self._append(
+            TERMINATE,
+            SUBTYPE_CODES[how],
+            MISSING,
+            MISSING,
+            MISSING,
+            MISSING,
+            MISSING,
+            MISSING,
+        )
+
+    def add_timestamp_change(self, new_timestamp):
+        # the new timestamp goes into the gametime column
+        self._append(
+            TIMESTAMP_CHANGE,
+            MISSING,
+            new_timestamp,
+            MISSING,
+            MISSING,
+            MISSING,
+            MISSING,
+            MISSING,
+        )
+
+    def __len__(self):
+        return len(self.type)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._event(ii) for ii in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        return self._event(index)
+
+    def __iter__(self):
+        # what _event() does, over all columns at once
+        columns = zip(
+            self.type,
+            self.subtype,
+            self.gametime,
+            self.xpos,
+            self.ypos,
+            self.nflags,
+            self.row,
+            self.col,
+        )
+        for type_, subtype, gametime, xpos, ypos, nflags, row, col in columns:
+            if type_ == MOUSE:
+                event = {
+                    "type": "mouse",
+                    "subtype": SUBTYPES[subtype],
+                    "gametime": gametime,
+                    "xpos": xpos,
+                    "ypos": ypos,
+                }
+                if nflags != MISSING:
+                    event["nFlags"] = nflags
+                yield event
+            elif type_ == BOARD:
+                yield {
+                    "type": "board",
+                    "subtype": SUBTYPES[subtype],
+                    "col": col,
+                    "row": row,
+                }
+            elif type_ == TERMINATE:
+                yield {"type": "terminate", "how": SUBTYPES[subtype]}
+            else:
+                yield {"type": "timestamp_change", "new_timestamp": gametime}
+
+    def _event(self, index):
+        type_ = self.type[index]
+        if type_ == MOUSE:
+            event = {
+                "type": "mouse",
+                "subtype": SUBTYPES[self.subtype[index]],
+                "gametime": self.gametime[index],
+                "xpos": self.xpos[index],
+                "ypos": self.ypos[index],
+            }
+            nflags = self.nflags[index]
+            if nflags != MISSING:
+                event["nFlags"] = nflags
+            return event
+        if type_ == BOARD:
+            return {
+                "type": "board",
+                "subtype": SUBTYPES[self.subtype[index]],
+                "col": self.col[index],
+                "row": self.row[index],
+            }
+        if type_ == TERMINATE:
+            return {
+                "type": "terminate",
+                "how": SUBTYPES[self.subtype[index]],
+            }
+        return {
+            "type": "timestamp_change",
+            "new_timestamp": self.gametime[index],
+        }
+
+    def __eq__(self, other):
+        if isinstance(other, EventTable):
+            return all(
+                getattr(self, name) == getattr(other, name) for name, _, _ in COLUMNS
+            )
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and all(
+                mine == theirs for mine, theirs in zip(self, other)
+            )
+        return NotImplemented
+
+    def __repr__(self):
+        return "{}({} events)".format(type(self).__name__, len(self))
+
+    def columns(self):
+        return {name: getattr(self, name) for name, _, _ in COLUMNS}
+
+    def to_numpy(self):
+        # zero-copy: the returned arrays share memory with the columns, so
+        # don't add events while holding on to them
+        import numpy
+
+        return {
+            name: numpy.frombuffer(getattr(self, name), dtype=dtype)
+            for name, _, dtype in COLUMNS
+        }
+
+
+def mouse_events(events):
+    # (subtype, gametime, xpos, ypos) of all mouse events, from event dicts
+    # or straight from the columns of an EventTable. AVF's end marker (which
+    # has a negative gametime) is left out.
+    if isinstance(events, EventTable):
+        for type_, subtype, gametime, xpos, ypos in zip(
+            events.type, events.subtype, events.gametime, events.xpos, events.ypos
+        ):
+            if type_ == MOUSE and gametime >= 0:
+                yield SUBTYPES[subtype], gametime, xpos, ypos
+        return
+    for event in events:
+        if event["type"] == "mouse" and event["gametime"] >= 0:
+            yield event["subtype"], event["gametime"], event["xpos"], event["ypos"]
+
+
+def mouse_cells(events, cells):
+    # (subtype, cell) of the events mouse_events() picks, with their cells
+    # taken from cells - the cell_column() of events
+    if isinstance(events, EventTable):
+        for type_, subtype, gametime, cell in zip(
+            events.type, events.subtype, events.gametime, cells
+        ):
+            if type_ == MOUSE and gametime >= 0:
+                yield SUBTYPES[subtype], cell
+        return
+    for event, cell in zip(events, cells):
+        if event["type"] == "mouse" and event["gametime"] >= 0:
+            yield event["subtype"], cell
+
+
+def cell_index(xpos, ypos, rows, cols, cell_size):
+    # the cell (row * cols + col, 0-based) at these coordinates, MISSING if
+    # they are outside the board
+    if xpos < 0 or ypos < 0:
+        return MISSING
+    row = ypos // cell_size
+    col = xpos // cell_size
+    if row >= rows or col >= cols:
+        return MISSING
+    return row * cols + col
+
+
+def cell_column(events, rows, cols, cell_size):
+    # The cell_index() each event happened on, as an array("i") with one
+    # entry per event - MISSING for events outside the board and events
+    # that aren't mouse events. For an EventTable, this is computed on its
+    # columns with NumPy if it is installed, one event at a time otherwise.
+    # to_numpy()'s arrays line up with it, and numpy.frombuffer() wraps it
+    # without copying.
+    if isinstance(events, EventTable):
+        try:
+            import numpy
+        except ImportError:
+            return array(
+                "i",
+                [
+                    (
+                        cell_index(xpos, ypos, rows, cols, cell_size)
+                        if type_ == MOUSE
+                        else MISSING
+                    )
+                    for type_, xpos, ypos in zip(events.type, events.xpos, events.ypos)
+                ],
+            )
+        columns = events.to_numpy()
+        xpos = columns["xpos"]
+        ypos = columns["ypos"]
+        # what cell_index() does, for all of them at once
+        row = ypos // cell_size
+        col = xpos // cell_size
+        inside = (
+            (columns["type"] == MOUSE)
+            & (xpos >= 0)
+            & (ypos >= 0)
+            & (row < rows)
+            & (col < cols)
+        )
+        cells = numpy.where(inside, row * cols + col, MISSING)
+        return array("i", cells.astype(numpy.intc).tobytes())
+    return array(
+        "i",
+        [
+            (
+                cell_index(event["xpos"], event["ypos"], rows, cols, cell_size)
+                if event["type"] == "mouse"
+                else MISSING
+            )
+            for event in events
+        ],
+    )
@@ -1,7 +1,15 @@
 from datetime import datetime
+from struct import Struct, error as StructError
 
 from .base import BaseReplay
-from .exceptions import InvalidReplayError
+from .board import Bitboard, MineList
+from .exceptions import EncodingError, InvalidReplayError, UnknownFormatVersionError
+
+# everything after the version byte up to timeth: summary, settings, rows,
+# cols, number of mines, cell size, game mode, 3BV
+HEADER = Struct(">BBBBHBHH")
+# mouse operation and timestamp (3 bytes) share the first 4 bytes, then x and y
+EVENT = Struct(">IHH")
 
 
 class EVFBoard:
@@ -10,7 +18,7 @@ class EVFBoard:
         self.cols = cols
 
     def __getitem__(self, item):
-        (xx, yy) = item
+        xx, yy = item
         bit_index = yy * self.cols + xx
         byte_index = bit_index // 8
         return bool(self.data[byte_index] & (128 >> (bit_index % 8)))
@@ -49,30 +57,52 @@ class EVFReplay(BaseReplay):
         12: "mmb",
     }
 
-    def process_buffer(self, data):
-        version_number = self.read_int(data.read(1))
+    @classmethod
+    def sniff(cls, header):
+        if len(header) < 16 or header[0] != 3:
+            return False
+        _, _, rows, cols, num_mines, cell_size, game_mode, _ = HEADER.unpack_from(
+            header, 1
+        )
+        return (
+            rows > 0
+            and cols > 0
+            and num_mines <= rows * cols
+            and cell_size > 0
+            and game_mode in cls.MODES
+            # the version info string that follows timeth
+            and header.find(b"\0", 15) > 15
+        )
+
+    def process_header(self, data):
+        version_number = data.uint8()
         if version_number != 3:
             raise UnknownFormatVersionError(self, version_number)
 
-        summary = self.read_int(data.read(1))
-        self.completed = bool(summary & (127 >> 0))
-        self.official = bool(summary & (127 >> 1))
-        self.fair = bool(summary & (127 >> 2))
-        nf = bool(summary & (127 >> 3))
-
-        settings = self.read_int(data.read(1))
-        qm_disabled = bool(settings & (127 >> 0))
-        board_clip = bool(settings & (127 >> 1))
-        loss_autorestart = bool(settings & (127 >> 2))
-
-        self.rows = self.read_int(data.read(1))
-        self.cols = self.read_int(data.read(1))
-        self.num_mines = self.read_int(data.read(2))
-        self.cell_size = self.read_int(data.read(1))
-        game_mode_raw = self.read_int(data.read(2))
-        self.bbbv = self.read_int(data.read(2))
-        self.timeth = self.read_int(data.read(3))
+        (
+            self.summary,
+            self.settings,
+            self.rows,
+            self.cols,
+            self.num_mines,
+            self.cell_size,
+            game_mode_raw,
+            self.bbbv,
+        ) = data.unpack(HEADER)
+
+        # flags, most significant bit first
+        self.completed = bool(self.summary & (128 >> 0))
+        self.official = bool(self.summary & (128 >> 1))
+        self.fair = bool(self.summary & (128 >> 2))
+        nf = bool(self.summary & (128 >> 3))
+
+        qm_disabled = bool(self.settings & (128 >> 0))
+        board_clip = bool(self.settings & (128 >> 1))
+        loss_autorestart = bool(self.settings & (128 >> 2))
+
+        self.timeth = data.uint24()
         self.version_info = self.read_c_string(data)
+        self.mark("player", data)
         self.user_identifier = self.read_c_string(data)
         self.competition_identifier = self.read_c_string(data)
         self.unique_identifier = self.read_c_string(data)
@@ -80,50 +110,24 @@ class EVFReplay(BaseReplay):
         self.end_ts = self.read_c_string(data)
         self.country_code = self.read_c_string(data)
         self.uuid = self.read_c_string(data)
-        board = EVFBoard(data.read((self.cols * self.rows - 1) // 8 + 1), self.cols)
+        self.mark("board", data)
+        board = data.read((self.cols * self.rows - 1) // 8 + 1)
 
         game_mode = self.MODES.get(game_mode_raw, None)
         if game_mode is None:
             raise InvalidReplayError(
-                f"Invalid game mode {game_mode_raw}!",
+                self,
+                message=f"Invalid game mode {game_mode_raw}!",
             )
 
-        num_mines = 0
-        self.mines = []
-        for xx in range(self.cols):
-            for yy in range(self.rows):
-                if board[xx, yy]:
-                    num_mines += 1
-                    self.mines.append((yy, xx))
-        if num_mines != self.num_mines:
+        # the board is a bitfield, row by row, most significant bit first
+        board = Bitboard.from_bitfield(self.rows, self.cols, board)
+        self.mines = MineList.from_board(board)
+        if len(board) != self.num_mines:
             raise InvalidReplayError(
-                "Number of mines in header field is inconsistent with the board!",
-            )
-
-        self.events = []
-        while True:
-            op = self.read_int(data.read(1))
-            if op in (0, 255):
-                break
-            ts = self.read_int(data.read(3))
-            xx = self.read_int(data.read(2))
-            yy = self.read_int(data.read(2))
-            st = self.MOUSE_EVENT_TYPES.get(op, None)
-            if st is None:
-                raise InvalidReplayError(f"Unknown mouse operation {op}")
-            self.events.append(
-                {
-                    "type": "mouse",
-                    "subtype": st,
-                    "gametime": ts,
-                    "xpos": xx,
-                    "ypos": yy,
-                }
+                self,
+                message="Number of mines in header field is inconsistent with the board!",
             )
-        if op == 0:
-            self.checksum = data.read(32)
-        else:
-            self.checksum = None
 
         level = {
             (8, 8, 10): "beginner",
@@ -144,23 +148,197 @@ class EVFReplay(BaseReplay):
             "mode": game_mode,
             "level": level,
         }
+        self.events_offset = data.tell()
+
+    def process_body(self, data):
+        if self.metadata_only:
+            self.events = None
+            self.checksum = self.find_checksum(data)
+        else:
+            self.events = self.new_events()
+            self.decode_all(data, self.events)
+
+    def event_record(self, buf, pos):
+        # events are 8 bytes, then 0 and a checksum or 255
+        op = buf[pos]
+        if op == 0:
+            return 33, True
+        if op == 255:
+            return 1, True
+        return 8, False
+
+    def decode_events(self, data, events, state=None):
+        buf = data.data
+        pos = data.pos
+        unpack_event = EVENT.unpack_from
+        mouse_event_types = self.MOUSE_EVENT_TYPES
+        add_mouse = events.add_mouse
+        try:
+            while True:
+                op = buf[pos]
+                if op == 0 or op == 255:
+                    pos += 1
+                    break
+                op_ts, xx, yy = unpack_event(buf, pos)
+                pos += 8
+                st = mouse_event_types.get(op, None)
+                if st is None:
+                    raise InvalidReplayError(
+                        self, message=f"Unknown mouse operation {op}"
+                    )
+                yield add_mouse(st, op_ts & 0xFFFFFF, xx, yy)
+        except (IndexError, StructError):
+            raise data.truncated("events")
+        data.seek(pos)
+        self.mark("footer", data)
+        # the terminator decides whether there is a checksum
+        if op == 0:
+            self.checksum = bytes(data.read(32))
+        else:
+            self.checksum = None
+
+    def find_checksum(self, data):
+        # events are 8 byte records, followed by either 0 and a 32 byte
+        # checksum, or 255 and nothing. In both cases, the byte 33 bytes
+        # before the end is at a record boundary - it's the 0 terminator if
+        # there is a checksum, and a (nonzero) mouse operation otherwise.
+        if data.size - self.events_offset < 33:
+            return None
+        data.seek(data.size - 33)
+        self.mark("footer", data)
+        if data.uint8() != 0:
+            return None
+        return data.read(32)
+
+    @classmethod
+    def encode(cls, replay):
+        # EVF replays are written back the way they were read, so unchanged
+        # replays come out byte for byte the same. Replays in other formats
+        # keep only their mouse events, and have no checksum. Note that any
+        # change invalidates the checksum.
+        if replay.events is None:
+            raise EncodingError(replay, "its events weren't parsed")
+        if isinstance(replay, EVFReplay):
+            summary = replay.summary
+            settings = replay.settings
+            completed = replay.completed
+            official = replay.official
+            fair = replay.fair
+            cell_size = replay.cell_size
+            strings = [
+                replay.version_info,
+                replay.user_identifier,
+                replay.competition_identifier,
+                replay.unique_identifier,
+                replay.start_ts,
+                replay.end_ts,
+                replay.country_code,
+                replay.uuid,
+            ]
+            checksum = replay.checksum
+        else:
+            summary = settings = 0
+            completed = any(
+                event["type"] == "terminate" and event["how"] == "win"
+                for event in replay.events
+            )
+            official = fair = False
+            cell_size = getattr(replay, "square_size", 16)
+            version_info = replay.version_info
+            if isinstance(version_info, bytes):
+                version_info = version_info.decode("cp1252")
+            # only RMV replays have more than the player's name
+            player_data = getattr(replay, "player_data", {})
+            start_ts = int(replay.get_boardgen_time().timestamp() * 1000000)
+            strings = [
+                version_info,
+                replay.get_player_name() or "",
+                "",
+                "",
+                str(start_ts),
+                str(start_ts + 1000 * replay.timeth),
+                player_data.get("country", ""),
+                "",
+            ]
+            checksum = None
+        properties = replay.properties
+
+        # keep the flags we don't know about as they were
+        summary &= 0x0F
+        for bit, flag in enumerate(
+            (completed, official, fair, properties.get("nonflagging", False))
+        ):
+            summary |= (128 >> bit) if flag else 0
+        settings &= 0x7F
+        settings |= 0 if properties["questionmarks"] else 128
+
+        modes = {mode: code for code, mode in cls.MODES.items()}
+        mode = properties.get("mode", "normal")
+        if mode not in modes:
+            raise EncodingError(replay, "EVF has no {} mode".format(mode))
+
+        board = replay.board
+        header = HEADER.pack(
+            summary,
+            settings,
+            board.rows,
+            board.cols,
+            len(board),
+            cell_size,
+            modes[mode],
+            replay.bbbv,
+        )
+        return b"".join(
+            [
+                b"\3",
+                header,
+                replay.timeth.to_bytes(3, "big"),
+                b"".join(string.encode("utf-8") + b"\0" for string in strings),
+                board.to_bitfield(),
+                cls.encode_events(replay),
+                b"\xff" if checksum is None else b"\0" + checksum,
+            ]
+        )
+
+    @classmethod
+    def encode_events(cls, replay):
+        # mouse events only, other formats' board events etc. are dropped
+        mouse_codes = {subtype: code for code, subtype in cls.MOUSE_EVENT_TYPES.items()}
+        pack_event = EVENT.pack
+        events = bytearray()
+        try:
+            for event in replay.events:
+                # AVF's end marker has a negative gametime
+                if event["type"] != "mouse" or event["gametime"] < 0:
+                    continue
+                subtype = event["subtype"]
+                try:
+                    code = mouse_codes[subtype]
+                except KeyError:
+                    raise EncodingError(
+                        replay, "EVF has no {} mouse events".format(subtype)
+                    )
+                events += pack_event(
+                    code << 24 | event["gametime"], event["xpos"], event["ypos"]
+                )
+        except StructError as exc:
+            raise EncodingError(replay, "event out of range for EVF: {}".format(exc))
+        return events
 
     def read_c_string(self, data):
         return self.read_bin_c_string(data).decode("utf-8")
 
     def read_bin_c_string(self, data):
-        result = []
-        while True:
-            next = data.read(1)
-            if next == b"\0":
-                break
-            if next == b"":
-                raise InvalidReplayError("EOF while reading null-terminated string")
-            result.append(next)
-        return b"".join(result)
+        return bytes(data.c_string())
 
     def get_best_token_source(self):
         return self.competition_identifier
 
+    def get_player_name(self):
+        return self.user_identifier
+
     def get_boardgen_time(self):
         return datetime.fromtimestamp(int(self.start_ts) // 1000000)
+
+    def get_cell_size(self):
+        return self.cell_size
@@ -1,5 +1,14 @@
+def _unpickle_exception(cls, args):
+    exc = cls.__new__(cls)
+    Exception.__init__(exc, *args)
+    return exc
+
+
 class SweepingViewException(Exception):
-    pass
+    def __reduce__(self):
+        # subclasses format their message in __init__, so they can't be
+        # recreated by calling them with self.args
+        return (_unpickle_exception, (type(self), self.args))
 
 
 class InvalidReplayError(SweepingViewException):
@@ -35,8 +44,22 @@ class UnknownMimeType(SweepingViewException):
         from .mime_types import supported
 
         super().__init__(
-            "Unknown mime type {}!\nAvailable mime types:\n".format(
+            "Unknown mime type {}!\nAvailable mime types:\n{}".format(
                 mime_type,
                 "\n".join(supported()),
             )
         )
+
+
+class TruncatedReplayError(InvalidReplayError):
+    pass
+
+
+class LimitExceededError(InvalidReplayError):
+    # see base.Limits
+    pass
+
+
+class EncodingError(SweepingViewException):
+    def __init__(self, replay, message):
+        super().__init__("The replay {} can't be encoded: {}".format(replay, message))
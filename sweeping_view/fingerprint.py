@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Fingerprints that identify a game no matter which format its replay is in,
+# for finding replays that were uploaded more than once, possibly converted
+# to another format in between.
+#
+# A fingerprint hashes the board (size and mines, as 0-based cells), and the
+# clicks: every change of the buttons that are down, with the cell it
+# happened on. Mouse moves aren't part of it - formats and clients record
+# them differently - and neither are pixel positions, only cells, using each
+# format's cell size (RMV v1's client area offset is removed when parsing).
+# Timeth is kept as it is, so that near-duplicates can be told apart from
+# exact ones.
+
+from collections import namedtuple
+from hashlib import blake2b
+from struct import Struct
+
+from .events import cell_column, mouse_cells
+
+# LEFT, RIGHT, MIDDLE and SHIFT are the buttons in clicks()
+from .game import LEFT, MIDDLE, RIGHT, SHIFT, press_buttons
+
+DIGEST_SIZE = 16
+
+# (buttons, cell) of a click. Cells outside the board are -1.
+CLICK = Struct("<Bi")
+
+SIZE = Struct("<HH")
+
+Fingerprint = namedtuple("Fingerprint", ("board", "clicks", "timeth"))
+
+
+def board_hash(board):
+    # board is a board.Bitboard
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    digest.update(SIZE.pack(board.rows, board.cols))
+    digest.update(board.to_bitfield())
+    return digest.hexdigest()
+
+
+def clicks(events, rows, cols, cell_size):
+    # Yields (buttons, cell) whenever the buttons that are down change, where
+    # buttons is the state after the change, as game.press_buttons() tracks
+    # it. Releasing a button that isn't down is a click.
+    buttons = 0
+    cells = cell_column(events, rows, cols, cell_size)
+    for subtype, cell in mouse_cells(events, cells):
+        before, after = press_buttons(buttons, subtype)
+        if before != buttons:
+            yield before, cell
+        if after != before:
+            yield after, cell
+        buttons = after
+
+
+def clicks_hash(events, rows, cols, cell_size):
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    pack = CLICK.pack
+    digest.update(
+        b"".join(pack(*click) for click in clicks(events, rows, cols, cell_size))
+    )
+    return digest.hexdigest()
+
+
+def fingerprint(replay):
+    # the Fingerprint of a replay, whose events need to be parsed (so no
+    # metadata_only replays)
+    if replay.events is None:
+        raise ValueError("{} has no events".format(replay))
+    return Fingerprint(
+        board_hash(replay.board),
+        clicks_hash(replay.events, replay.rows, replay.cols, replay.get_cell_size()),
+        replay.timeth,
+    )
+
+
+class FingerprintIndex:
+    # Finds duplicates among many fingerprints without comparing them
+    # pairwise. Fingerprints are added with a key (a path, a database id...)
+    # and indexed by their board, so that only replays of the same board are
+    # ever compared:
+    #
+    #     index = FingerprintIndex()
+    #     for path, replay in replays:
+    #         for key, kind in index.matches(fingerprint(replay)):
+    #             print(path, kind, key)
+    #         index.add(path, fingerprint(replay))
+    #
+    # Replays with the same board and clicks are duplicates ("exact" if
+    # timeth is the same too, "same_game" if it is within time_tolerance ms,
+    # which covers formats rounding it differently). Replays that only share
+    # the board are "same_board" - the board was played again, or reused by a
+    # generator, which may or may not be interesting.
+
+    KINDS = ("exact", "same_game", "same_board")
+
+    def __init__(self, time_tolerance=10):
+        self.time_tolerance = time_tolerance
+        self.fingerprints = {}
+        self.by_board = {}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __contains__(self, key):
+        return key in self.fingerprints
+
+    def add(self, key, fingerprint):
+        if key in self.fingerprints:
+            self.remove(key)
+        self.fingerprints[key] = fingerprint
+        self.by_board.setdefault(fingerprint.board, set()).add(key)
+
+    def remove(self, key):
+        board = self.fingerprints.pop(key).board
+        keys = self.by_board[board]
+        keys.discard(key)
+        if not keys:
+            del self.by_board[board]
+
+    def classify(self, fingerprint, other):
+        # how other relates to fingerprint, None if it doesn't
+        if fingerprint.board != other.board:
+            return None
+        if fingerprint.clicks != other.clicks:
+            return "same_board"
+        if fingerprint.timeth == other.timeth:
+            return "exact"
+        if abs(fingerprint.timeth - other.timeth) <= self.time_tolerance:
+            return "same_game"
+        return "same_board"
+
+    def matches(self, fingerprint):
+        # (key, kind) of everything related to fingerprint, exact ones first
+        result = [
+            (key, self.classify(fingerprint, self.fingerprints[key]))
+            for key in self.by_board.get(fingerprint.board, ())
+        ]
+        result.sort(key=lambda match: (self.KINDS.index(match[1]), str(match[0])))
+        return result
+
+    def duplicates(self, fingerprint):
+        # keys of the exact and same_game matches
+        return [key for key, kind in self.matches(fingerprint) if kind != "same_board"]
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+# Replays the mouse events of a replay against its mines, to find out what
+# happened on the board: which cells were pressed, flagged and opened, and how
+# the game ended. This produces the same board and terminate events RMV
+# files contain, for every format.
+#
+# The rules are those of Minesweeper Arbiter and Vienna Minesweeper: the left
+# button opens the cell it is released on, the right button toggles flags
+# (and question marks, if enabled) when it goes down, and both buttons
+# together - or the middle button, or shift and the left button - chord.
+# Openings are opened depth first, neighbours in reading order, like the
+# clients do it.
+
+from functools import lru_cache
+
+from .base import consume
+from .board import MINE
+from .events import MISSING, EventDicts, cell_index
+
+CLOSED, FLAG, QM, OPENED = range(4)
+
+OPEN = tuple("open_{}".format(number) for number in range(9))
+
+LEFT, RIGHT, MIDDLE, SHIFT = 1, 2, 4, 8
+
+# buttons that go down (DOWN) and up (UP) with each mouse event
+DOWN = {
+    "lmb_down": LEFT,
+    "rmb_down": RIGHT,
+    "mmb_down": MIDDLE,
+    "shift_lmb_down": LEFT | SHIFT,
+}
+UP = {
+    "lmb_up": LEFT | SHIFT,
+    "rmb_up": RIGHT,
+    "mmb_up": MIDDLE,
+}
+
+
+@lru_cache(maxsize=256)
+def neighbours(rows, cols):
+    # the neighbours of every cell, by index (row * cols + col), in reading
+    # order
+    result = []
+    for row in range(rows):
+        for col in range(cols):
+            result.append(
+                tuple(
+                    other_row * cols + other_col
+                    for other_row in range(max(row - 1, 0), min(row + 2, rows))
+                    for other_col in range(max(col - 1, 0), min(col + 2, cols))
+                    if (other_row, other_col) != (row, col)
+                )
+            )
+    return result
+
+
+def press_buttons(buttons, subtype):
+    # The buttons (LEFT | RIGHT...) that are down around a mouse event, as
+    # (before, after), given the ones that were down until then. EVF's chord
+    # (the second button going down) is left and right, no matter which came
+    # first. A button that goes up without being down (RMV doesn't record the
+    # first button going down) is down before the event.
+    if subtype in DOWN:
+        return buttons, buttons | DOWN[subtype]
+    if subtype in UP:
+        if not buttons & UP[subtype]:
+            buttons |= UP[subtype] & ~SHIFT
+        return buttons, buttons & ~UP[subtype]
+    if subtype == "chord":
+        return buttons, buttons | LEFT | RIGHT
+    return buttons, buttons
+
+
+class Game:
+    # The state of a game. Feed it mouse events with mouse(), which returns
+    # the board and terminate events they cause, as added to events (an
+    # EventDicts, EventList or EventTable). Once the game is over, mouse
+    # events are ignored.
+    #
+    # click is the click the last mouse event made: "left" (the left button
+    # going up), "right" (the right button going down) or "chord" (buttons
+    # going down together, see start_chord()), None if it made none.
+    #
+    # board is a board.Bitboard, cell_size the size of a cell in the mouse
+    # events' coordinates.
+
+    def __init__(self, board, cell_size=16, questionmarks=False, events=None):
+        self.rows = board.rows
+        self.cols = board.cols
+        self.cell_size = cell_size
+        self.questionmarks = questionmarks
+        self.events = EventDicts() if events is None else events
+        # the number of every cell, MINE for mines
+        self.numbers = board.numbers()
+        self.neighbours = neighbours(self.rows, self.cols)
+        self.state = bytearray(self.rows * self.cols)
+        self.remaining = self.rows * self.cols - len(board)
+        self.buttons = 0
+        self.click = None
+        # whether the buttons that are down make a chord, and whether it's
+        # done already (and releasing the other button does nothing)
+        self.chording = False
+        self.chorded = False
+        self.pressed = []
+        # the cell the mouse was on when pressed was last updated
+        self.pressed_at = None
+        self.result = None
+
+    def cell_at(self, xpos, ypos):
+        # index of the cell at these coordinates, or None
+        cell = cell_index(xpos, ypos, self.rows, self.cols, self.cell_size)
+        return None if cell == MISSING else cell
+
+    def flag(self, row, col):
+        # for preflags
+        self.state[row * self.cols + col] = FLAG
+
+    def mouse(self, subtype, xpos, ypos):
+        return self.mouse_cell(subtype, self.cell_at(xpos, ypos))
+
+    def mouse_cell(self, subtype, cell):
+        # like mouse(), with the cell (or None) already known - see
+        # events.cell_column
+        if self.result is not None:
+            return []
+        out = []
+        self.click = None
+        before, buttons = press_buttons(self.buttons, subtype)
+        # RMV's first click only has the button going up
+        missing_down = before != self.buttons
+        self.buttons = buttons
+        if subtype == "move":
+            if self.chording or buttons & LEFT:
+                self.press(cell, out)
+        elif subtype == "lmb_down":
+            self.start_chord(bool(buttons & (RIGHT | MIDDLE)))
+            self.press(cell, out)
+        elif subtype == "rmb_down":
+            if buttons & LEFT:
+                self.start_chord(True)
+                self.press(cell, out)
+            elif not buttons & MIDDLE:
+                self.click = "right"
+                if cell is not None:
+                    self.toggle(cell, out)
+        elif subtype in ("mmb_down", "shift_lmb_down", "chord"):
+            self.start_chord(True)
+            self.press(cell, out)
+        elif subtype == "lmb_up":
+            if not (self.chording or self.chorded):
+                self.click = "left"
+                if missing_down:
+                    self.press(cell, out)
+            self.release(cell, out)
+        elif subtype in ("rmb_up", "mmb_up"):
+            if self.chording:
+                self.release(cell, out)
+        elif subtype == "preflag":
+            if cell is not None and self.state[cell] == CLOSED:
+                self.state[cell] = FLAG
+        # anything else (EVF's lmb, rmb and mmb) doesn't change the board
+        if not buttons:
+            self.chording = self.chorded = False
+        return out
+
+    def start_chord(self, chording):
+        # a chord is one click, however many buttons join it
+        if chording and not self.chording:
+            self.click = "chord"
+        self.chording = chording
+        self.chorded = False
+        # redraw the pressed cells even if the mouse doesn't move
+        self.pressed_at = None
+
+    def add_board(self, subtype, cell, out):
+        row, col = divmod(cell, self.cols)
+        out.append(self.events.add_board(subtype, row, col))
+
+    def press(self, cell, out):
+        # shows the cells under the mouse as pressed, and the ones that
+        # aren't any more as they were. The clients redraw everything that is
+        # pressed whenever the mouse moves to another cell.
+        if self.chorded:
+            cell = None
+        if cell == self.pressed_at:
+            return
+        state = self.state
+        for other in self.pressed:
+            self.add_board("qm" if state[other] == QM else "closed", other, out)
+        if cell is None:
+            pressed = []
+        elif self.chording:
+            pressed = [
+                other
+                # the cell under the mouse last, like the clients do it
+                for other in self.neighbours[cell] + (cell,)
+                if state[other] in (CLOSED, QM)
+            ]
+        elif state[cell] in (CLOSED, QM):
+            pressed = [cell]
+        else:
+            pressed = []
+        for other in pressed:
+            self.add_board(
+                "pressed_qm" if state[other] == QM else "pressed", other, out
+            )
+        self.pressed = pressed
+        self.pressed_at = cell
+
+    def forget_pressed(self):
+        # for cells that are opened instead of being shown as they were
+        self.pressed = []
+        self.pressed_at = None
+
+    def release(self, cell, out):
+        if self.chorded:
+            return
+        if self.chording:
+            self.chorded = True
+            self.chording = False
+            if cell is not None and self.can_chord(cell):
+                self.forget_pressed()
+                for other in self.neighbours[cell]:
+                    if not self.open(other, out):
+                        return
+                return
+            self.press(None, out)
+            return
+        if cell is not None and cell in self.pressed:
+            self.forget_pressed()
+            self.open(cell, out)
+            return
+        self.press(None, out)
+
+    def can_chord(self, cell):
+        state = self.state
+        return state[cell] == OPENED and self.numbers[cell] == sum(
+            1 for other in self.neighbours[cell] if state[other] == FLAG
+        )
+
+    def toggle(self, cell, out):
+        state = self.state
+        if state[cell] == CLOSED:
+            state[cell] = FLAG
+            self.add_board("flag", cell, out)
+        elif state[cell] == FLAG:
+            if self.questionmarks:
+                state[cell] = QM
+                self.add_board("qm", cell, out)
+            else:
+                state[cell] = CLOSED
+                self.add_board("closed", cell, out)
+        elif state[cell] == QM:
+            state[cell] = CLOSED
+            self.add_board("closed", cell, out)
+
+    def open(self, cell, out):
+        # Opens cell, and the opening it's in if it's a 0. Returns False if
+        # the game is over.
+        state = self.state
+        numbers = self.numbers
+        neighbours = self.neighbours
+        if state[cell] not in (CLOSED, QM):
+            return True
+        if numbers[cell] == MINE:
+            state[cell] = OPENED
+            self.add_board("open_blast", cell, out)
+            self.end("blast", out)
+            return False
+        # depth first, without recursion - openings on large boards are
+        # too deep for that
+        stack = [iter((cell,))]
+        while stack:
+            for other in stack[-1]:
+                if state[other] not in (CLOSED, QM):
+                    continue
+                state[other] = OPENED
+                self.remaining -= 1
+                number = numbers[other]
+                self.add_board(OPEN[number], other, out)
+                if number == 0:
+                    stack.append(iter(neighbours[other]))
+                    break
+            else:
+                stack.pop()
+        if not self.remaining:
+            self.end("win", out)
+            return False
+        return True
+
+    def end(self, how, out):
+        self.result = how
+        self.forget_pressed()
+        out.append(self.events.add_terminate(how))
+
+
+def simulate(replay, events=None):
+    # Yields the mouse events of replay, each followed by the board and
+    # terminate events it causes. Board and terminate events replay already
+    # has (as in RMV) are replaced. events is where the events are added, see
+    # events.py - by default, this yields dicts without keeping them.
+    #
+    # The events need to be parsed (so no metadata_only replays).
+    if events is None:
+        events = EventDicts()
+    game = Game(
+        replay.board,
+        replay.get_cell_size(),
+        replay.properties.get("questionmarks", False),
+        events,
+    )
+    base = replay.CELL_BASE
+    for row, col in getattr(replay, "preflags", ()):
+        game.flag(row - base, col - base)
+    add_mouse = events.add_mouse
+    mouse_cell = game.mouse_cell
+    # the cells in one pass, rather than one mouse event at a time
+    for event, cell in zip(replay.events, replay.cell_column()):
+        if event["type"] != "mouse":
+            continue
+        subtype = event["subtype"]
+        yield add_mouse(
+            subtype,
+            event["gametime"],
+            event["xpos"],
+            event["ypos"],
+            event.get("nFlags"),
+        )
+        for result in mouse_cell(subtype, None if cell == MISSING else cell):
+            yield result
+
+
+def with_board_events(replay):
+    # all events of simulate(), in the replay's kind of event container
+    events = replay.new_events()
+    consume(simulate(replay, events))
+    return events
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from .base import consume
+from .exceptions import LimitExceededError, TruncatedReplayError
+from .reader import BufferReader
+
+
+class IncrementalParser:
+    # A parser that is fed a replay piece by piece, as it arrives, and does
+    # no I/O itself:
+    #
+    #     parser = IncrementalParser(RMVReplay)
+    #     for chunk in chunks:
+    #         events = parser.feed(chunk)
+    #         ...
+    #     events = parser.close()
+    #     replay = parser.replay
+    #
+    # The header is decoded once it is complete, and .replay is set then
+    # (with the header fields, but without events and anything after them).
+    # Incomplete headers are tried again whenever the data fed so far has
+    # doubled. Invalid headers raise right away - an unknown format version,
+    # level or mode doesn't need the rest of the file.
+    #
+    # feed() and close() return the events that could be decoded from
+    # complete records since the last call, as dicts. Events are decoded as
+    # they arrive, except for freesweeper's AVF replays, which store part of
+    # the event times after the events - they are decoded once close() is
+    # called. close() also reads everything after the events, and raises
+    # TruncatedReplayError if the file is incomplete.
+    #
+    # Decoded bytes are dropped, so only the header (until it is complete)
+    # and the last incomplete record are kept in memory - and the events
+    # themselves, unless keep_events is False.
+    #
+    # limits (see base.Limits) are checked as the data arrives. With
+    # keep_events=False, events are dropped from replay.events once feed()
+    # or close() returned them, and aren't limited.
+
+    def __init__(
+        self, cls, name=None, event_table=False, limits=None, keep_events=True
+    ):
+        self.cls = cls
+        self.name = name
+        self.event_table = event_table
+        self.limits = cls.LIMITS if limits is None else limits
+        if not keep_events and event_table:
+            raise ValueError("event tables can't drop events")
+        self.keep_events = keep_events
+        self.buffer = bytearray()
+        # bytes fed so far, and how many of them were dropped from the
+        # start of buffer
+        self.size = 0
+        self.offset = 0
+        self.replay = None
+        # the header is only decoded again once buffer has this many bytes
+        self.header_size = 0
+        # where the next event record starts in buffer, None if the events
+        # can't be decoded as they arrive
+        self.pos = None
+        self.events_done = False
+        # carried from one decoder to the next, see BaseReplay.decode_events
+        self.state = {}
+        self.reported = 0
+        self.closed = False
+
+    def feed(self, chunk):
+        if self.closed:
+            raise ValueError("feed() after close()")
+        self.buffer += chunk
+        self.size += len(chunk)
+        max_file_size = self.limits.max_file_size
+        if max_file_size is not None and self.size > max_file_size:
+            raise LimitExceededError(
+                self.replay or self.name,
+                "more than the limit of {} bytes".format(max_file_size),
+            )
+        if self.replay is None and not self.decode_header(final=False):
+            return []
+        self.decode_events()
+        return self.new_events()
+
+    def close(self):
+        if self.closed:
+            return []
+        self.closed = True
+        if self.replay is None:
+            self.decode_header(final=True)
+        replay = self.replay
+        # whatever follows the events is read from an immutable copy, so that
+        # the replay doesn't end up with bytearrays in it
+        data = BufferReader(
+            bytes(self.buffer), replay, self.limits.max_scan_distance, self.offset
+        )
+        with replay.invalid_data():
+            if self.pos is None:
+                # events that couldn't be decoded as they arrived - nothing
+                # was dropped then
+                data.seek(replay.events_offset)
+                replay.process_body(data)
+            else:
+                if not self.events_done:
+                    raise data.truncated("events")
+                data.seek(self.pos)
+                replay.finish_events(data)
+        self.buffer = None
+        return self.new_events()
+
+    def decode_header(self, final):
+        # returns whether the header is complete. Incomplete headers are
+        # tried again once the buffer doubled, so that small chunks don't
+        # make this quadratic.
+        size = len(self.buffer)
+        if not final and size < self.header_size:
+            return False
+        replay = self.cls.__new__(self.cls)
+        replay.setup(self.name, event_table=self.event_table, limits=self.limits)
+        # read() copies from memoryviews, so the replay gets bytes, and the
+        # view is released before the buffer grows again
+        with memoryview(self.buffer) as view:
+            try:
+                with replay.invalid_data():
+                    replay.process_header(
+                        BufferReader(view, replay, self.limits.max_scan_distance)
+                    )
+            except TruncatedReplayError:
+                if final:
+                    raise
+                self.header_size = 2 * size
+                return False
+        replay.events = replay.new_events()
+        self.replay = replay
+        self.pos = replay.events_offset
+        return True
+
+    def decode_events(self):
+        # decodes every complete record, and drops them from the buffer. A
+        # decoder is only asked for the next event once the record is all
+        # there, and is closed before the buffer grows again.
+        if self.pos is None or self.events_done:
+            return
+        replay = self.replay
+        buf = self.buffer
+        size = len(buf)
+        pos = self.pos
+        if pos >= size:
+            # nothing to decode - not even whether the events can be
+            # decoded as they arrive
+            return
+        event_record = replay.event_record
+        data = BufferReader(buf, replay, self.limits.max_scan_distance, self.offset)
+        data.seek(pos)
+        decoder = replay.decode_events(data, replay.events, self.state)
+        try:
+            while pos < size:
+                record = event_record(buf, pos)
+                if record is None:
+                    # left for close()
+                    self.pos = None
+                    return
+                record_size, last = record
+                if pos + record_size > size:
+                    break
+                pos += record_size
+                if last:
+                    # also lets the decoder read what it needs after the
+                    # events
+                    consume(decoder)
+                    pos = data.tell()
+                    self.events_done = True
+                    break
+                next(decoder)
+        finally:
+            decoder.close()
+        del buf[:pos]
+        self.offset += pos
+        self.pos = 0
+        if self.keep_events:
+            replay.check_events(len(replay.events))
+
+    def new_events(self):
+        events = self.replay.events
+        start = self.reported
+        new = list(events[start:])
+        if self.keep_events:
+            self.reported = len(events)
+        else:
+            # the decoder keeps adding to the same container
+            del events[:]
+            self.reported = 0
+        return new
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from itertools import islice
+import json
+import os
+import sqlite3
+import threading
+
+from .batch import parse_many, scan
+from .mime_types import EXTENSIONS, supported
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replays (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    format TEXT,
+    level TEXT,
+    mode TEXT,
+    nonflagging INTEGER,
+    questionmarks INTEGER,
+    rows INTEGER,
+    cols INTEGER,
+    mines INTEGER,
+    bbbv INTEGER,
+    timeth INTEGER,
+    player TEXT,
+    token TEXT,
+    boardgen_time REAL,
+    properties TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS replays_level_timeth ON replays (level, timeth);
+CREATE INDEX IF NOT EXISTS replays_player ON replays (player);
+CREATE INDEX IF NOT EXISTS replays_bbbv ON replays (bbbv);
+"""
+
+# everything but path, mtime_ns and size, in the order of the table
+FIELDS = (
+    "format",
+    "level",
+    "mode",
+    "nonflagging",
+    "questionmarks",
+    "rows",
+    "cols",
+    "mines",
+    "bbbv",
+    "timeth",
+    "player",
+    "token",
+    "boardgen_time",
+    "properties",
+    "error",
+)
+COLUMNS = ("path", "mtime_ns", "size") + FIELDS
+
+# replays whose stat is compared with the index at once, and rows written per
+# transaction. SQLite allows 999 parameters per statement in old versions.
+BATCH_SIZE = 500
+
+# what a refresh did, in numbers of files
+RefreshStats = namedtuple(
+    "RefreshStats", ("added", "updated", "removed", "unchanged", "failed")
+)
+
+
+def replay_fields(replay):
+    # the values of FIELDS for a parsed replay
+    properties = replay.properties
+    try:
+        token = replay.get_best_token_source()
+    except (KeyError, AttributeError):
+        token = None
+    return (
+        type(replay).__name__,
+        properties.get("level"),
+        properties.get("mode"),
+        properties.get("nonflagging"),
+        properties.get("questionmarks"),
+        replay.rows,
+        replay.cols,
+        replay.num_mines,
+        replay.bbbv,
+        replay.timeth,
+        replay.get_player_name(),
+        token,
+        replay.get_boardgen_time().timestamp(),
+        json.dumps(properties, sort_keys=True),
+        None,
+    )
+
+
+def error_fields(error):
+    return (None,) * (len(FIELDS) - 1) + ("{}: {}".format(type(error).__name__, error),)
+
+
+class ReplayIndex:
+    # An SQLite index of the header fields of all replays in some
+    # directories, for queries like "all expert NF games by X under 40s".
+    #
+    # refresh() brings it up to date: only files whose mtime or size changed
+    # since the last refresh are parsed again, in parallel (see
+    # batch.parse_many), and files that are gone are removed. Files that fail
+    # to parse are kept with their error, so that they aren't retried until
+    # they change.
+    #
+    # find() covers simple queries, anything else can go through .db
+    # directly.
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def refresh(self, roots, workers=None, chunksize=64, extensions=None):
+        # roots are directories (scanned recursively) or single files.
+        # extensions defaults to those of all supported formats.
+        if isinstance(roots, (str, os.PathLike)):
+            roots = [roots]
+        roots = [os.path.abspath(root) for root in roots]
+        if extensions is None:
+            extensions = {
+                extension
+                for extension, mime_type in EXTENSIONS.items()
+                if mime_type in supported()
+            }
+        counts = dict.fromkeys(RefreshStats._fields, 0)
+        # (mtime_ns, size, whether it's new) of files being parsed
+        pending = {}
+
+        with self.lock:
+            self.db.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)"
+            )
+            self.db.execute("DELETE FROM seen")
+
+            def changed():
+                # the paths that need to be parsed, found batch by batch as
+                # parse_many asks for them
+                for root in roots:
+                    if not os.path.lexists(root):
+                        # deleted, its rows are removed like those of any
+                        # other file that is gone
+                        continue
+                    files = scan(root, extensions)
+                    while True:
+                        batch = list(islice(files, BATCH_SIZE))
+                        if not batch:
+                            break
+                        for path in self.diff(batch, pending, counts):
+                            yield path
+
+            rows = []
+            for result in parse_many(
+                changed(),
+                workers=workers,
+                chunksize=chunksize,
+                metadata_only=True,
+                ordered=False,
+            ):
+                mtime_ns, size, new = pending.pop(result.path)
+                if result.error is None:
+                    try:
+                        fields = replay_fields(result.replay)
+                    except Exception as exc:
+                        fields = error_fields(exc)
+                else:
+                    fields = error_fields(result.error)
+                counts["added" if new else "updated"] += 1
+                if fields[-1] is not None:
+                    counts["failed"] += 1
+                rows.append((result.path, mtime_ns, size) + fields)
+                if len(rows) >= BATCH_SIZE:
+                    self.write(rows)
+                    rows = []
+            self.write(rows)
+
+            for root in roots:
+                counts["removed"] += self.remove_unseen(root)
+            self.db.execute("DELETE FROM seen")
+        return RefreshStats(**counts)
+
+    def diff(self, batch, pending, counts):
+        # records the batch's paths as seen, and returns those that are new
+        # or changed
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO seen VALUES (?)", [(path,) for path, _ in batch]
+            )
+        known = {
+            path: (mtime_ns, size)
+            for path, mtime_ns, size in self.db.execute(
+                "SELECT path, mtime_ns, size FROM replays WHERE path IN ({})".format(
+                    ",".join("?" * len(batch))
+                ),
+                [path for path, _ in batch],
+            )
+        }
+        result = []
+        for path, stat in batch:
+            old = known.get(path)
+            if old == (stat.st_mtime_ns, stat.st_size):
+                counts["unchanged"] += 1
+                continue
+            pending[path] = (stat.st_mtime_ns, stat.st_size, old is None)
+            result.append(path)
+        return result
+
+    def write(self, rows):
+        if not rows:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO replays VALUES ({})".format(
+                    ",".join("?" * len(COLUMNS))
+                ),
+                rows,
+            )
+
+    def remove_unseen(self, root):
+        # removes what used to be root or below it, but isn't any more. Root
+        # may have been either, and may not exist any more.
+        # every path below root sorts between these
+        low = os.path.join(root, "")
+        high = low[:-1] + chr(ord(low[-1]) + 1)
+        with self.db:
+            cursor = self.db.execute(
+                "DELETE FROM replays WHERE (path = ? OR (path >= ? AND path < ?)) "
+                "AND path NOT IN (SELECT path FROM seen)",
+                (root, low, high),
+            )
+        return cursor.rowcount
+
+    def find(self, order_by=None, limit=None, **conditions):
+        # Yields the rows (as dicts) that match all conditions, which are
+        # either column=value, or min_column=value / max_column=value for
+        # ranges (inclusive). Failed files are left out.
+        #
+        #     index.find(level="expert", nonflagging=True, player="X",
+        #                max_timeth=40000, order_by="timeth")
+        clauses = ["error IS NULL"]
+        params = []
+        for key, value in conditions.items():
+            operator = "="
+            column = key
+            if key.startswith("min_") and key[4:] in COLUMNS:
+                operator, column = ">=", key[4:]
+            elif key.startswith("max_") and key[4:] in COLUMNS:
+                operator, column = "<=", key[4:]
+            if column not in COLUMNS:
+                raise ValueError("unknown column {}".format(column))
+            clauses.append("{} {} ?".format(column, operator))
+            params.append(value)
+        query = "SELECT {} FROM replays WHERE {}".format(
+            ", ".join(COLUMNS), " AND ".join(clauses)
+        )
+        if order_by is not None:
+            if order_by.lstrip("-") not in COLUMNS:
+                raise ValueError("unknown column {}".format(order_by))
+            query += " ORDER BY {}{}".format(
+                order_by.lstrip("-"), " DESC" if order_by.startswith("-") else ""
+            )
+        if limit is not None:
+            query += " LIMIT {:d}".format(limit)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        for row in rows:
+            row = dict(zip(COLUMNS, row))
+            row["properties"] = json.loads(row["properties"])
+            yield row
+
+    def errors(self):
+        # (path, error) of the files that failed to parse
+        with self.lock:
+            return self.db.execute(
+                "SELECT path, error FROM replays WHERE error IS NOT NULL ORDER BY path"
+            ).fetchall()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM replays").fetchone()[0]
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
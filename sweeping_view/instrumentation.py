@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+# Optional instrumentation of the parsers: how long each section of a replay
+# took to parse, how many bytes it had, and how many events of each kind
+# there were, collected across many parses:
+#
+#     collector = Collector()
+#     replay = RMVReplay.from_file(path, instrument=collector)
+#     ...
+#     print(collector.to_prometheus())
+#
+# or for every parse, without passing it around:
+#
+#     BaseReplay.INSTRUMENT = Collector(sample_rate=0.01)
+#
+# Without a collector, the parsers only check that there is none, once per
+# section. With sample_rate, only that fraction of parses is timed at all.
+#
+# The sections are, in file order, those of header, player, board,
+# preflags, properties, extension_properties, events and footer that a
+# format has - bytes that belong to none of them are counted in the section
+# before. Events are only counted if the replay stores them, not for
+# metadata_only parses or streamed events.
+
+from collections import Counter
+import json
+from random import random
+import threading
+from time import perf_counter
+
+from .events import SUBTYPES, TYPES, EventTable
+
+SECTIONS = (
+    "header",
+    "player",
+    "board",
+    "preflags",
+    "properties",
+    "extension_properties",
+    "events",
+    "footer",
+)
+
+
+def event_counts(events):
+    # Counter of (type, subtype) of events, subtype being the "how" of
+    # terminate events and None for events without one
+    if isinstance(events, EventTable):
+        codes = Counter(zip(events.type, events.subtype))
+        return Counter(
+            {
+                (TYPES[type_], SUBTYPES[subtype] if subtype >= 0 else None): count
+                for (type_, subtype), count in codes.items()
+            }
+        )
+    return Counter(
+        (event["type"], event.get("subtype", event.get("how"))) for event in events
+    )
+
+
+class ParseProfile:
+    # what one parse of a replay took. sections maps the name of each
+    # section to [seconds, bytes], events is an event_counts() Counter or
+    # None, error the exception parsing failed with, if it did.
+    #
+    # Replays keep theirs as .profile, it is handed to the collector when
+    # parsing ends.
+
+    def __init__(self, collector, replay):
+        self.collector = collector
+        self.format = type(replay).__name__
+        self.mode = "metadata_only" if replay.metadata_only else "full"
+        self.name = replay.source_name
+        self.marks = []
+        self.sections = {}
+        self.events = None
+        self.error = None
+        self.seconds = None
+        self.size = None
+
+    def start(self, pos):
+        self.marks = [(SECTIONS[0], perf_counter(), pos)]
+
+    def mark(self, section, pos):
+        # the parser reached the start of section, at pos
+        self.marks.append((section, perf_counter(), pos))
+
+    def finish(self, pos, events=None, error=None):
+        end = perf_counter()
+        marks = self.marks
+        marks.append((None, end, pos))
+        for (section, started, begin), (_, ended, stop) in zip(marks, marks[1:]):
+            entry = self.sections.setdefault(section, [0.0, 0])
+            entry[0] += ended - started
+            entry[1] += stop - begin
+        self.seconds = end - marks[0][1]
+        self.size = pos - marks[0][2]
+        self.marks = []
+        self.error = error
+        if events is not None:
+            self.events = event_counts(events)
+        # dropped, so that replays can still be pickled
+        collector, self.collector = self.collector, None
+        collector.record(self)
+
+    @property
+    def result(self):
+        return "ok" if self.error is None else type(self.error).__name__
+
+
+class Collector:
+    # Aggregates ParseProfiles: per format and mode, the number of parses by
+    # result ("ok" or the exception's class name) and the seconds and bytes
+    # they took, the same per section, and event counts per format. Safe to
+    # share between threads. Processes each need their own - merge() adds up
+    # their snapshot()s.
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (format, mode, result) -> [count, seconds, bytes]
+            self.parses = {}
+            # (format, mode, section) -> [count, seconds, bytes]
+            self.sections = {}
+            # (format, type, subtype) -> count
+            self.events = Counter()
+
+    def start(self, replay):
+        # a ParseProfile for replay, or None if this parse isn't sampled
+        if self.sample_rate < 1 and random() >= self.sample_rate:
+            return None
+        return ParseProfile(self, replay)
+
+    def record(self, profile):
+        with self.lock:
+            self.add(
+                self.parses,
+                (profile.format, profile.mode, profile.result),
+                1,
+                profile.seconds,
+                profile.size,
+            )
+            for section, (seconds, size) in profile.sections.items():
+                self.add(
+                    self.sections,
+                    (profile.format, profile.mode, section),
+                    1,
+                    seconds,
+                    size,
+                )
+            if profile.events:
+                for (type_, subtype), count in profile.events.items():
+                    self.events[profile.format, type_, subtype] += count
+
+    @staticmethod
+    def add(totals, key, count, seconds, size):
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [count, seconds, size]
+        else:
+            entry[0] += count
+            entry[1] += seconds
+            entry[2] += size
+
+    def snapshot(self):
+        # everything collected so far, as lists of dicts that json can dump
+        with self.lock:
+            return {
+                "parses": [
+                    dict(
+                        format=format_,
+                        mode=mode,
+                        result=result,
+                        count=count,
+                        seconds=seconds,
+                        bytes=size,
+                    )
+                    for (format_, mode, result), (count, seconds, size) in sorted(
+                        self.parses.items()
+                    )
+                ],
+                "sections": [
+                    dict(
+                        format=format_,
+                        mode=mode,
+                        section=section,
+                        count=count,
+                        seconds=seconds,
+                        bytes=size,
+                    )
+                    for (format_, mode, section), (count, seconds, size) in sorted(
+                        self.sections.items(), key=section_order
+                    )
+                ],
+                "events": [
+                    dict(format=format_, type=type_, subtype=subtype, count=count)
+                    for (format_, type_, subtype), count in sorted(
+                        self.events.items(), key=lambda item: str(item[0])
+                    )
+                ],
+            }
+
+    def merge(self, snapshot):
+        # adds up a snapshot(), e.g. one sent back by a worker process
+        with self.lock:
+            for entry in snapshot["parses"]:
+                self.add(
+                    self.parses,
+                    (entry["format"], entry["mode"], entry["result"]),
+                    entry["count"],
+                    entry["seconds"],
+                    entry["bytes"],
+                )
+            for entry in snapshot["sections"]:
+                self.add(
+                    self.sections,
+                    (entry["format"], entry["mode"], entry["section"]),
+                    entry["count"],
+                    entry["seconds"],
+                    entry["bytes"],
+                )
+            for entry in snapshot["events"]:
+                key = (entry["format"], entry["type"], entry["subtype"])
+                self.events[key] += entry["count"]
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix="sweeping_view"):
+        # the text exposition format, all metrics are counters
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, help_, entries, labels, field):
+            name = "{}_{}".format(prefix, name)
+            lines.append("# HELP {} {}".format(name, help_))
+            lines.append("# TYPE {} counter".format(name))
+            for entry in entries:
+                lines.append(
+                    "{}{{{}}} {}".format(
+                        name,
+                        ",".join(
+                            '{}="{}"'.format(label, escape(entry[label]))
+                            for label in labels
+                        ),
+                        entry[field],
+                    )
+                )
+
+        parse_labels = ("format", "mode", "result")
+        section_labels = ("format", "mode", "section")
+        metric(
+            "parses_total",
+            "Replays parsed.",
+            snapshot["parses"],
+            parse_labels,
+            "count",
+        )
+        metric(
+            "parse_seconds_total",
+            "Time spent parsing replays.",
+            snapshot["parses"],
+            parse_labels,
+            "seconds",
+        )
+        metric(
+            "parse_bytes_total",
+            "Bytes of replays parsed.",
+            snapshot["parses"],
+            parse_labels,
+            "bytes",
+        )
+        metric(
+            "section_seconds_total",
+            "Time spent parsing each section of replays.",
+            snapshot["sections"],
+            section_labels,
+            "seconds",
+        )
+        metric(
+            "section_bytes_total",
+            "Bytes of each section of replays parsed.",
+            snapshot["sections"],
+            section_labels,
+            "bytes",
+        )
+        metric(
+            "events_total",
+            "Events in replays parsed.",
+            snapshot["events"],
+            ("format", "type", "subtype"),
+            "count",
+        )
+        return "\n".join(lines) + "\n"
+
+
+def section_order(item):
+    (format_, mode, section), _ = item
+    rank = SECTIONS.index(section) if section in SECTIONS else len(SECTIONS)
+    return format_, mode, rank, section
+
+
+def escape(value):
+    if value is None:
+        return ""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,24 +1,123 @@
-from .avf import AVFReplay
+from importlib import import_module
+import os
+import sys
+
+from .base import BaseReplay
 from .exceptions import MimeTypeNotImplemented, UnknownMimeType
-from .evf import EVFReplay
-from .rmv import RMVReplay
 
-MIME_TYPES = {
-    "application/x-minesweeper-arbiter": AVFReplay,
-    "application/x-viennasweeper": RMVReplay,
-    "application/x-metasweeper": EVFReplay,
+# (module, class) of each format. The modules are only imported when their
+# class is needed, so that importing this module is cheap. MIME_TYPES and the
+# classes themselves are available as attributes, too, see __getattr__.
+FORMATS = {
+    "application/x-minesweeper-arbiter": ("avf", "AVFReplay"),
+    "application/x-viennasweeper": ("rmv", "RMVReplay"),
+    "application/x-metasweeper": ("evf", "EVFReplay"),
     "application/x-minesweeper-x": NotImplemented,
 }
 
 
+# sniffing is tried in this order, most specific first
+DETECTION_ORDER = (
+    "application/x-viennasweeper",
+    "application/x-metasweeper",
+    "application/x-minesweeper-arbiter",
+)
+
+EXTENSIONS = {
+    ".avf": "application/x-minesweeper-arbiter",
+    ".rmv": "application/x-viennasweeper",
+    ".evf": "application/x-metasweeper",
+    ".mvf": "application/x-minesweeper-x",
+}
+
+
+def _load(fmt):
+    # fmt is (module, class), or what MIME_TYPES has - a class or
+    # NotImplemented
+    if not isinstance(fmt, tuple):
+        return fmt
+    module, name = fmt
+    return getattr(import_module("." + module, __package__), name)
+
+
+def __getattr__(name):
+    if name == "MIME_TYPES":
+        # built once, so that classes can be added to it - see _formats()
+        mime_types = {mime_type: _load(fmt) for mime_type, fmt in FORMATS.items()}
+        globals()["MIME_TYPES"] = mime_types
+        return mime_types
+    for fmt in FORMATS.values():
+        if fmt is not NotImplemented and fmt[1] == name:
+            return _load(fmt)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__ (PEP 562)
+    MIME_TYPES = __getattr__("MIME_TYPES")
+    globals().update(
+        (cls.__name__, cls) for cls in MIME_TYPES.values() if cls is not NotImplemented
+    )
+
+
+def _formats():
+    # MIME_TYPES once it was built, since classes may have been added to it
+    # (mime_types.MIME_TYPES[mime_type] = cls), FORMATS before that
+    return globals().get("MIME_TYPES", FORMATS)
+
+
 def get_class(mime_type):
-    cls_or_nimpl = MIME_TYPES.get(mime_type, None)
-    if cls_or_nimpl is None:
+    fmt = _formats().get(mime_type, None)
+    if fmt is None:
         raise UnknownMimeType(mime_type)
-    if cls_or_nimpl is NotImplemented:
+    if fmt is NotImplemented:
         raise MimeTypeNotImplemented(mime_type)
-    return cls_or_nimpl
+    return _load(fmt)
 
 
 def supported():
-    return [mt for mt, cls in MIME_TYPES.items() if cls is not NotImplemented]
+    return [mt for mt, fmt in _formats().items() if fmt is not NotImplemented]
+
+
+def get_class_for_filename(filename):
+    extension = os.path.splitext(os.fspath(filename))[1].lower()
+    mime_type = EXTENSIONS.get(extension, None)
+    if mime_type is None:
+        raise UnknownMimeType(extension)
+    return get_class(mime_type)
+
+
+def _read_header(source, size):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            return file.read(size)
+    if hasattr(source, "read"):
+        pos = source.tell()
+        try:
+            return source.read(size)
+        finally:
+            source.seek(pos)
+    return bytes(source[:size])
+
+
+def detect_mime_type(source):
+    # Looks at the first few hundred bytes of source (a filename, a seekable
+    # binary file, or bytes-like), and returns the mime type of the replay
+    # format they belong to. Raises UnknownMimeType if there is none.
+    header = _read_header(source, BaseReplay.SNIFF_SIZE)
+    for mime_type in DETECTION_ORDER:
+        cls = get_class(mime_type)
+        size = cls.sniff_size(header)
+        if size > len(header):
+            header = _read_header(source, size)
+        if cls.sniff(header):
+            return mime_type
+    raise UnknownMimeType(
+        "(not detected{})".format(
+            ": " + os.fspath(source) if isinstance(source, (str, os.PathLike)) else ""
+        )
+    )
+
+
+def detect(source):
+    return get_class(detect_mime_type(source))
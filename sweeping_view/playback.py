@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# Seeking in replays, for viewers that jump to any point in time.
+#
+# A Playback is built once per replay. It keeps the board events as columns
+# (when, which cell, which state), and a snapshot of the board every interval
+# board events, one byte per cell. The board at any time is then the
+# snapshot before it, plus at most interval board events, found by bisecting
+# the times.
+
+from array import array
+from bisect import bisect_right
+
+from .events import BOARD, EventTable
+from .game import simulate
+
+# what a cell can look like, by code. Every board event sets the cell to the
+# state of the same name.
+STATES = (
+    "closed",
+    "pressed",
+    "pressed_qm",
+    "qm",
+    "flag",
+    "open_0",
+    "open_1",
+    "open_2",
+    "open_3",
+    "open_4",
+    "open_5",
+    "open_6",
+    "open_7",
+    "open_8",
+    "open_blast",
+    # RMV's board event 14, an opened cell without its number
+    "open",
+)
+STATE_CODES = {name: code for code, name in enumerate(STATES)}
+CLOSED = STATE_CODES["closed"]
+FLAG = STATE_CODES["flag"]
+
+
+def has_board_events(events):
+    if isinstance(events, EventTable):
+        return BOARD in events.type
+    return any(event["type"] == "board" for event in events)
+
+
+class Playback:
+    # replay's board and mouse over time. Board events are taken from the
+    # replay if it has them (RMV), and simulated with game.simulate otherwise
+    # - or always, with simulate_board=True. Board events happen at the time
+    # of the mouse event that caused them.
+    #
+    # state_at() returns the board as bytes, one per cell in reading order,
+    # with the codes in STATES.
+
+    def __init__(self, replay, interval=256, simulate_board=None):
+        if replay.events is None:
+            raise ValueError("{} has no events".format(replay))
+        self.rows = replay.rows
+        self.cols = replay.cols
+        self.interval = interval
+        if simulate_board is None:
+            simulate_board = not has_board_events(replay.events)
+        events = simulate(replay) if simulate_board else replay.events
+
+        state = bytearray(self.rows * self.cols)
+        base = replay.CELL_BASE
+        for row, col in getattr(replay, "preflags", ()):
+            state[(row - base) * self.cols + col - base] = FLAG
+        self.snapshots = [bytes(state)]
+
+        # board events
+        self.times = array("q")
+        self.cells = array("i")
+        self.states = bytearray()
+        # mouse events
+        self.mouse_times = array("q")
+        self.mouse_subtypes = []
+        self.xpos = array("i")
+        self.ypos = array("i")
+        self.result = None
+
+        gametime = 0
+        for event in events:
+            type_ = event["type"]
+            if type_ == "mouse":
+                # AVF's end marker has a negative gametime
+                if event["gametime"] < 0:
+                    continue
+                # never backwards, so that bisecting works
+                gametime = max(gametime, event["gametime"])
+                self.mouse_times.append(gametime)
+                self.mouse_subtypes.append(event["subtype"])
+                self.xpos.append(event["xpos"])
+                self.ypos.append(event["ypos"])
+            elif type_ == "board":
+                cell = event["row"] * self.cols + event["col"]
+                code = STATE_CODES[event["subtype"]]
+                state[cell] = code
+                self.times.append(gametime)
+                self.cells.append(cell)
+                self.states.append(code)
+                if len(self.times) % interval == 0:
+                    self.snapshots.append(bytes(state))
+            elif type_ == "terminate":
+                self.result = event["how"]
+        self.duration = gametime
+
+    def __len__(self):
+        # the number of board events
+        return len(self.times)
+
+    def board_events_at(self, ms):
+        # how many board events happened up to and including ms
+        return bisect_right(self.times, ms)
+
+    def state_after(self, count):
+        # the board after the first count board events
+        if not 0 <= count <= len(self.times):
+            raise IndexError("board event index out of range")
+        snapshot = count // self.interval
+        state = bytearray(self.snapshots[snapshot])
+        cells = self.cells
+        states = self.states
+        for index in range(snapshot * self.interval, count):
+            state[cells[index]] = states[index]
+        return bytes(state)
+
+    def state_at(self, ms):
+        return self.state_after(self.board_events_at(ms))
+
+    def grid_at(self, ms):
+        # the board at ms as rows of state names
+        state = self.state_at(ms)
+        return [
+            [STATES[code] for code in state[row * self.cols : (row + 1) * self.cols]]
+            for row in range(self.rows)
+        ]
+
+    def mouse_at(self, ms):
+        # (subtype, xpos, ypos) of the last mouse event up to ms, or None
+        index = bisect_right(self.mouse_times, ms) - 1
+        if index < 0:
+            return None
+        return self.mouse_subtypes[index], self.xpos[index], self.ypos[index]
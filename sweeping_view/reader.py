@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+import mmap
+import re
+from struct import Struct, error as StructError
+
+from .exceptions import InvalidReplayError, LimitExceededError, TruncatedReplayError
+
+UINT8 = Struct(">B")
+UINT16 = Struct(">H")
+UINT32 = Struct(">I")
+
+
+class BufferReader:
+    # A cursor over a replay that is entirely in memory (bytes, bytearray,
+    # mmap or memoryview). Small fields are read with precompiled structs
+    # straight from the buffer, bigger blocks can be sliced without copying
+    # via view(). read() and friends always return bytes.
+    #
+    # All reads are bounds checked and raise TruncatedReplayError (an
+    # InvalidReplayError) when the data runs out. Searches only look at the
+    # next max_scan bytes, if it is set.
+    #
+    # Positions are relative to the start of data. offset is where data
+    # starts in the file, for readers over what is left of one (see
+    # incremental.py).
+
+    def __init__(self, data, replay=None, max_scan=None, offset=0):
+        if isinstance(data, memoryview) and data.format != "B":
+            data = data.cast("B")
+        self.data = data
+        self.size = len(data)
+        self.pos = 0
+        self.replay = replay
+        self.max_scan = max_scan
+        self.offset = offset
+
+    def truncated(self, what=None):
+        return TruncatedReplayError(
+            self.replay,
+            "unexpected end of file{}".format(" while reading " + what if what else ""),
+        )
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos):
+        if not 0 <= pos <= self.size:
+            raise self.truncated()
+        self.pos = pos
+
+    def skip(self, size):
+        if size < 0:
+            raise InvalidReplayError(
+                self.replay, "can't skip a negative number of bytes ({})".format(size)
+            )
+        self.seek(self.pos + size)
+
+    def remaining(self):
+        return self.size - self.pos
+
+    def read(self, size):
+        end = self.pos + size
+        if end > self.size:
+            raise self.truncated()
+        result = self.data[self.pos : end]
+        self.pos = end
+        if type(result) is memoryview:
+            return result.tobytes()
+        return result
+
+    def read_rest(self):
+        return self.read(self.size - self.pos)
+
+    def view(self, size):
+        # zero-copy slice - release it (or let it go out of scope) before the
+        # underlying buffer is closed/resized
+        end = self.pos + size
+        if end > self.size:
+            raise self.truncated()
+        result = memoryview(self.data)[self.pos : end]
+        self.pos = end
+        return result
+
+    def unpack(self, struct):
+        try:
+            result = struct.unpack_from(self.data, self.pos)
+        except StructError:
+            raise self.truncated()
+        self.pos += struct.size
+        return result
+
+    def uint8(self):
+        if self.pos >= self.size:
+            raise self.truncated()
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def uint16(self):
+        return self.unpack(UINT16)[0]
+
+    def uint24(self):
+        return int.from_bytes(self.read(3), "big")
+
+    def uint32(self):
+        return self.unpack(UINT32)[0]
+
+    def find(self, sub, start=None):
+        # absolute position of sub at or after start (default: the current
+        # position), or -1
+        if start is None:
+            start = self.pos
+        end = self.size
+        if self.max_scan is not None:
+            end = min(end, start + self.max_scan + len(sub))
+        if isinstance(self.data, memoryview):
+            # memoryviews have no find(), but re searches them in place
+            match = re.compile(re.escape(sub)).search(self.data, start, end)
+            return -1 if match is None else match.start()
+        return self.data.find(sub, start, end)
+
+    def search(self, sub, what=None):
+        # like find(), but raises if sub isn't there - TruncatedReplayError if
+        # the data ran out, LimitExceededError if max_scan did
+        pos = self.find(sub)
+        if pos < 0:
+            if self.max_scan is not None and self.pos + self.max_scan < self.size:
+                raise LimitExceededError(
+                    self.replay,
+                    "no {!r}{} within {} bytes".format(
+                        sub, " ({})".format(what) if what else "", self.max_scan
+                    ),
+                )
+            raise self.truncated(what)
+        return pos
+
+    def read_until(self, sub, what=None):
+        # returns everything up to sub and moves past it
+        end = self.search(sub, what)
+        result = self.read(end - self.pos)
+        self.pos = end + len(sub)
+        return result
+
+    def c_string(self):
+        return self.read_until(b"\0", "null-terminated string")
+
+
+def map_file(file):
+    # read-only mmap of an open binary file, falling back to reading it when
+    # that isn't possible (empty files, pipes, file-likes without fileno())
+    mapped = try_map(file)
+    return file.read() if mapped is None else mapped
+
+
+def try_map(file):
+    # read-only mmap of an open binary file, or None if it can't be mapped
+    try:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+@contextmanager
+def mapped_file(filename, use_mmap=True):
+    with open(filename, "rb") as file:
+        data = map_file(file) if use_mmap else file.read()
+        try:
+            yield data
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
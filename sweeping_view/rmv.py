@@ -2,12 +2,28 @@
 
 from datetime import datetime
 import logging
+from struct import Struct, error as StructError
 
 from .base import BaseReplay
-from .exceptions import InvalidReplayError, UnknownFormatVersionError
+from .board import MineList
+from .exceptions import EncodingError, InvalidReplayError, UnknownFormatVersionError
+from .reader import UINT16, UINT32
 
 logger = logging.getLogger(__name__)
 
+# sizes of the sections following the header (see process_buffer)
+SECTION_SIZES = Struct(">HHHHHHIH")
+# board generation timestamp, cols, rows, number of mines
+BOARD = Struct(">IBBH")
+# everything after the event code: gametime (3 bytes) and nFlags share the
+# first 4 bytes, then x and y
+MOUSE_EVENT = Struct(">IHH")
+
+# event code to the size of the event record, including the code
+EVENT_SIZES = {0: 5, 28: 3, 15: 1, 16: 1, 17: 1}
+EVENT_SIZES.update((code, 9) for code in range(1, 8))
+EVENT_SIZES.update((code, 3) for code in (*range(9, 15), *range(18, 28)))
+
 
 class RMVReplay(BaseReplay):
     MODES = {
@@ -67,10 +83,16 @@ class RMVReplay(BaseReplay):
         "token",
     )
 
-    def process_buffer(self, data):
+    @classmethod
+    def sniff(cls, header):
+        # the format version is checked by process_buffer, so that unknown
+        # versions get a proper UnknownFormatVersionError
+        return header[:4] == b"*rmv" and len(header) >= 6 and header[4:6] != b"\0\0"
+
+    def process_header(self, data):
         # header 1
         extension = data.read(4)
-        self.format_version = self.read_int(data.read(2))
+        self.format_version = data.uint16()
 
         if not (1 <= self.format_version <= 2):
             raise UnknownFormatVersionError(self, self.format_version)
@@ -78,67 +100,83 @@ class RMVReplay(BaseReplay):
         self.clone_id = None
         self.major_version_of_clone = None
         if self.format_version >= 2:
-            self.clone_id = self.read_int(data.read(1))
-            self.major_version_of_clone = self.read_int(data.read(1))
+            self.clone_id = data.uint8()
+            self.major_version_of_clone = data.uint8()
 
-        filesize = self.read_int(data.read(4))
+        filesize = data.uint32()
 
         # header 2
+        # six section sizes, then the video and checksum sizes:
+        # v1: result string, version info, player info, board, preflags,
+        #     properties
+        # v2: version info, player info, board, preflags, properties,
+        #     extension properties
+        *sizes, self.video_size, self.checksum_size = data.unpack(SECTION_SIZES)
+        # the video section ends with timeth
+        if self.video_size < 3:
+            raise InvalidReplayError(
+                self, message="Invalid video size {}!".format(self.video_size)
+            )
         if self.format_version == 1:
-            result_str_size = self.read_int(data.read(2))
-        version_info_size = self.read_int(data.read(2))
-        player_info_size = self.read_int(data.read(2))
-        board_size = self.read_int(data.read(2))
-        preflagged_size = self.read_int(data.read(2))
-        properties_size = self.read_int(data.read(2))
-        if self.format_version >= 2:
-            extension_properties_size = self.read_int(data.read(2))
-        vid_size = self.read_int(data.read(4))
-        checksum_size = self.read_int(data.read(2))
-
+            result_str_size, *sizes = sizes
+        else:
+            *sizes, extension_properties_size = sizes
+        (
+            version_info_size,
+            player_info_size,
+            board_size,
+            preflagged_size,
+            properties_size,
+        ) = sizes
+
+        # result string
+        self.result_str = None
         if self.format_version == 1:
-            # result string
-            result_str = data.read(result_str_size)
+            self.result_str = bytes(data.read(result_str_size))
 
         # version information
         self.version_info = data.read(version_info_size)
 
         # player fields
-        num_player_fields = self.read_int(data.read(2))
+        self.mark("player", data)
+        num_player_fields = data.uint16()
         player_fields = []
         player_data = {}
         for _ in range(num_player_fields):
-            field_size = ord(data.read(1))
+            field_size = data.uint8()
             player_fields.append(data.read(field_size))
 
         for field_name, field_value in zip(self.PLAYER_FIELDS, player_fields):
             player_data[field_name] = field_value
 
         # board
-        self.timestamp_boardgen = self.read_int(data.read(4))
-        self.cols = ord(data.read(1))
-        self.rows = ord(data.read(1))
-        self.num_mines = self.read_int(data.read(2))
-        self.mines = []
-        for _ in range(self.num_mines):
-            col = ord(data.read(1))
-            row = ord(data.read(1))
-            self.mines.append((row, col))
+        self.mark("board", data)
+        (
+            self.timestamp_boardgen,
+            self.cols,
+            self.rows,
+            self.num_mines,
+        ) = data.unpack(BOARD)
+        # (col, row) byte pairs
+        mines = data.read(2 * self.num_mines)
+        self.mines = MineList(
+            self.rows, self.cols, bytes(mines), row_first=False, replay=self
+        )
 
         # preflagged
+        self.mark("preflags", data)
         self.preflags = []
         if preflagged_size:
-            num_preflags = self.read_int(data.read(2))
-            for _ in range(num_preflags):
-                col = ord(data.read(1))
-                row = ord(data.read(1))
-                self.preflags.append((row, col))
+            num_preflags = data.uint16()
+            preflags = data.read(2 * num_preflags)
+            self.preflags = list(zip(preflags[1::2], preflags[::2]))
 
         # properties
-        properties = []
+        self.mark("properties", data)
+        properties = self.properties_raw = bytes(data.read(properties_size))
         self.properties = {}
-        for _ in range(properties_size):
-            properties.append(ord(data.read(1)))
+        if properties_size < (7 if self.format_version >= 2 else 4):
+            raise InvalidReplayError(self, message="Not enough properties!")
 
         utf8 = self.format_version >= 2
         self.square_size = 16
@@ -168,7 +206,11 @@ class RMVReplay(BaseReplay):
         }
 
         result_str_field_list = (
-            [i.strip() for i in result_str.decode(encoding).split("#") if i.strip()]
+            [
+                i.strip()
+                for i in self.result_str.decode(encoding).split("#")
+                if i.strip()
+            ]
             if self.format_version == 1
             else []
         )
@@ -180,95 +222,344 @@ class RMVReplay(BaseReplay):
 
         self.extension_properties = {}
         if self.format_version >= 2:
-            num_properties = self.read_int(data.read(2))
+            self.mark("extension_properties", data)
+            num_properties = data.uint16()
             for _ in range(num_properties):
-                key_size = ord(data.read(1))
+                key_size = data.uint8()
                 key = data.read(key_size).decode(encoding)
-                value_size = ord(data.read(1))
+                value_size = data.uint8()
                 value = data.read(value_size)
                 self.extension_properties[key] = value
 
-        self.events = []
-        xpos = None
-        ypos = None
-        gametime = None
-        nFlags = None
-        (xoffs, yoffs) = (12, 56) if self.format_version == 1 else (0, 0)
-        while data:
-            evcode = ord(data.read(1))
-            if evcode == 0:
-                logger.warning("Warning, timestampchange is deprecated!")
-                new_timestamp = self.read_int(data.read(4))
-                self.events.append(
-                    {
-                        "type": "timestamp_change",
-                        "new_timestamp": new_timestamp,
-                    }
-                )
-            elif 1 <= evcode <= 7 or evcode == 28:
-                if evcode == 28:
-                    if gametime is None or xpos is None or ypos is None:
-                        raise InvalidReplayError(
-                            self,
-                            message="first mouse event was reduced mouse move",
-                        )
-                    gametime += ord(data.read(1))
-                    mv = ord(data.read(1))
-                    # two 4bit two's complement signed integers
-                    # n & 7 = last three digits
-                    # n & 8 = the leading digit (that has a negative weight in
-                    # two's complement)
-                    # and of course the xpos change gets shifted into place
-                    xpos += (mv >> 4) & 7
-                    xpos -= (mv >> 4) & 8
-                    ypos += mv & 7
-                    ypos -= mv & 8
+        # the video section is video_size bytes long. The events are followed
+        # by timeth, two bytes we don't know the meaning of and timeth again.
+        # The checksum follows right after it.
+        self.events_offset = data.tell()
+        # where in the video section the client wrote a full move that
+        # encode() would have reduced, so that it can keep it full
+        self.full_moves = []
+
+    def process_body(self, data):
+        self.video_trailer = None
+        if self.metadata_only:
+            self.events = None
+            data.skip(self.video_size - 3)
+            self.mark("footer", data)
+            self.timeth = data.uint24()
+            self.checksum = data.read(self.checksum_size)
+        else:
+            self.events = self.new_events()
+            self.decode_all(data, self.events)
+            self.mark("footer", data)
+            self.finish_events(data)
+
+    def finish_events(self, data):
+        self.timeth = data.uint24()
+        # kept for encode()
+        self.video_trailer = data.read(
+            self.events_offset + self.video_size - data.offset - data.tell()
+        )
+        self.checksum = data.read(self.checksum_size)
+
+    def event_record(self, buf, pos):
+        code = buf[pos]
+        # unknown codes are left to decode_events to complain about
+        return EVENT_SIZES.get(code, 1), 15 <= code <= 17
+
+    def decode_events(self, data, events, state=None):
+        buf = data.data
+        pos = data.pos
+        unpack_mouse = MOUSE_EVENT.unpack_from
+        mouse_event_types = self.MOUSE_EVENT_TYPES
+        add_mouse = events.add_mouse
+        # reduced moves are relative to the mouse event before them, which
+        # a decoder that was closed early may have decoded
+        if state is None:
+            state = {}
+        xpos, ypos, gametime, nFlags = state.get("mouse", (None,) * 4)
+        xoffs, yoffs = (12, 56) if self.format_version == 1 else (0, 0)
+        # v1 has no reduced moves
+        reducible = self.format_version >= 2
+        full_moves = self.full_moves
+        video_start = self.events_offset - data.offset
+        try:
+            while True:
+                evcode = buf[pos]
+                if evcode == 28 or 1 <= evcode <= 7:
+                    if evcode == 28:
+                        if gametime is None or xpos is None or ypos is None:
+                            raise InvalidReplayError(
+                                self,
+                                message="first mouse event was reduced mouse move",
+                            )
+                        gametime += buf[pos + 1]
+                        mv = buf[pos + 2]
+                        pos += 3
+                        # two 4bit two's complement signed integers
+                        # n & 7 = last three digits
+                        # n & 8 = the leading digit (that has a negative weight
+                        # in two's complement)
+                        # and of course the xpos change gets shifted into place
+                        xpos += (mv >> 4) & 7
+                        xpos -= (mv >> 4) & 8
+                        ypos += mv & 7
+                        ypos -= mv & 8
+                    else:
+                        # 3 bytes gametime, 1 byte nFlags, 2 bytes each for
+                        # the coordinates
+                        gametime_nflags, new_x, new_y = unpack_mouse(buf, pos + 1)
+                        new_gametime = gametime_nflags >> 8
+                        new_nflags = gametime_nflags & 0xFF
+                        if (
+                            evcode == 1
+                            and reducible
+                            and gametime is not None
+                            and new_nflags == nFlags
+                            and 0 <= new_gametime - gametime <= 255
+                            and -8 <= new_x - xpos <= 7
+                            and -8 <= new_y - ypos <= 7
+                        ):
+                            full_moves.append(pos - video_start)
+                        pos += 9
+                        gametime = new_gametime
+                        nFlags = new_nflags
+                        xpos = new_x
+                        ypos = new_y
+                    # in RMV v1, these coordinates are relative to the top
+                    # right corner of the client area (ie, the whole UI,
+                    # including borders and top bar)
+                    # in later versions, they are relative to the top left
+                    # corner of the board
+                    yield add_mouse(
+                        mouse_event_types[evcode],
+                        gametime,
+                        xpos - xoffs,
+                        ypos - yoffs,
+                        nFlags,
+                    )
+
+                elif 9 <= evcode <= 14 or 18 <= evcode <= 27:
+                    col = buf[pos + 1]
+                    row = buf[pos + 2]
+                    pos += 3
+                    yield events.add_board(self.BOARD_EVENT_TYPES[evcode], row, col)
+
+                elif 15 <= evcode <= 17:
+                    pos += 1
+                    yield events.add_terminate(self.TERMINATION_EVENT_TYPES[evcode])
+                    break
+
+                elif evcode == 0:
+                    logger.warning("Warning, timestampchange is deprecated!")
+                    (new_timestamp,) = UINT32.unpack_from(buf, pos + 1)
+                    pos += 5
+                    yield events.add_timestamp_change(new_timestamp)
                 else:
-                    gametime = self.read_int(data.read(3))
-                    nFlags = ord(data.read(1))
-                    xpos = self.read_int(data.read(2))
-                    ypos = self.read_int(data.read(2))
-                self.events.append(
-                    {
-                        "type": "mouse",
-                        "subtype": self.MOUSE_EVENT_TYPES[evcode],
-                        "gametime": gametime,
-                        "nFlags": nFlags,
-                        # in RMV v1, these coordinates are relative to the top
-                        # right corner of the client area (ie, the whole UI,
-                        # including borders and top bar)
-                        # in later versions, they are relative to the top left
-                        # corner of the board
-                        "xpos": xpos - xoffs,
-                        "ypos": ypos - yoffs,
-                    }
-                )
-
-            elif 9 <= evcode <= 14 or 18 <= evcode <= 27:
-                col = ord(data.read(1))
-                row = ord(data.read(1))
-                self.events.append(
-                    {
-                        "type": "board",
-                        "subtype": self.BOARD_EVENT_TYPES[evcode],
-                        "col": col,
-                        "row": row,
-                    }
-                )
+                    raise InvalidReplayError(self)
+        except (IndexError, StructError):
+            raise data.truncated("events")
+        finally:
+            state["mouse"] = xpos, ypos, gametime, nFlags
+        data.seek(pos)
+
+    @classmethod
+    def encode(cls, replay):
+        # RMV replays are written back the way they were read (including
+        # which moves were reduced, see full_moves), so unchanged replays
+        # come out byte for byte the same. Replays in other formats
+        # become version 2 files with only their mouse events, without a
+        # checksum. Note that any change invalidates the checksum.
+        if replay.events is None:
+            raise EncodingError(replay, "its events weren't parsed")
+        if isinstance(replay, RMVReplay):
+            version = replay.format_version
+            clone = (replay.clone_id, replay.major_version_of_clone)
+            result_str = replay.result_str
+            version_info = replay.version_info
+            player_data = replay.player_data
+            timestamp_boardgen = replay.timestamp_boardgen
+            preflags = replay.preflags
+            properties_raw = replay.properties_raw
+            square_size = replay.square_size
+            extension_properties = replay.extension_properties
+            video_trailer = replay.video_trailer
+            checksum = replay.checksum
+        else:
+            version = 2
+            clone = (0, 0)
+            result_str = None
+            version_info = replay.version_info
+            if isinstance(version_info, str):
+                version_info = version_info.encode("utf-8")
+            player_data = {"name": replay.get_player_name() or ""}
+            timestamp_boardgen = int(replay.get_boardgen_time().timestamp())
+            preflags = []
+            properties_raw = b""
+            square_size = getattr(replay, "cell_size", 16)
+            extension_properties = {}
+            video_trailer = None
+            checksum = b""
+        properties = replay.properties
+        bbbv = replay.bbbv
+
+        # properties, keeping any unknown bytes as they were
+        modes = {mode: code for code, mode in cls.MODES.items()}
+        levels = {level: code for code, level in cls.LEVELS.items()}
+        mode = properties.get("mode", "normal")
+        if mode not in modes:
+            raise EncodingError(replay, "RMV has no {} mode".format(mode))
+        known = [
+            properties["questionmarks"],
+            properties.get("nonflagging", False),
+            modes[mode],
+            levels[properties["level"]],
+        ]
+        if version >= 2:
+            known += [bbbv & 0xFF, bbbv >> 8, square_size]
+        properties_raw = bytearray(properties_raw.ljust(len(known), b"\0"))
+        properties_raw[: len(known)] = bytes(known)
+
+        utf8 = version >= 2 or (len(properties_raw) > 4 and properties_raw[4])
+        encoding = "utf-8" if utf8 else "cp1252"
 
-            elif 15 <= evcode <= 17:
-                self.events.append(
-                    {
-                        "type": "terminate",
-                        "how": self.TERMINATION_EVENT_TYPES[evcode],
-                    }
+        if version == 1 and result_str is None:
+            result_str = "#{}#".format(
+                "#".join(
+                    "{}:{}".format(key, value)
+                    for key, value in replay.result_str_dict.items()
                 )
-                break
-            else:
-                raise InvalidReplayError(self)
+            ).encode(encoding)
+
+        player_values = [
+            player_data[field].encode(encoding)
+            for field in cls.PLAYER_FIELDS
+            if field in player_data
+        ]
+        player_info = bytearray(UINT16.pack(len(player_values)))
+        for value in player_values:
+            player_info.append(len(value))
+            player_info += value
+
+        mines = replay.mines
+        base = replay.CELL_BASE
+        board = bytearray(
+            BOARD.pack(timestamp_boardgen, replay.cols, replay.rows, len(mines))
+        )
+        for row, col in mines:
+            board += bytes((col - base, row - base))
+
+        # the clients always write this section, even without preflags
+        preflagged = bytearray(UINT16.pack(len(preflags)))
+        for row, col in preflags:
+            preflagged += bytes((col, row))
+
+        sections = [version_info, player_info, board, preflagged, properties_raw]
+        if version == 1:
+            sections.insert(0, result_str)
+        else:
+            extension = bytearray(UINT16.pack(len(extension_properties)))
+            for key, value in extension_properties.items():
+                key = key.encode(encoding)
+                extension.append(len(key))
+                extension += key
+                extension.append(len(value))
+                extension += value
+            sections.append(extension)
+        video = cls.encode_events(replay, version)
+        timeth = replay.timeth.to_bytes(3, "big")
+        video += timeth
+        video += b"\0\0" + timeth if video_trailer is None else video_trailer
+        sizes = [len(section) for section in sections]
+        body = SECTION_SIZES.pack(*sizes, len(video), len(checksum))
+
+        header = b"*rmv" + UINT16.pack(version)
+        if version >= 2:
+            header += bytes(clone)
+        # for some reason, v2 doesn't count the bytes added to the header in
+        # that version
+        filesize = 10 + len(body) + sum(sizes) + len(video) + len(checksum)
+        return b"".join(
+            [header, UINT32.pack(filesize), body, *sections, video, checksum]
+        )
 
-        self.timeth = self.read_int(data.read(3))
-        self.checksum = data.read(checksum_size)
+    @classmethod
+    def encode_events(cls, replay, version):
+        # the video section up to (not including) the copy of timeth
+        mouse_codes = {
+            subtype: code
+            for code, subtype in cls.MOUSE_EVENT_TYPES.items()
+            if code != 28
+        }
+        board_codes = {subtype: code for code, subtype in cls.BOARD_EVENT_TYPES.items()}
+        termination_codes = {
+            how: code for code, how in cls.TERMINATION_EVENT_TYPES.items()
+        }
+        pack_mouse = MOUSE_EVENT.pack
+        full_moves = set(replay.full_moves) if isinstance(replay, RMVReplay) else ()
+        xoffs, yoffs = (12, 56) if version == 1 else (0, 0)
+        video = bytearray()
+        gametime = xpos = ypos = None
+        nflags = 0
+        terminated = False
+        try:
+            for event in replay.events:
+                type_ = event["type"]
+                if type_ == "mouse":
+                    new_gametime = event["gametime"]
+                    if new_gametime < 0:
+                        # AVF's end marker
+                        continue
+                    subtype = event["subtype"]
+                    try:
+                        code = mouse_codes[subtype]
+                    except KeyError:
+                        raise EncodingError(
+                            replay, "RMV has no {} mouse events".format(subtype)
+                        )
+                    new_x = event["xpos"] + xoffs
+                    new_y = event["ypos"] + yoffs
+                    new_nflags = event.get("nFlags", nflags)
+                    # v2 moves use the reduced event whenever they fit (which
+                    # leaves nFlags as it is), unless the original was full
+                    if (
+                        code == 1
+                        and version >= 2
+                        and len(video) not in full_moves
+                        and gametime is not None
+                        and new_nflags == nflags
+                        and 0 <= new_gametime - gametime <= 255
+                        and -8 <= new_x - xpos <= 7
+                        and -8 <= new_y - ypos <= 7
+                    ):
+                        video.append(28)
+                        video.append(new_gametime - gametime)
+                        video.append((new_x - xpos & 15) << 4 | new_y - ypos & 15)
+                    else:
+                        video.append(code)
+                        video += pack_mouse(
+                            new_gametime << 8 | new_nflags, new_x, new_y
+                        )
+                    gametime = new_gametime
+                    xpos = new_x
+                    ypos = new_y
+                    nflags = new_nflags
+                elif type_ == "board":
+                    video.append(board_codes[event["subtype"]])
+                    video.append(event["col"])
+                    video.append(event["row"])
+                elif type_ == "terminate":
+                    video.append(termination_codes[event["how"]])
+                    terminated = True
+                    break
+                elif type_ == "timestamp_change":
+                    video.append(0)
+                    video += UINT32.pack(event["new_timestamp"])
+        except (StructError, ValueError) as exc:
+            raise EncodingError(replay, "event out of range for RMV: {}".format(exc))
+        if not terminated:
+            # other formats don't have this, but the video has to end somehow
+            video.append(termination_codes["other"])
+        return video
 
     def get_best_token_source(self):
         token = self.player_data.get("token", None)
@@ -276,5 +567,11 @@ class RMVReplay(BaseReplay):
             token = self.result_str_dict["NICK"]
         return token
 
+    def get_player_name(self):
+        return self.player_data.get("name", "")
+
     def get_boardgen_time(self):
         return datetime.fromtimestamp(self.timestamp_boardgen)
+
+    def get_cell_size(self):
+        return self.square_size
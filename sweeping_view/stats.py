@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+# Statistics derived from a replay's mouse events, computed in one pass:
+#
+#   left, right, chord: clicks of each kind, as game.Game tells them apart. A
+#       left click is the left button going up, a right click the right
+#       button going down, and a chord both (or the middle, or shift and the
+#       left) button(s) being down together, counted once per chord.
+#   effective_*: the clicks that did something - opened cells, or set or
+#       removed a flag or question mark. The board is simulated with
+#       game.Game to find out.
+#   bbbv_s: 3BV per second, ioe: 3BV per click, rqp: time / 3BV/s,
+#       correctness: effective clicks per click
+#   path: the length of the mouse's path, in pixels
+#   clicks_per_second: a histogram, how many clicks were made in each second
+#       of the game
+#
+# Time is timeth in seconds. Ratios that would divide by zero are None.
+
+from collections import namedtuple
+from math import hypot
+
+from .batch import detect_class, map_files
+from .events import mouse_events
+from .game import Game
+
+ReplayStats = namedtuple(
+    "ReplayStats",
+    (
+        "left",
+        "right",
+        "chord",
+        "clicks",
+        "effective_left",
+        "effective_right",
+        "effective_chord",
+        "effective",
+        "bbbv",
+        "time",
+        "bbbv_s",
+        "ioe",
+        "rqp",
+        "correctness",
+        "path",
+        "clicks_per_second",
+        "result",
+    ),
+)
+
+# error is None if stats were computed, stats is None if they weren't
+StatsResult = namedtuple("StatsResult", ("path", "stats", "error"))
+
+# what the simulation does when clicks do something
+EFFECTIVE_LEFT = frozenset(
+    ["open_blast"] + ["open_{}".format(number) for number in range(9)]
+)
+EFFECTIVE_RIGHT = frozenset(("flag", "qm", "closed"))
+# chords are effective once released, see StatsCollector.mouse()
+EFFECTIVE = {"left": EFFECTIVE_LEFT, "right": EFFECTIVE_RIGHT, "chord": frozenset()}
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+class StatsCollector:
+    # Accumulates the statistics of a replay, one mouse event at a time
+    # (see mouse()), so that events can be streamed. stats() returns them as
+    # a ReplayStats.
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.game = Game(
+            replay.board,
+            replay.get_cell_size(),
+            replay.properties.get("questionmarks", False),
+        )
+        base = replay.CELL_BASE
+        for row, col in getattr(replay, "preflags", ()):
+            self.game.flag(row - base, col - base)
+        self.counts = dict.fromkeys(
+            (
+                "left",
+                "right",
+                "chord",
+                "effective_left",
+                "effective_right",
+                "effective_chord",
+            ),
+            0,
+        )
+        self.histogram = []
+        self.path = 0.0
+        self.position = None
+
+    def click(self, kind, gametime, effective):
+        self.counts[kind] += 1
+        if effective:
+            self.counts["effective_" + kind] += 1
+        second = gametime // 1000
+        histogram = self.histogram
+        if second >= len(histogram):
+            histogram.extend([0] * (second + 1 - len(histogram)))
+        histogram[second] += 1
+
+    def mouse(self, subtype, gametime, xpos, ypos):
+        position = (xpos, ypos)
+        if self.position is not None and position != self.position:
+            self.path += hypot(xpos - self.position[0], ypos - self.position[1])
+        self.position = position
+
+        game = self.game
+        chording = game.chording
+        out = {
+            event.get("subtype", event.get("how"))
+            for event in game.mouse(subtype, xpos, ypos)
+        }
+        if chording and out & EFFECTIVE_LEFT:
+            # counted when the chord started, it's effective if it opens
+            # something when released
+            self.counts["effective_chord"] += 1
+        if game.click is not None:
+            self.click(game.click, gametime, out & EFFECTIVE[game.click])
+
+    def stats(self):
+        counts = self.counts
+        replay = self.replay
+        clicks = counts["left"] + counts["right"] + counts["chord"]
+        effective = (
+            counts["effective_left"]
+            + counts["effective_right"]
+            + counts["effective_chord"]
+        )
+        bbbv = replay.bbbv
+        time = replay.timeth / 1000
+        bbbv_s = ratio(bbbv, time)
+        return ReplayStats(
+            clicks=clicks,
+            effective=effective,
+            bbbv=bbbv,
+            time=time,
+            bbbv_s=bbbv_s,
+            ioe=ratio(bbbv, clicks),
+            rqp=None if bbbv_s is None else ratio(time, bbbv_s),
+            correctness=ratio(effective, clicks),
+            path=self.path,
+            clicks_per_second=tuple(self.histogram),
+            result=self.game.result,
+            **counts
+        )
+
+
+def replay_stats(replay, events=None):
+    # the ReplayStats of replay. events defaults to replay.events, and can be
+    # any iterable of event dicts - like an EventStream, so that the events
+    # don't need to be stored:
+    #
+    #     with RMVReplay.iter_events(path) as stream:
+    #         stats = replay_stats(stream.replay, stream)
+    if events is None:
+        events = replay.events
+        if events is None:
+            raise ValueError("{} has no events".format(replay))
+    collector = StatsCollector(replay)
+    mouse = collector.mouse
+    for subtype, gametime, xpos, ypos in mouse_events(events):
+        mouse(subtype, gametime, xpos, ypos)
+    return collector.stats()
+
+
+def file_stats(path, cls=None):
+    # the stats of one file, streaming its events, as a StatsResult
+    try:
+        if cls is None:
+            cls = detect_class(path)
+        with cls.iter_events(path) as stream:
+            stats = replay_stats(stream.replay, stream)
+    except Exception as exc:
+        return StatsResult(path, None, exc)
+    return StatsResult(path, stats, None)
+
+
+def stats_many(paths, workers=None, chunksize=16, ordered=True, cls=None):
+    # yields the StatsResult of each path, computed in a process pool (see
+    # batch.parse_many). Only the stats are sent back from the workers, not
+    # the events.
+    return map_files(
+        file_stats,
+        paths,
+        (cls,),
+        workers=workers,
+        chunksize=chunksize,
+        ordered=ordered,
+    )
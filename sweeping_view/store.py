@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+# A columnar file format for many parsed replays, for analyses that would
+# otherwise parse the same replays over and over.
+#
+# A store has one row per replay in a header table, and the events of all
+# replays concatenated into one array per event column, with the offsets of
+# each replay's events. Stores are read through mmap, so reading a column
+# only touches the pages it lives on, and nothing is decoded again.
+#
+# Layout: MAGIC, the length of the directory (8 bytes, little endian), the
+# directory (JSON), then the columns, each aligned to 8 bytes. The directory
+# has the typecode, size and offset of every column, relative to the first
+# aligned byte after the directory.
+
+from array import array
+from datetime import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from .events import COLUMNS, EventTable
+from .reader import map_file
+
+MAGIC = b"SVSTORE\x01"
+ALIGNMENT = 8
+
+# per replay. format and level are stored as indexes into a list of the
+# values that occur, boardgen_time as a POSIX timestamp.
+HEADER_COLUMNS = (
+    ("format", "H"),
+    ("level", "H"),
+    ("rows", "H"),
+    ("cols", "H"),
+    ("mines", "I"),
+    ("bbbv", "I"),
+    ("timeth", "q"),
+    ("boardgen_time", "d"),
+)
+
+# per replay, stored as offsets (replays + 1) into UTF-8 data
+STRING_COLUMNS = ("player", "name")
+
+# all events, see events.COLUMNS
+EVENT_COLUMNS = tuple(("events." + name, typecode) for name, typecode, _ in COLUMNS)
+
+
+class StoreWriter:
+    # Writes replays to a store at path, one by one with add(). The store is
+    # written on close(), until then the columns are spooled to temporary
+    # files, so that memory use doesn't grow with the number of replays.
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.values = {"format": [], "level": []}
+        self.spools = {}
+        self.sizes = {}
+        self.typecodes = {}
+        for name, typecode in HEADER_COLUMNS + EVENT_COLUMNS:
+            self.add_column(name, typecode)
+        for name in STRING_COLUMNS:
+            self.add_column(name + ".offsets", "q")
+            self.add_column(name + ".data", "B")
+            self.write(name + ".offsets", array("q", [0]))
+        self.add_column("event_offsets", "q")
+        self.write("event_offsets", array("q", [0]))
+        self.string_sizes = dict.fromkeys(STRING_COLUMNS, 0)
+        self.num_events = 0
+
+    def add_column(self, name, typecode):
+        self.spools[name] = tempfile.TemporaryFile()
+        self.sizes[name] = 0
+        self.typecodes[name] = typecode
+
+    def write(self, name, values):
+        values.tofile(self.spools[name])
+        self.sizes[name] += len(values) * values.itemsize
+
+    def code(self, column, value):
+        values = self.values[column]
+        try:
+            return values.index(value)
+        except ValueError:
+            values.append(value)
+            return len(values) - 1
+
+    def add(self, replay):
+        header = (
+            self.code("format", type(replay).__name__),
+            self.code("level", replay.properties.get("level")),
+            replay.rows,
+            replay.cols,
+            replay.num_mines,
+            replay.bbbv,
+            replay.timeth,
+            replay.get_boardgen_time().timestamp(),
+        )
+        for (name, typecode), value in zip(HEADER_COLUMNS, header):
+            self.write(name, array(typecode, [value]))
+
+        strings = (replay.get_player_name(), replay.source_name)
+        for name, value in zip(STRING_COLUMNS, strings):
+            value = "" if value is None else str(value)
+            data = array("B", value.encode("utf-8"))
+            self.write(name + ".data", data)
+            self.string_sizes[name] += len(data)
+            self.write(name + ".offsets", array("q", [self.string_sizes[name]]))
+
+        if replay.events is not None:
+            events = EventTable.from_events(replay.events)
+            for name, typecode in EVENT_COLUMNS:
+                column = getattr(events, name[len("events.") :])
+                if not isinstance(column, array):
+                    column = array(typecode, column)
+                self.write(name, column)
+            self.num_events += len(events)
+        self.write("event_offsets", array("q", [self.num_events]))
+        self.count += 1
+
+    def close(self):
+        if self.spools is None:
+            return
+        try:
+            self.finish()
+        finally:
+            self.discard()
+
+    def discard(self):
+        for spool in self.spools.values():
+            spool.close()
+        self.spools = None
+
+    def finish(self):
+        columns = {}
+        offset = 0
+        for name, size in self.sizes.items():
+            columns[name] = [self.typecodes[name], offset, size]
+            offset += size + -size % ALIGNMENT
+        directory = json.dumps(
+            {
+                "count": self.count,
+                "byteorder": sys.byteorder,
+                "itemsizes": {
+                    typecode: array(typecode).itemsize
+                    for typecode in set(self.typecodes.values())
+                },
+                "values": self.values,
+                "columns": columns,
+            }
+        ).encode("utf-8")
+        start = len(MAGIC) + 8 + len(directory)
+        start += -start % ALIGNMENT
+        # written next to the store and moved there when complete, so that
+        # readers never see half a store
+        tmp_path = "{}.tmp".format(os.fspath(self.path))
+        with open(tmp_path, "wb") as file:
+            file.write(MAGIC)
+            file.write(len(directory).to_bytes(8, "little"))
+            file.write(directory)
+            file.write(bytes(start - file.tell()))
+            for name, spool in self.spools.items():
+                spool.seek(0)
+                shutil.copyfileobj(spool, file)
+                file.write(bytes(-self.sizes[name] % ALIGNMENT))
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_store(path, replays):
+    # writes replays (any iterable) to a store at path, returns their number.
+    # Replays parsed with event_table=True are the cheapest to write.
+    with StoreWriter(path) as writer:
+        for replay in replays:
+            writer.add(replay)
+    return writer.count
+
+
+class Store:
+    # A store, read through mmap. column() returns whole columns as
+    # memoryviews of the mapped file - for events, the concatenation of all
+    # replays' events, which event_range() splits up again. events() returns
+    # an EventTable over a replay's part of the event columns.
+    #
+    # Views returned by a store should be released (or dropped) before it is
+    # closed.
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = map_file(self.file)
+            if self.data[: len(MAGIC)] != MAGIC:
+                raise ValueError("{} is not a replay store".format(path))
+            size = int.from_bytes(self.data[len(MAGIC) : len(MAGIC) + 8], "little")
+            start = len(MAGIC) + 8
+            directory = json.loads(bytes(self.data[start : start + size]))
+            start += size
+            self.start = start + -start % ALIGNMENT
+        except BaseException:
+            self.close()
+            raise
+        self.count = directory["count"]
+        self.values = directory["values"]
+        self.layout = directory["columns"]
+        self.swap = directory["byteorder"] != sys.byteorder
+        for typecode, itemsize in directory["itemsizes"].items():
+            if array(typecode).itemsize != itemsize:
+                self.close()
+                raise ValueError(
+                    "{} was written on a platform with other item sizes".format(path)
+                )
+        self.columns = {}
+        self.view = memoryview(self.data)
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        # one of the columns in HEADER_COLUMNS or EVENT_COLUMNS, or
+        # event_offsets (replays + 1 offsets into the event columns)
+        column = self.columns.get(name)
+        if column is None:
+            typecode, offset, size = self.layout[name]
+            offset += self.start
+            column = self.view[offset : offset + size]
+            if self.swap:
+                swapped = array(typecode)
+                swapped.frombytes(column)
+                swapped.byteswap()
+                column = swapped
+            else:
+                column = column.cast(typecode)
+            self.columns[name] = column
+        return column
+
+    def to_numpy(self, name):
+        # a column as a numpy array, sharing memory with the mapped file
+        import numpy
+
+        return numpy.frombuffer(self.column(name), dtype=self.layout[name][0])
+
+    def string(self, name, index):
+        offsets = self.column(name + ".offsets")
+        data = self.column(name + ".data")
+        return bytes(data[offsets[index] : offsets[index + 1]]).decode("utf-8")
+
+    def header(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("replay index out of range")
+        header = {name: self.column(name)[index] for name, _ in HEADER_COLUMNS}
+        for name in ("format", "level"):
+            header[name] = self.values[name][header[name]]
+        header["boardgen_time"] = datetime.fromtimestamp(header["boardgen_time"])
+        for name in STRING_COLUMNS:
+            header[name] = self.string(name, index)
+        return header
+
+    def headers(self):
+        for index in range(self.count):
+            yield self.header(index)
+
+    def event_range(self, index):
+        # start and end of a replay's events in the event columns
+        if not 0 <= index < self.count:
+            raise IndexError("replay index out of range")
+        offsets = self.column("event_offsets")
+        return offsets[index], offsets[index + 1]
+
+    def events(self, index):
+        start, end = self.event_range(index)
+        return EventTable.from_columns(
+            {name: self.column("events." + name)[start:end] for name, _, _ in COLUMNS}
+        )
+
+    def close(self):
+        for column in getattr(self, "columns", {}).values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = {}
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        if self.file is not None:
+            if hasattr(self.data, "close"):
+                try:
+                    self.data.close()
+                except BufferError:
+                    # someone still has a view, the mapping goes away with it
+                    pass
+            self.data = None
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
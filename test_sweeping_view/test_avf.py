@@ -23,3 +23,29 @@ def test_avf(replay_path):
         (8, 6),
         (4, 7),
     }
+
+
+def test_avf_metadata_only(replay_path):
+    full = AVFReplay.from_file(replay_path / "test_subject.avf")
+    meta = AVFReplay.from_file(replay_path / "test_subject.avf", metadata_only=True)
+
+    assert meta.events is None
+    assert meta.timeth == full.timeth == 5410
+    assert meta.name == "Tommy"
+    assert meta.version_info == full.version_info
+    assert meta.bbbv == full.bbbv
+
+
+def test_avf_checksum(replay_path):
+    data = (replay_path / "test_subject.avf").read_bytes()
+    cs = data.index(b"cs=")
+    full = AVFReplay.from_bytes(data)
+    meta = AVFReplay.from_bytes(data, metadata_only=True)
+    assert full.checksum == meta.checksum == data[cs + 3 : cs + 20]
+
+    # without one, the footer follows the line the events end on
+    avf = AVFReplay.from_bytes(data[: cs - 1] + data[cs + 19 :])
+    assert avf.checksum is None
+    assert avf.name == "Tommy"
+    assert avf.timeth == full.timeth
+    assert avf.events == full.events
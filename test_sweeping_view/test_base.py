@@ -0,0 +1,179 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.base import NO_LIMITS, Limits
+from sweeping_view.events import EventTable
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import InvalidReplayError, LimitExceededError
+from sweeping_view.incremental import IncrementalParser
+from sweeping_view.rmv import RMVReplay
+
+
+def run(coroutine):
+    # asyncio.run() is 3.7+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class Reader:
+    # a stream that returns data in small pieces, and counts the reads
+    def __init__(self, data, piece_size=100):
+        self.data = data
+        self.piece_size = piece_size
+        self.reads = 0
+
+    async def read(self, size):
+        self.reads += 1
+        await asyncio.sleep(0)
+        piece = self.data[: min(size, self.piece_size)]
+        self.data = self.data[len(piece) :]
+        return piece
+
+
+@pytest.mark.parametrize(
+    "cls, fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+@pytest.mark.parametrize("threshold", [0, 1 << 30])
+def test_from_stream(replay_path, cls, fname, threshold):
+    data = (replay_path / fname).read_bytes()
+
+    async def parse():
+        with ThreadPoolExecutor(1) as executor:
+            return await cls.from_stream(
+                Reader(data),
+                name=fname,
+                executor=executor,
+                threshold=threshold,
+                event_table=True,
+            )
+
+    replay = run(parse())
+    assert isinstance(replay.events, EventTable)
+    assert replay.events == cls.from_bytes(data).events
+
+
+def test_from_stream_incremental(replay_path, monkeypatch):
+    data = (replay_path / "test_subject.rmv").read_bytes()
+    fed = []
+    feed = IncrementalParser.feed
+
+    def record(parser, chunk):
+        events = feed(parser, chunk)
+        fed.append(len(events))
+        return events
+
+    monkeypatch.setattr(IncrementalParser, "feed", record)
+    replay = run(RMVReplay.from_stream(Reader(data), chunk_size=1000))
+    # events were decoded while the stream was still being read
+    assert len(fed) > 2
+    assert sum(fed[:-1]) > 0
+    assert replay.events == RMVReplay.from_bytes(data).events
+    assert replay.timeth == RMVReplay.from_bytes(data).timeth
+
+
+@pytest.mark.parametrize("threshold", [0, 1 << 30])
+def test_from_stream_executor(replay_path, monkeypatch, threshold):
+    data = (replay_path / "test_subject.rmv").read_bytes()
+    threads = set()
+    feed = IncrementalParser.feed
+    close = IncrementalParser.close
+
+    def record_feed(parser, chunk):
+        threads.add(threading.get_ident())
+        return feed(parser, chunk)
+
+    def record_close(parser):
+        threads.add(threading.get_ident())
+        return close(parser)
+
+    monkeypatch.setattr(IncrementalParser, "feed", record_feed)
+    monkeypatch.setattr(IncrementalParser, "close", record_close)
+
+    async def parse():
+        with ThreadPoolExecutor(1) as executor:
+            return await RMVReplay.from_stream(
+                Reader(data), executor=executor, threshold=threshold, chunk_size=1000
+            )
+
+    replay = run(parse())
+    assert replay.events == RMVReplay.from_bytes(data).events
+    # above the threshold, nothing is parsed on the loop
+    assert (threading.get_ident() in threads) == (threshold > len(data))
+    assert len(threads) == 1
+
+
+def test_from_stream_asyncio(replay_path):
+    data = (replay_path / "test_subject_2.rmv").read_bytes()
+
+    async def parse():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await RMVReplay.from_stream(reader, name="upload", metadata_only=True)
+
+    replay = run(parse())
+    assert replay.name == "upload"
+    assert replay.events is None
+    assert replay.timeth == RMVReplay.from_bytes(data).timeth
+
+
+def test_from_stream_rejects_early(replay_path):
+    data = (replay_path / "test_subject.evf").read_bytes() * 100
+    reader = Reader(data)
+    with pytest.raises(InvalidReplayError):
+        run(RMVReplay.from_stream(reader))
+    # only the start was read
+    assert reader.reads <= 6
+
+    with pytest.raises(InvalidReplayError):
+        run(RMVReplay.from_stream(Reader(b"*rm")))
+
+
+@pytest.mark.parametrize(
+    "cls, fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_limits(replay_path, cls, fname):
+    path = replay_path / fname
+    data = path.read_bytes()
+    events = len(cls.from_bytes(data).events)
+
+    exact = Limits(len(data), events, None)
+    assert len(cls.from_bytes(data, limits=exact).events) == events
+    assert cls.from_bytes(data, limits=NO_LIMITS).timeth == cls.from_bytes(data).timeth
+
+    with pytest.raises(LimitExceededError):
+        cls.from_bytes(data, limits=Limits(len(data) - 1, None, None))
+    with pytest.raises(LimitExceededError):
+        cls.from_file(path, limits=Limits(len(data) - 1, None, None))
+    with pytest.raises(LimitExceededError):
+        cls.from_bytes(data, limits=Limits(None, events - 1, None))
+    # the events aren't stored, so they aren't limited
+    cls.from_bytes(data, metadata_only=True, limits=Limits(None, 0, None))
+    with pytest.raises(LimitExceededError):
+        run(cls.from_stream(Reader(data), limits=Limits(len(data) - 1, None, None)))
+
+
+def test_invalid_fields(replay_path):
+    data = (replay_path / "test_subject.avf").read_bytes()
+    # a 3BV in the timestamp block that isn't a number
+    broken = data.replace(b"|B28T", b"|BxxT", 1)
+    assert broken != data
+    with pytest.raises(InvalidReplayError):
+        AVFReplay.from_bytes(broken)
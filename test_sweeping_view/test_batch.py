@@ -0,0 +1,63 @@
+import pickle
+
+import pytest
+
+from sweeping_view.batch import _pack, parse_many
+from sweeping_view.events import EventTable
+from sweeping_view.exceptions import InvalidReplayError, UnknownMimeType
+from sweeping_view.rmv import RMVReplay
+
+
+@pytest.fixture
+def paths(replay_path, tmp_path):
+    broken = tmp_path / "broken.rmv"
+    broken.write_bytes(b"*rmv\0\1garbage")
+    unknown = tmp_path / "replay.xyz"
+    unknown.write_bytes(b"")
+    return sorted(replay_path.iterdir()) + [broken, unknown]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parse_many(paths, workers):
+    results = list(parse_many(paths, workers=workers, chunksize=2))
+
+    assert [result.path for result in results] == paths
+    *good, broken, unknown = results
+    for result in good:
+        assert result.error is None
+        assert isinstance(result.replay.events, EventTable)
+        assert result.replay.timeth > 0
+    assert isinstance(broken.error, InvalidReplayError)
+    assert "broken.rmv" in str(broken.error)
+    assert isinstance(unknown.error, UnknownMimeType)
+
+
+def test_parse_many_compact(replay_path):
+    paths = sorted(replay_path.iterdir())
+    for path, result in zip(paths, parse_many(paths, workers=2, chunksize=1)):
+        expected = type(result.replay).from_file(path, event_table=True)
+        assert result.replay.events == expected.events
+        assert vars(result.replay) == vars(expected)
+        assert result.replay.get_player_name() == expected.get_player_name()
+
+    # only bytes and the metadata are sent back from the workers
+    _, cls, state, events = _pack(paths[0], None, False, True)
+    assert "events" not in state
+    assert all(isinstance(column, bytes) for column in events.values())
+
+
+def test_parse_many_unordered(paths):
+    results = list(
+        parse_many(paths, workers=2, chunksize=1, ordered=False, metadata_only=True)
+    )
+
+    assert sorted(result.path for result in results) == paths
+    for result in results:
+        if result.error is None:
+            assert result.replay.events is None
+
+
+def test_exceptions_pickle():
+    exc = InvalidReplayError(RMVReplay, message="broken")
+
+    assert str(pickle.loads(pickle.dumps(exc))) == str(exc)
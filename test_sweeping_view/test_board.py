@@ -0,0 +1,133 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.board import (
+    MINE,
+    Bitboard,
+    BoardMetrics,
+    MineList,
+    analyze,
+    analyze_files,
+    analyze_replay,
+    numbers,
+)
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import InvalidReplayError
+from sweeping_view.rmv import RMVReplay
+
+
+def test_analyze():
+    # 1 1 1 0
+    # 1 * 1 0
+    # 1 1 2 1
+    # 0 0 1 *
+    mines = [(1, 1), (3, 3)]
+    assert numbers(mines, 4, 4) == bytearray(
+        [1, 1, 1, 0, 1, MINE, 1, 0, 1, 1, 2, 1, 0, 0, 1, MINE]
+    )
+    # the 1s in the top left corner aren't next to an opening
+    assert analyze(mines, 4, 4) == BoardMetrics(bbbv=5, openings=2, islands=1)
+    assert analyze([(2, 2), (4, 4)], 4, 4, base=1) == analyze(mines, 4, 4)
+
+    # an island: nothing opens the 1s around the mine
+    assert analyze([(0, 0), (0, 2)], 1, 3) == BoardMetrics(
+        bbbv=1, openings=0, islands=1
+    )
+    assert analyze([], 2, 2) == BoardMetrics(bbbv=1, openings=1, islands=0)
+    assert analyze([(0, 0), (0, 1), (1, 0), (1, 1)], 2, 2) == BoardMetrics(0, 0, 0)
+
+
+@pytest.mark.parametrize(
+    "cls, fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (RMVReplay, "test_subject_2.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_analyze_replay(replay_path, cls, fname):
+    replay = cls.from_file(replay_path / fname, metadata_only=True)
+    assert analyze_replay(replay).bbbv == replay.bbbv
+
+
+def test_analyze_files(replay_path, tmp_path):
+    broken = tmp_path / "broken.rmv"
+    broken.write_bytes(b"*rmv\0\1")
+    paths = [replay_path / "test_subject.evf", broken]
+    good, bad = analyze_files(paths, workers=1)
+    assert good.metrics == BoardMetrics(bbbv=167, openings=11, islands=10)
+    assert good.claimed_bbbv == 167
+    assert good.error is None
+    assert bad.metrics is None
+    assert bad.error is not None
+
+
+def test_bitboard():
+    board = Bitboard.from_cells(4, 4, [(3, 3), (1, 1)])
+    assert (1, 1) in board
+    assert board[3, 3]
+    assert (1, 2) not in board
+    assert (4, 0) not in board
+    assert (0, -1) not in board
+    assert len(board) == 2
+    assert list(board) == [(1, 1), (3, 3)]
+    assert board.number(2, 2) == 2
+    assert board.numbers() == numbers([(1, 1), (3, 3)], 4, 4)
+    assert board.metrics() == BoardMetrics(bbbv=5, openings=2, islands=1)
+    assert board == Bitboard.from_pairs(4, 4, bytes([1, 1, 3, 3]))
+    assert board != Bitboard.from_cells(4, 5, board)
+    assert len({board, Bitboard.from_cells(4, 4, [(1, 1), (3, 3)])}) == 1
+    assert Bitboard.from_bitfield(4, 4, board.to_bitfield()) == board
+    assert board.to_bitfield() == bytes([0b00000100, 0b00000001])
+
+
+def test_mine_list():
+    # (col, row) pairs, as in RMV
+    mines = MineList(4, 4, bytes([1, 0, 3, 2]), row_first=False)
+    assert mines == [(0, 1), (2, 3)]
+    assert len(mines) == 2
+    assert mines[1] == (2, 3)
+    assert (2, 3) in mines
+    assert (3, 2) not in mines
+    assert mines.board == Bitboard.from_cells(4, 4, [(0, 1), (2, 3)])
+
+    mines = MineList(4, 4, bytes([1, 2, 4, 4]), base=1)
+    assert (4, 4) in mines
+    assert (0, 1) not in mines
+    assert list(mines.board) == [(0, 1), (3, 3)]
+
+    mines = MineList.from_board(Bitboard.from_cells(4, 4, [(0, 3), (2, 1)]))
+    assert mines == [(2, 1), (0, 3)]
+
+
+def test_mines_outside(replay_path):
+    # the spare column, the next row, and before the first cell
+    for cell in [(0, 4), (4, 0), (-1, 0)]:
+        with pytest.raises(InvalidReplayError):
+            Bitboard.from_cells(4, 4, [(1, 1), cell])
+    with pytest.raises(InvalidReplayError):
+        Bitboard.from_cells(4, 4, [(0, 1)], base=1)
+    with pytest.raises(InvalidReplayError):
+        MineList(4, 4, bytes([4, 0]), row_first=False)
+    with pytest.raises(InvalidReplayError):
+        MineList(4, 4, bytes([1, 1, 1, 5]), base=1)
+
+    rmv = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    rmv.mines = [(0, rmv.cols)] + list(rmv.mines)[1:]
+    for metadata_only in (False, True):
+        with pytest.raises(InvalidReplayError, match="outside"):
+            RMVReplay.from_bytes(rmv.to_bytes(), metadata_only=metadata_only)
+
+
+def test_board_across_formats(replay_path):
+    rmv = RMVReplay.from_file(replay_path / "test_subject_2.rmv", metadata_only=True)
+    avf = AVFReplay.from_file(replay_path / "test_subject.avf", metadata_only=True)
+    rmv_mines = list(rmv.mines)
+    assert rmv.board == Bitboard.from_cells(rmv.rows, rmv.cols, rmv_mines)
+    assert avf.board == Bitboard.from_cells(avf.rows, avf.cols, avf.mines, base=1)
+
+    rmv = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    evf = EVFReplay(EVFReplay.encode(rmv))
+    assert evf.board == rmv.board
+    assert sorted(evf.mines) == sorted(rmv_mines)
@@ -0,0 +1,140 @@
+import pickle
+
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.base import DEFAULT_LIMITS
+from sweeping_view.cache import ReplayCache
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import LimitExceededError
+from sweeping_view.instrumentation import Collector
+from sweeping_view.rmv import RMVReplay
+
+
+def test_memory_cache(replay_path):
+    cache = ReplayCache()
+    path = replay_path / "test_subject.rmv"
+
+    first = RMVReplay.from_file(path, cache=cache)
+    second = RMVReplay.from_file(path, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second is not first
+    assert second.events == first.events
+    assert second.name == path
+
+    # different options are different entries
+    RMVReplay.from_file(path, cache=cache, metadata_only=True)
+    assert cache.misses == 2
+
+
+def test_cache_keeps_avf_player(replay_path):
+    cache = ReplayCache()
+    path = replay_path / "test_subject.avf"
+
+    first = AVFReplay.from_file(path, cache=cache)
+    second = AVFReplay.from_file(path, cache=cache)
+    assert cache.hits == 1
+    assert second.get_player_name() == first.get_player_name() != str(path)
+    assert second.get_best_token_source() == first.get_best_token_source()
+    assert second.source_name == path
+
+
+def test_cache_entries(replay_path):
+    cache = ReplayCache()
+    path = replay_path / "test_subject.evf"
+
+    for event_table in (False, True):
+        first = EVFReplay.from_file(path, cache=cache, event_table=event_table)
+        second = EVFReplay.from_file(path, cache=cache, event_table=event_table)
+        assert type(second.events) is type(first.events)
+        assert second.events == first.events
+        assert vars(second).keys() == vars(first).keys()
+    # entries hold the events as columns of bytes, not as dicts
+    (blob,) = [blob for key, blob in cache.memory.items() if "event_table=False" in key]
+    _, events = pickle.loads(blob)
+    assert all(isinstance(column, bytes) for column in events.values())
+
+
+def test_cache_instrument(replay_path):
+    cache = ReplayCache()
+    path = replay_path / "test_subject.rmv"
+    collector = Collector()
+
+    first = RMVReplay.from_file(path, cache=cache, instrument=collector)
+    assert first.profile is not None
+    # hits aren't parsed, so they aren't timed
+    second = RMVReplay.from_file(path, cache=cache, instrument=collector)
+    assert cache.hits == 1
+    assert second.profile is None
+    assert [entry["count"] for entry in collector.snapshot()["parses"]] == [1]
+
+
+def test_cache_limits(replay_path):
+    cache = ReplayCache()
+    path = replay_path / "test_subject.rmv"
+    size = path.stat().st_size
+    events = len(RMVReplay.from_file(path, cache=cache).events)
+
+    def limits(**kwargs):
+        return DEFAULT_LIMITS._replace(**kwargs)
+
+    # hits are checked against the limits they are asked for
+    with pytest.raises(LimitExceededError):
+        RMVReplay.from_file(path, cache=cache, limits=limits(max_file_size=size - 1))
+    with pytest.raises(LimitExceededError):
+        RMVReplay.from_file(path, cache=cache, limits=limits(max_events=events - 1))
+    assert cache.misses == 1
+    RMVReplay.from_file(
+        path, cache=cache, limits=limits(max_file_size=size, max_events=events)
+    )
+    # metadata_only replays have no events to limit
+    RMVReplay.from_file(path, cache=cache, metadata_only=True)
+    RMVReplay.from_file(
+        path, cache=cache, metadata_only=True, limits=limits(max_events=0)
+    )
+    assert cache.misses == 2
+
+    # the scan distance is part of the key
+    RMVReplay.from_file(path, cache=cache, limits=limits(max_scan_distance=1024))
+    assert cache.misses == 3
+
+
+def test_disk_cache(replay_path, tmp_path):
+    raw = (replay_path / "test_subject.evf").read_bytes()
+
+    with ReplayCache(tmp_path / "cache.sqlite") as cache:
+        parsed = EVFReplay.from_bytes(raw, cache=cache, event_table=True)
+    with ReplayCache(tmp_path / "cache.sqlite") as cache:
+        cached = EVFReplay.from_bytes(raw, cache=cache, event_table=True)
+        assert cache.hits == 1
+    assert cached.events == parsed.events
+    assert cached.timeth == parsed.timeth
+
+
+def test_eviction(replay_path, tmp_path):
+    raws = [
+        (replay_path / fname).read_bytes()
+        for fname in ("test_subject.rmv", "test_subject_2.rmv")
+    ]
+
+    with ReplayCache(tmp_path / "cache.sqlite", max_size=1, memory_size=0) as cache:
+        # too big to be stored at all
+        RMVReplay.from_bytes(raws[0], cache=cache)
+        RMVReplay.from_bytes(raws[0], cache=cache)
+        assert cache.hits == 0
+
+    with ReplayCache(tmp_path / "lru.sqlite", memory_size=0) as cache:
+        for raw in raws:
+            RMVReplay.from_bytes(raw, cache=cache, metadata_only=True)
+        cache.max_size = cache.disk_used
+        # touch the first one, so the second one is the oldest
+        RMVReplay.from_bytes(raws[0], cache=cache, metadata_only=True)
+        # same size as the second one
+        RMVReplay.from_bytes(raws[1], cache=cache, metadata_only=True, event_table=True)
+
+        keys = {key for key, in cache.db.execute("SELECT key FROM replays")}
+        assert keys == {
+            ReplayCache.key(RMVReplay, raws[0], metadata_only=True),
+            ReplayCache.key(RMVReplay, raws[1], metadata_only=True, event_table=True),
+        }
+        assert cache.disk_used <= cache.max_size
@@ -0,0 +1,136 @@
+import io
+import json
+import shutil
+import tarfile
+import zipfile
+
+import pytest
+
+from sweeping_view.cli import main
+from sweeping_view.evf import EVFReplay
+from sweeping_view.rmv import RMVReplay
+
+FILES = [
+    "test_subject.rmv",
+    "test_subject_2.rmv",
+    "test_subject.evf",
+    "test_subject.avf",
+]
+
+
+def run(*argv):
+    output = io.StringIO()
+    status = main(["scan", "--workers", "1", "--quiet"] + list(argv), output)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    return status, lines
+
+
+def by_path(lines):
+    return {line["path"]: line for line in lines}
+
+
+def test_cli(replay_path, tmp_path):
+    root = tmp_path / "replays"
+    (root / "nested").mkdir(parents=True)
+    for fname in FILES:
+        shutil.copy(str(replay_path / fname), str(root / "nested" / fname))
+    (root / "notes.txt").write_text("not a replay")
+
+    status, lines = run(str(root))
+    assert status == 0
+    lines = by_path(lines)
+    assert len(lines) == 4
+    replay = RMVReplay.from_file(replay_path / "test_subject.rmv")
+    assert lines[str(root / "nested" / "test_subject.rmv")] == {
+        "path": str(root / "nested" / "test_subject.rmv"),
+        "format": "RMVReplay",
+        "properties": replay.properties,
+        "rows": replay.rows,
+        "cols": replay.cols,
+        "mines": replay.num_mines,
+        "bbbv": replay.bbbv,
+        "timeth": replay.timeth,
+        "player": replay.get_player_name(),
+        "token": replay.get_best_token_source(),
+        "boardgen_time": replay.get_boardgen_time().isoformat(),
+        "events": len(replay.events),
+    }
+    evf = lines[str(root / "nested" / "test_subject.evf")]
+    assert (
+        evf["player"]
+        == EVFReplay.from_file(replay_path / "test_subject.evf").user_identifier
+    )
+
+    # the same in parallel, without events
+    output = io.StringIO()
+    assert (
+        main(
+            [
+                "scan",
+                "--workers",
+                "2",
+                "--chunksize",
+                "1",
+                "-q",
+                "--headers-only",
+                str(root),
+            ],
+            output,
+        )
+        == 0
+    )
+    parallel = by_path(json.loads(line) for line in output.getvalue().splitlines())
+    for line in lines.values():
+        del line["events"]
+    assert parallel == lines
+
+    # every file, with --all-files
+    status, lines = run("--all-files", str(root))
+    assert status == 1
+    assert "error" in by_path(lines)[str(root / "notes.txt")]
+
+
+def test_cli_archives(replay_path, tmp_path):
+    archive = tmp_path / "replays.zip"
+    with zipfile.ZipFile(str(archive), "w") as zip_file:
+        for fname in FILES:
+            zip_file.write(str(replay_path / fname), "dir/" + fname)
+        zip_file.writestr("dir/broken.rmv", b"*rmv\0\1" + bytes(20))
+    tar = tmp_path / "replays.tar.gz"
+    with tarfile.open(str(tar), "w:gz") as tar_file:
+        for fname in FILES:
+            tar_file.add(str(replay_path / fname), fname)
+
+    status, lines = run(str(archive), str(tar))
+    assert status == 1
+    lines = by_path(lines)
+    assert len(lines) == 9
+    for fname in FILES:
+        zipped = lines["{}::dir/{}".format(archive, fname)]
+        tarred = lines["{}::{}".format(tar, fname)]
+        assert zipped["timeth"] == tarred["timeth"]
+        assert "error" not in zipped
+    assert "error" in lines["{}::dir/broken.rmv".format(archive)]
+
+    # archives as files
+    status, lines = run("--no-archives", "--all-files", str(archive))
+    assert status == 1
+    assert [line["path"] for line in lines] == [str(archive)]
+
+
+def test_cli_errors(tmp_path, capsys):
+    broken = tmp_path / "broken.zip"
+    broken.write_bytes(b"not a zip")
+    output = io.StringIO()
+    assert (
+        main(["scan", "--workers", "1", str(broken), str(tmp_path / "missing")], output)
+        == 1
+    )
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["path"] for line in lines] == [str(broken), str(tmp_path / "missing")]
+    assert all("error" in line for line in lines)
+    assert capsys.readouterr().err == "0 replays, 2 errors\n"
+
+    with pytest.raises(SystemExit):
+        main(["--version"])
+    assert capsys.readouterr().out.startswith("sweeping-view ")
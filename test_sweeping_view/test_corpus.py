@@ -0,0 +1,64 @@
+import io
+import random
+
+import pytest
+
+from benchmarks.corpus import VARIANTS, generate, write_corpus
+from benchmarks.fuzz import fuzz, linearity, mutate
+from benchmarks.run import compare
+from sweeping_view.mime_types import detect
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_corpus_parses(variant):
+    data = generate(variant, "beginner")
+    assert generate(variant, "beginner") == data
+    assert generate(variant, "beginner", seed=1) != data
+
+    cls = detect(io.BytesIO(data))
+    full = cls.from_bytes(data)
+    meta = cls.from_bytes(data, metadata_only=True)
+    table = cls.from_bytes(data, event_table=True)
+
+    assert len([event for event in full.events if event["type"] == "mouse"]) >= 500
+    assert table.events == full.events
+    assert list(cls.iter_events(data)) == full.events
+    assert meta.timeth == full.timeth
+    assert meta.mines == full.mines
+    assert len(full.mines) == 10
+
+
+def test_write_corpus(tmp_path):
+    corpus = write_corpus(str(tmp_path), ["rmv2", "evf"], ["beginner"])
+    assert [(variant, size) for variant, size, _ in corpus] == [
+        ("rmv2", "beginner"),
+        ("evf", "beginner"),
+    ]
+    for variant, size, path in corpus:
+        with open(path, "rb") as file:
+            assert file.read() == generate(variant, size)
+
+
+def test_compare():
+    def results(seconds):
+        return {
+            "results": [
+                {"variant": "evf", "size": "expert", "mode": "events", "seconds": s}
+                for s in seconds
+            ]
+        }
+
+    ratios, regressed = compare(results([1.05]), results([1.0]))
+    assert ratios == [("evf", "expert", "events", pytest.approx(1.05))]
+    assert not regressed
+    assert compare(results([1.2]), results([1.0]))[1]
+
+
+def test_fuzz():
+    data = generate("evf", "beginner")
+    assert mutate(data, random.Random(1)) == mutate(data, random.Random(1))
+    assert fuzz(50) == []
+
+    results, ratio = linearity("rmv2", repeat=1)
+    assert len(results) > 4
+    assert ratio > 0
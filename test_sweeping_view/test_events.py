@@ -0,0 +1,154 @@
+import io
+import sys
+
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.events import MISSING, SUBTYPE_CODES, EventTable, cell_column
+from sweeping_view.evf import EVFReplay
+from sweeping_view.game import Game
+from sweeping_view.rmv import RMVReplay
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (RMVReplay, "test_subject_2.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_event_table_matches_dicts(replay_path, cls, fname):
+    dicts = cls.from_file(replay_path / fname)
+    table = cls.from_file(replay_path / fname, event_table=True)
+
+    assert isinstance(table.events, EventTable)
+    assert len(table.events) == len(dicts.events)
+    assert list(table.events) == dicts.events
+    assert table.events[-1] == dicts.events[-1]
+    assert table.timeth == dicts.timeth
+
+
+def test_event_table_columns(replay_path):
+    rmv = RMVReplay.from_file(replay_path / "test_subject_2.rmv", event_table=True)
+
+    assert rmv.events[-2:] == [
+        {"col": 7, "row": 7, "subtype": "open_1", "type": "board"},
+        {"how": "win", "type": "terminate"},
+    ]
+    assert rmv.events.subtype[-2] == SUBTYPE_CODES["open_1"]
+    assert rmv.events.row[-2] == rmv.events.col[-2] == 7
+
+
+def test_event_table_from_events(replay_path):
+    rmv = RMVReplay.from_file(replay_path / "test_subject.rmv")
+    table = EventTable.from_events(rmv.events)
+    assert table == rmv.events
+    assert EventTable.from_events(table) is table
+
+    views = EventTable.from_columns(
+        {name: memoryview(column)[10:20] for name, column in table.columns().items()}
+    )
+    assert views == rmv.events[10:20]
+
+
+def test_event_table_to_numpy(replay_path):
+    pytest.importorskip("numpy")
+    evf = EVFReplay.from_file(replay_path / "test_subject.evf", event_table=True)
+
+    columns = evf.events.to_numpy()
+    assert columns["gametime"][-1] == evf.events.gametime[-1]
+    assert len(columns["xpos"]) == len(evf.events)
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (RMVReplay, "test_subject_2.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_iter_events(replay_path, cls, fname):
+    full = cls.from_file(replay_path / fname)
+
+    with cls.iter_events(replay_path / fname) as stream:
+        assert stream.replay.events is None
+        assert stream.replay.timeth == full.timeth
+        assert list(stream) == full.events
+    assert stream.file is None
+
+    raw = (replay_path / fname).read_bytes()
+    assert list(cls.iter_events(raw)) == full.events
+
+    # open files are memory mapped
+    with open(str(replay_path / fname), "rb") as file:
+        with cls.iter_events(file) as stream:
+            assert stream.mapped is not None
+            assert list(stream) == full.events
+
+    # others are read in chunks, and the events yielded as they arrive
+    file = io.BytesIO(raw)
+    with cls.iter_events(file, chunk_size=512) as stream:
+        assert stream.mapped is None
+        assert file.tell() < len(raw)
+        first = next(stream)
+        if cls is not AVFReplay:
+            # AVF's events can only be decoded once everything is there
+            assert file.tell() < len(raw)
+        assert [first] + list(stream) == full.events
+    assert stream.replay.events is None
+    assert stream.replay.timeth == full.timeth
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (RMVReplay, "test_subject_2.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_cell_column(replay_path, cls, fname):
+    replay = cls.from_file(replay_path / fname)
+    table = cls.from_file(replay_path / fname, event_table=True)
+    game = Game(replay.board, replay.get_cell_size())
+
+    cells = replay.cell_column()
+    assert cells == table.cell_column()
+    assert len(cells) == len(replay.events)
+    for event, cell in zip(replay.events, cells):
+        if event["type"] == "mouse":
+            expected = game.cell_at(event["xpos"], event["ypos"])
+            assert cell == (MISSING if expected is None else expected)
+        else:
+            assert cell == MISSING
+    assert any(cell != MISSING for cell in cells)
+
+    with pytest.raises(ValueError):
+        cls.from_file(replay_path / fname, metadata_only=True).cell_column()
+
+
+def test_cell_column_edges():
+    table = EventTable()
+    for xpos, ypos in [(0, 0), (15, 16), (47, 31), (48, 0), (0, 32), (-1, 5)]:
+        table.add_mouse("move", 0, xpos, ypos)
+    table.add_terminate("win")
+    # 2 rows, 3 columns
+    assert list(cell_column(table, 2, 3, 16)) == [0, 3, 5, -1, -1, -1, -1]
+    assert cell_column(list(table), 2, 3, 16) == cell_column(table, 2, 3, 16)
+
+
+def test_cell_column_without_numpy(replay_path, monkeypatch):
+    table = EVFReplay.from_file(replay_path / "test_subject.evf", event_table=True)
+    cells = table.cell_column()
+    # importing numpy fails
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    assert table.cell_column() == cells
+    assert (
+        cell_column(list(table.events), table.rows, table.cols, table.get_cell_size())
+        == cells
+    )
@@ -2,7 +2,9 @@ from datetime import datetime
 
 import pytest
 
+from sweeping_view.avf import AVFReplay
 from sweeping_view.evf import EVFReplay
+from sweeping_view.rmv import RMVReplay
 
 
 def test_evf(replay_path):
@@ -115,3 +117,65 @@ def test_evf(replay_path):
         (13, 29),
         (14, 29),
     }
+
+
+def test_evf_metadata_only(replay_path):
+    full = EVFReplay.from_file(replay_path / "test_subject.evf")
+    meta = EVFReplay.from_file(replay_path / "test_subject.evf", metadata_only=True)
+
+    assert meta.events is None
+    assert meta.timeth == full.timeth
+    assert meta.checksum == full.checksum
+    assert len(meta.checksum) == 32
+    assert meta.properties == full.properties
+
+
+def test_evf_round_trip(replay_path, tmp_path):
+    data = (replay_path / "test_subject.evf").read_bytes()
+    evf = EVFReplay.from_file(replay_path / "test_subject.evf")
+    assert evf.to_bytes() == data
+    table = EVFReplay.from_file(replay_path / "test_subject.evf", event_table=True)
+    assert table.to_bytes() == data
+
+    evf.to_file(tmp_path / "out.evf")
+    assert (tmp_path / "out.evf").read_bytes() == data
+
+    evf.user_identifier = "Anonymous"
+    evf.checksum = None
+    anonymized = EVFReplay.from_bytes(evf.to_bytes())
+    assert anonymized.user_identifier == "Anonymous"
+    assert anonymized.checksum is None
+    assert anonymized.events == evf.events
+
+
+def test_evf_flags(replay_path):
+    evf = EVFReplay.from_file(replay_path / "test_subject.evf")
+    assert evf.completed
+    assert evf.official
+    assert evf.fair
+
+
+def test_evf_encode_other_formats(replay_path):
+    rmv = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    evf = EVFReplay.from_bytes(EVFReplay.encode(rmv))
+
+    assert evf.user_identifier == "Thomas Kolar"
+    assert evf.timeth == rmv.timeth
+    assert evf.bbbv == rmv.bbbv
+    assert evf.cell_size == rmv.square_size
+    assert evf.completed
+    assert evf.checksum is None
+    assert evf.properties == rmv.properties
+    assert set(evf.mines) == set(rmv.mines)
+    assert [
+        (event["subtype"], event["gametime"], event["xpos"], event["ypos"])
+        for event in evf.events
+    ] == [
+        (event["subtype"], event["gametime"], event["xpos"], event["ypos"])
+        for event in rmv.events
+        if event["type"] == "mouse"
+    ]
+
+    avf = AVFReplay.from_file(replay_path / "test_subject.avf")
+    evf = EVFReplay.from_bytes(EVFReplay.encode(avf))
+    assert evf.get_player_name() == avf.get_player_name() == "Tommy"
@@ -0,0 +1,120 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.evf import EVFReplay
+from sweeping_view.fingerprint import (
+    LEFT,
+    RIGHT,
+    FingerprintIndex,
+    board_hash,
+    clicks,
+    fingerprint,
+)
+from sweeping_view.rmv import RMVReplay
+
+FILES = [
+    (RMVReplay, "test_subject.rmv"),
+    (RMVReplay, "test_subject_2.rmv"),
+    (EVFReplay, "test_subject.evf"),
+    (AVFReplay, "test_subject.avf"),
+]
+
+
+@pytest.mark.parametrize("cls, fname", FILES)
+def test_fingerprint(replay_path, cls, fname):
+    replay = cls.from_file(replay_path / fname)
+    result = fingerprint(replay)
+    assert result.board == board_hash(replay.board)
+    assert result.timeth == replay.timeth
+    # the same no matter how the events are stored
+    assert fingerprint(cls.from_file(replay_path / fname, event_table=True)) == result
+    with pytest.raises(ValueError):
+        fingerprint(cls.from_file(replay_path / fname, metadata_only=True))
+
+
+# RMV v1 has moves left of the board, which EVF can't represent
+@pytest.mark.parametrize("cls, fname", FILES[1:])
+def test_fingerprint_converted(replay_path, cls, fname):
+    # converting to EVF keeps the fingerprint
+    replay = cls.from_file(replay_path / fname)
+    converted = EVFReplay.from_bytes(EVFReplay.encode(replay))
+    assert fingerprint(converted)[:2] == fingerprint(replay)[:2]
+
+
+def test_fingerprints_differ(replay_path):
+    fingerprints = [
+        fingerprint(cls.from_file(replay_path / fname)) for cls, fname in FILES
+    ]
+    assert len({fp.board for fp in fingerprints}) == len(FILES)
+    assert len({fp.clicks for fp in fingerprints}) == len(FILES)
+
+
+def mouse(subtype, xpos, ypos):
+    return {
+        "type": "mouse",
+        "subtype": subtype,
+        "gametime": 0,
+        "xpos": xpos,
+        "ypos": ypos,
+    }
+
+
+def test_clicks():
+    events = [
+        # RMV's first click has no lmb_down
+        mouse("move", 5, 5),
+        mouse("lmb_up", 5, 5),
+        mouse("rmb_down", 20, 5),
+        mouse("rmb_up", 20, 5),
+        # a chord, EVF style
+        mouse("lmb_down", 5, 20),
+        mouse("chord", 5, 20),
+        mouse("move", 20, 20),
+        mouse("rmb_up", 20, 20),
+        mouse("lmb_up", 20, 20),
+        # outside the board
+        mouse("lmb_down", 100, 5),
+    ]
+    assert list(clicks(events, 2, 2, 16)) == [
+        (LEFT, 0),
+        (0, 0),
+        (RIGHT, 1),
+        (0, 1),
+        (LEFT, 2),
+        (LEFT | RIGHT, 2),
+        (LEFT, 3),
+        (0, 3),
+        (LEFT, -1),
+    ]
+    # the same chord, the other way around
+    events[4:6] = [mouse("rmb_down", 5, 20), mouse("lmb_down", 5, 20)]
+    assert list(clicks(events, 2, 2, 16))[4:6] == [(RIGHT, 2), (LEFT | RIGHT, 2)]
+
+
+def test_fingerprint_index(replay_path):
+    replay = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    result = fingerprint(replay)
+    other = fingerprint(RMVReplay.from_file(replay_path / "test_subject.rmv"))
+    index = FingerprintIndex()
+    index.add("original", result)
+    index.add("other", other)
+    index.add("converted", fingerprint(EVFReplay.from_bytes(EVFReplay.encode(replay))))
+    index.add("rounded", result._replace(timeth=result.timeth + 5))
+    index.add("slower", result._replace(timeth=result.timeth + 1000))
+    index.add("replayed", result._replace(clicks="0" * 32))
+    assert len(index) == 6
+    assert index.matches(result) == [
+        ("converted", "exact"),
+        ("original", "exact"),
+        ("rounded", "same_game"),
+        ("replayed", "same_board"),
+        ("slower", "same_board"),
+    ]
+    assert index.duplicates(result) == ["converted", "original", "rounded"]
+    assert index.duplicates(other) == ["other"]
+
+    index.remove("other")
+    assert "other" not in index
+    assert index.matches(other) == []
+    index.add("original", other)
+    assert index.duplicates(other) == ["original"]
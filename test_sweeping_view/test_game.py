@@ -0,0 +1,156 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.board import Bitboard
+from sweeping_view.events import EventTable
+from sweeping_view.evf import EVFReplay
+from sweeping_view.game import Game, simulate, with_board_events
+from sweeping_view.rmv import RMVReplay
+
+
+@pytest.mark.parametrize("fname", ["test_subject.rmv", "test_subject_2.rmv"])
+def test_simulate_rmv(replay_path, fname):
+    # RMV files have the board events the client recorded
+    replay = RMVReplay.from_file(replay_path / fname)
+    assert list(simulate(replay)) == replay.events
+
+
+@pytest.mark.parametrize(
+    "cls, fname",
+    [
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_simulate_mouse_only(replay_path, cls, fname):
+    replay = cls.from_file(replay_path / fname)
+    events = list(simulate(replay))
+    (end,) = [
+        index for index, event in enumerate(events) if event["type"] == "terminate"
+    ]
+    assert events[end] == {"type": "terminate", "how": "win"}
+    clicks = [event for event in events[:end] if event["type"] == "mouse"]
+    assert clicks[-1]["subtype"] == "lmb_up"
+    opened = {
+        (event["row"], event["col"])
+        for event in events
+        if event["type"] == "board" and event["subtype"].startswith("open_")
+    }
+    assert len(opened) == replay.rows * replay.cols - replay.num_mines
+
+
+def test_with_board_events(replay_path):
+    replay = AVFReplay.from_file(replay_path / "test_subject.avf", event_table=True)
+    events = with_board_events(replay)
+    assert isinstance(events, EventTable)
+    assert events == list(simulate(replay))
+
+
+def play(game, subtypes, xpos, ypos):
+    events = []
+    for subtype in subtypes.split():
+        events += game.mouse(subtype, xpos, ypos)
+    return [
+        (
+            (event["subtype"], event["row"], event["col"])
+            if event["type"] == "board"
+            else event["how"]
+        )
+        for event in events
+    ]
+
+
+def test_game():
+    # 1 * 1 0
+    # 1 1 1 0
+    # 0 0 0 0
+    board = Bitboard.from_cells(3, 4, [(0, 1)])
+    game = Game(board, cell_size=10, questionmarks=True)
+    assert play(game, "rmb_down rmb_up", 15, 5) == [("flag", 0, 1)]
+    assert play(game, "rmb_down rmb_up", 15, 5) == [("qm", 0, 1)]
+    assert play(game, "rmb_down rmb_up", 15, 5) == [("closed", 0, 1)]
+
+    # moving off a pressed cell, and off the board
+    assert play(game, "lmb_down", 5, 5) == [("pressed", 0, 0)]
+    assert play(game, "move", 5, 15) == [("closed", 0, 0), ("pressed", 1, 0)]
+    assert play(game, "move", 45, 15) == [("closed", 1, 0)]
+    assert play(game, "lmb_up", 45, 15) == []
+
+    assert play(game, "lmb_down lmb_up", 5, 5) == [("pressed", 0, 0), ("open_1", 0, 0)]
+    # not enough flags to chord: the pressed cells are released
+    assert play(game, "lmb_down rmb_down", 5, 5) == [
+        ("pressed", 0, 1),
+        ("pressed", 1, 0),
+        ("pressed", 1, 1),
+    ]
+    assert play(game, "rmb_up lmb_up", 5, 5) == [
+        ("closed", 0, 1),
+        ("closed", 1, 0),
+        ("closed", 1, 1),
+    ]
+
+    # a flag, then a chord that opens everything
+    assert play(game, "rmb_down", 15, 5) == [("flag", 0, 1)]
+    assert play(game, "lmb_down", 5, 5) == [("pressed", 1, 0), ("pressed", 1, 1)]
+    assert play(game, "lmb_up rmb_up", 5, 5) == [
+        ("open_1", 1, 0),
+        ("open_1", 1, 1),
+    ]
+    assert play(game, "lmb_down lmb_up", 35, 25) == [
+        ("pressed", 2, 3),
+        ("open_0", 2, 3),
+        ("open_1", 1, 2),
+        ("open_0", 1, 3),
+        ("open_1", 0, 2),
+        ("open_0", 0, 3),
+        ("open_0", 2, 2),
+        ("open_0", 2, 1),
+        ("open_0", 2, 0),
+        "win",
+    ]
+    assert game.result == "win"
+    assert play(game, "lmb_down lmb_up", 15, 5) == []
+
+
+def test_game_blast():
+    board = Bitboard.from_cells(2, 2, [(1, 1)])
+    game = Game(board)
+    game.flag(0, 0)
+    assert play(game, "lmb_down", 0, 0) == []
+    assert play(game, "move lmb_up", 20, 20) == [
+        ("pressed", 1, 1),
+        ("open_blast", 1, 1),
+        "blast",
+    ]
+    assert game.result == "blast"
+
+
+def test_game_clicks():
+    board = Bitboard.from_cells(2, 2, [(1, 1)])
+    game = Game(board)
+    expected = [
+        # RMV's first click, without the button going down
+        ("lmb_up", "left"),
+        ("rmb_down", "right"),
+        ("rmb_up", None),
+        ("lmb_down", None),
+        ("move", None),
+        ("lmb_up", "left"),
+        # a chord, and another one with the right button still down
+        ("lmb_down", None),
+        ("rmb_down", "chord"),
+        ("lmb_up", None),
+        ("lmb_down", "chord"),
+        ("lmb_up", None),
+        ("rmb_up", None),
+        ("mmb_down", "chord"),
+        ("mmb_up", None),
+        ("lmb_down", None),
+        ("chord", "chord"),
+    ]
+    clicks = []
+    for subtype, _ in expected:
+        game.mouse(subtype, 5, 5)
+        clicks.append((subtype, game.click))
+    assert clicks == expected
+    assert game.result is None
@@ -0,0 +1,149 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.base import Limits
+from sweeping_view.events import EventTable
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import (
+    InvalidReplayError,
+    LimitExceededError,
+    TruncatedReplayError,
+    UnknownFormatVersionError,
+)
+from sweeping_view.incremental import IncrementalParser
+from sweeping_view.rmv import RMVReplay
+
+
+def feed(parser, data, chunk_size):
+    events = []
+    for start in range(0, len(data), chunk_size):
+        events += parser.feed(data[start : start + chunk_size])
+    return events + parser.close()
+
+
+@pytest.mark.parametrize(
+    "cls, fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (RMVReplay, "test_subject_2.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_incremental(replay_path, cls, fname, chunk_size):
+    data = (replay_path / fname).read_bytes()
+    expected = cls.from_bytes(data)
+    parser = IncrementalParser(cls, event_table=True)
+    events = feed(parser, data, chunk_size)
+    replay = parser.replay
+    assert isinstance(replay.events, EventTable)
+    assert events == expected.events
+    assert replay.events == expected.events
+    assert replay.timeth == expected.timeth
+    assert replay.mines == expected.mines
+    assert replay.properties == expected.properties
+    assert getattr(replay, "checksum", None) == getattr(expected, "checksum", None)
+    assert replay.get_best_token_source() == expected.get_best_token_source()
+
+
+@pytest.mark.parametrize(
+    "cls, fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_incremental_memory(replay_path, cls, fname):
+    data = (replay_path / fname).read_bytes()
+    expected = cls.from_bytes(data)
+    parser = IncrementalParser(cls, keep_events=False)
+    events = []
+    for start in range(0, len(data), 64):
+        events += parser.feed(data[start : start + 64])
+        if parser.replay is not None and not parser.events_done:
+            # decoded records are dropped, and so are the events
+            assert len(parser.buffer) < 64 + 33
+            assert len(parser.replay.events) == 0
+    events += parser.close()
+    assert events == expected.events
+    assert parser.replay.timeth == expected.timeth
+    assert parser.replay.checksum == expected.checksum
+
+
+def test_incremental_early(replay_path):
+    data = (replay_path / "test_subject_2.rmv").read_bytes()
+    parser = IncrementalParser(RMVReplay, name="upload")
+    assert parser.feed(data[:200]) == []
+    assert parser.replay is None
+    events = parser.feed(data[:1000][200:])
+    # the header is there, and so are the first events
+    assert parser.replay.name == "upload"
+    assert parser.replay.player_data == RMVReplay.from_bytes(data).player_data
+    assert events
+    assert events == RMVReplay.from_bytes(data).events[: len(events)]
+
+
+def test_incremental_header_retries(replay_path, monkeypatch):
+    data = (replay_path / "test_subject.rmv").read_bytes()
+    process_header = RMVReplay.process_header
+    sizes = []
+
+    def counted(replay, data):
+        sizes.append(data.size)
+        return process_header(replay, data)
+
+    monkeypatch.setattr(RMVReplay, "process_header", counted)
+    parser = IncrementalParser(RMVReplay)
+    events = feed(parser, data, 1)
+    monkeypatch.undo()
+    assert events == RMVReplay.from_bytes(data).events
+    # incomplete headers are tried again once the data doubled, not on
+    # every byte
+    assert sizes == [2**n for n in range(len(sizes))]
+    assert sizes[-1] < 2 * parser.replay.events_offset
+
+
+def test_incremental_invalid(replay_path):
+    data = bytearray((replay_path / "test_subject.rmv").read_bytes())
+    data[4:6] = b"\0\x09"
+    with pytest.raises(UnknownFormatVersionError):
+        IncrementalParser(RMVReplay).feed(data[:20])
+
+    data = bytearray((replay_path / "test_subject.avf").read_bytes())
+    data[5] = 9
+    with pytest.raises(InvalidReplayError):
+        IncrementalParser(AVFReplay).feed(data[:20])
+
+
+def test_incremental_truncated(replay_path):
+    data = (replay_path / "test_subject.evf").read_bytes()
+    parser = IncrementalParser(EVFReplay)
+    parser.feed(data[:-100])
+    with pytest.raises(TruncatedReplayError):
+        parser.close()
+    with pytest.raises(ValueError):
+        parser.feed(b"")
+
+    parser = IncrementalParser(EVFReplay)
+    parser.feed(data[:50])
+    with pytest.raises(TruncatedReplayError):
+        parser.close()
+
+
+def test_incremental_limits(replay_path):
+    data = (replay_path / "test_subject.rmv").read_bytes()
+    events = len(RMVReplay.from_bytes(data).events)
+
+    parser = IncrementalParser(RMVReplay, limits=Limits(len(data), events, None))
+    feed(parser, data, 100)
+    assert len(parser.replay.events) == events
+
+    parser = IncrementalParser(RMVReplay, limits=Limits(len(data) - 1, None, None))
+    with pytest.raises(LimitExceededError):
+        feed(parser, data, 100)
+
+    parser = IncrementalParser(RMVReplay, limits=Limits(None, events // 2, None))
+    with pytest.raises(LimitExceededError):
+        feed(parser, data, 100)
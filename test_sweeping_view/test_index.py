@@ -0,0 +1,118 @@
+import os
+import shutil
+
+import pytest
+
+from sweeping_view.evf import EVFReplay
+from sweeping_view.index import ReplayIndex, RefreshStats
+from sweeping_view.rmv import RMVReplay
+
+FILES = [
+    "test_subject.rmv",
+    "test_subject_2.rmv",
+    "test_subject.evf",
+    "test_subject.avf",
+]
+
+
+@pytest.fixture
+def corpus(replay_path, tmp_path):
+    root = tmp_path / "corpus"
+    (root / "nested").mkdir(parents=True)
+    for fname in FILES[:2]:
+        shutil.copy(str(replay_path / fname), str(root / fname))
+    for fname in FILES[2:]:
+        shutil.copy(str(replay_path / fname), str(root / "nested" / fname))
+    (root / "notes.txt").write_text("not a replay")
+    return root
+
+
+def test_index(corpus, replay_path, tmp_path):
+    with ReplayIndex(tmp_path / "index.sqlite") as index:
+        assert index.refresh(corpus, workers=1) == RefreshStats(4, 0, 0, 0, 0)
+        assert len(index) == 4
+
+        rows = {os.path.basename(row["path"]): row for row in index.find()}
+        assert set(rows) == set(FILES)
+        for fname in FILES[:2]:
+            replay = RMVReplay.from_file(replay_path / fname)
+            row = rows[fname]
+            assert row["format"] == "RMVReplay"
+            assert row["properties"] == replay.properties
+            assert row["level"] == replay.properties["level"]
+            assert row["bbbv"] == replay.bbbv
+            assert row["timeth"] == replay.timeth
+            assert row["player"] == replay.get_player_name()
+            assert row["token"] == replay.get_best_token_source()
+            assert row["boardgen_time"] == replay.get_boardgen_time().timestamp()
+
+        evf = EVFReplay.from_file(replay_path / "test_subject.evf")
+        assert [row["path"] for row in index.find(format="EVFReplay")] == [
+            str(corpus / "nested" / "test_subject.evf")
+        ]
+        assert [row["player"] for row in index.find(player=evf.get_player_name())] == [
+            evf.get_player_name()
+        ]
+        timeths = [row["timeth"] for row in index.find(order_by="-timeth")]
+        assert timeths == sorted(timeths, reverse=True)
+        limit = timeths[1]
+        assert sorted(row["timeth"] for row in index.find(max_timeth=limit)) == sorted(
+            timeths[1:]
+        )
+        assert len(list(index.find(limit=2))) == 2
+        with pytest.raises(ValueError):
+            list(index.find(speed=1))
+        with pytest.raises(ValueError):
+            list(index.find(order_by="speed"))
+
+        # nothing changed, nothing is parsed
+        assert index.refresh(corpus, workers=1) == RefreshStats(0, 0, 0, 4, 0)
+
+        # a changed mtime, a removed file, a new one that's broken
+        path = corpus / "test_subject.rmv"
+        stat = path.stat()
+        os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        (corpus / "nested" / "test_subject.avf").unlink()
+        (corpus / "broken.rmv").write_bytes(b"*rmv\0\1" + bytes(20))
+        assert index.refresh(corpus, workers=1) == RefreshStats(1, 1, 1, 2, 1)
+        assert len(index) == 4
+        assert len(list(index.find())) == 3
+        [(path, error)] = index.errors()
+        assert path == str(corpus / "broken.rmv")
+        assert error
+
+        # failed files aren't retried until they change
+        assert index.refresh(corpus, workers=1) == RefreshStats(0, 0, 0, 4, 0)
+
+
+def test_index_roots(corpus, tmp_path):
+    # refreshing one root leaves the others alone
+    other = tmp_path / "corpus2"
+    shutil.copytree(str(corpus), str(other))
+    with ReplayIndex(tmp_path / "index.sqlite") as index:
+        index.refresh([corpus, other], workers=2, chunksize=1)
+        assert len(index) == 8
+        shutil.rmtree(str(other / "nested"))
+        assert index.refresh(other, workers=1) == RefreshStats(0, 0, 2, 2, 0)
+        assert len(index) == 6
+        # a single file as root
+        single = corpus / "test_subject.rmv"
+        assert index.refresh(single, workers=1) == RefreshStats(0, 0, 0, 1, 0)
+        assert len(index) == 6
+
+
+def test_index_deleted_root(corpus, tmp_path):
+    other = tmp_path / "corpus2"
+    shutil.copytree(str(corpus), str(other))
+    with ReplayIndex(tmp_path / "index.sqlite") as index:
+        index.refresh([corpus, other], workers=1)
+        assert len(index) == 8
+        shutil.rmtree(str(other))
+        assert index.refresh([corpus, other], workers=1) == RefreshStats(0, 0, 4, 4, 0)
+        assert len(index) == 4
+        # a deleted single file as root
+        os.remove(str(corpus / "test_subject.rmv"))
+        assert index.refresh(corpus / "test_subject.rmv", workers=1) == RefreshStats(
+            0, 0, 1, 0, 0
+        )
+        assert len(index) == 3
@@ -0,0 +1,138 @@
+import json
+import pickle
+
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.base import BaseReplay
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import TruncatedReplayError
+from sweeping_view.instrumentation import SECTIONS, Collector, event_counts
+from sweeping_view.rmv import RMVReplay
+
+
+@pytest.mark.parametrize(
+    "cls, fname, sections",
+    [
+        (
+            RMVReplay,
+            "test_subject.rmv",
+            ["header", "player", "board", "preflags", "properties", "events", "footer"],
+        ),
+        (RMVReplay, "test_subject_2.rmv", SECTIONS),
+        (
+            EVFReplay,
+            "test_subject.evf",
+            ["header", "player", "board", "events", "footer"],
+        ),
+        (
+            AVFReplay,
+            "test_subject.avf",
+            ["header", "board", "properties", "events", "footer"],
+        ),
+    ],
+)
+@pytest.mark.parametrize("event_table", [False, True])
+def test_profile(replay_path, cls, fname, sections, event_table):
+    path = replay_path / fname
+    size = path.stat().st_size
+    collector = Collector()
+    replay = cls.from_file(path, instrument=collector, event_table=event_table)
+
+    profile = replay.profile
+    assert list(profile.sections) == list(sections)
+    assert profile.size == size
+    assert sum(size for _, size in profile.sections.values()) == size
+    assert profile.sections["events"][1] > 0
+    assert profile.seconds >= sum(seconds for seconds, _ in profile.sections.values())
+    assert profile.events == event_counts(cls.from_file(path).events)
+    assert sum(profile.events.values()) == len(replay.events)
+    assert profile.result == "ok"
+    # the collector isn't kept
+    pickle.dumps(replay)
+
+    metadata = cls.from_file(path, instrument=collector, metadata_only=True)
+    assert metadata.profile.events is None
+    assert metadata.profile.size == size
+
+    snapshot = collector.snapshot()
+    assert [(entry["mode"], entry["count"]) for entry in snapshot["parses"]] == [
+        ("full", 1),
+        ("metadata_only", 1),
+    ]
+    assert [
+        entry["section"] for entry in snapshot["sections"] if entry["mode"] == "full"
+    ] == list(sections)
+    assert sum(entry["count"] for entry in snapshot["events"]) == len(replay.events)
+
+
+def test_disabled(replay_path):
+    replay = RMVReplay.from_file(replay_path / "test_subject.rmv")
+    assert replay.profile is None
+
+    collector = Collector(sample_rate=0)
+    replay = RMVReplay.from_file(replay_path / "test_subject.rmv", instrument=collector)
+    assert replay.profile is None
+    assert collector.snapshot() == {"parses": [], "sections": [], "events": []}
+
+
+def test_default_collector(replay_path, monkeypatch):
+    collector = Collector()
+    monkeypatch.setattr(BaseReplay, "INSTRUMENT", collector)
+    EVFReplay.from_file(replay_path / "test_subject.evf")
+    with EVFReplay.iter_events(replay_path / "test_subject.evf") as stream:
+        list(stream)
+    # the stream's header is parsed metadata_only
+    assert [entry["mode"] for entry in collector.snapshot()["parses"]] == [
+        "full",
+        "metadata_only",
+    ]
+
+
+def test_errors(replay_path):
+    data = (replay_path / "test_subject.rmv").read_bytes()
+    collector = Collector()
+    with pytest.raises(TruncatedReplayError):
+        RMVReplay.from_bytes(data[:-100], instrument=collector)
+    (entry,) = collector.snapshot()["parses"]
+    assert entry["result"] == "TruncatedReplayError"
+    assert entry["count"] == 1
+    assert collector.snapshot()["events"] == []
+
+
+def test_output(replay_path):
+    collector = Collector()
+    for _ in range(2):
+        replay = AVFReplay.from_file(
+            replay_path / "test_subject.avf", instrument=collector
+        )
+
+    text = collector.to_prometheus()
+    assert "# TYPE sweeping_view_parses_total counter" in text
+    assert (
+        'sweeping_view_parses_total{format="AVFReplay",mode="full",result="ok"} 2\n'
+        in text
+    )
+    assert 'sweeping_view_section_bytes_total{format="AVFReplay",mode="full",' in text
+    assert 'sweeping_view_events_total{format="AVFReplay",type="mouse",' in text
+    assert text.endswith("\n")
+
+    snapshot = json.loads(collector.to_json())
+    assert snapshot == collector.snapshot()
+    (events,) = [
+        entry
+        for entry in snapshot["events"]
+        if (entry["type"], entry["subtype"]) == ("mouse", "lmb_down")
+    ]
+    assert events["count"] == 2 * event_counts(replay.events)["mouse", "lmb_down"]
+
+    # e.g. from worker processes
+    merged = Collector()
+    merged.merge(snapshot)
+    merged.merge(snapshot)
+    (parses,) = merged.snapshot()["parses"]
+    assert parses["count"] == 4
+    assert parses["bytes"] == 2 * snapshot["parses"][0]["bytes"]
+
+    collector.reset()
+    assert collector.to_prometheus().count("\n") == 12
@@ -0,0 +1,80 @@
+import subprocess
+import sys
+
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import UnknownMimeType
+from sweeping_view import mime_types
+from sweeping_view.mime_types import detect, detect_mime_type, get_class_for_filename
+from sweeping_view.rmv import RMVReplay
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (RMVReplay, "test_subject_2.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_detect(replay_path, tmp_path, cls, fname):
+    raw = (replay_path / fname).read_bytes()
+    renamed = tmp_path / "upload.bin"
+    renamed.write_bytes(raw)
+
+    assert detect(replay_path / fname) is cls
+    assert detect(raw) is cls
+    assert detect(renamed) is cls
+    with renamed.open("rb") as file:
+        assert detect(file) is cls
+        assert file.tell() == 0
+
+
+def test_detect_unknown():
+    with pytest.raises(UnknownMimeType):
+        detect_mime_type(b"")
+    with pytest.raises(UnknownMimeType):
+        detect(b"\3" + b"\0" * 600)
+
+
+def test_get_class_for_filename():
+    assert get_class_for_filename("replay.RMV") is RMVReplay
+    with pytest.raises(UnknownMimeType):
+        get_class_for_filename("replay")
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="no module __getattr__, imports are eager"
+)
+def test_lazy_imports():
+    # importing the package and mime_types doesn't import the formats, or
+    # look up the version
+    code = (
+        "import sys, sweeping_view.mime_types; "
+        "print(sorted(name for name in sys.modules if name.endswith(('avf', 'evf', "
+        "'rmv', 'setuptools_scm', '_version'))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE
+    ).stdout
+    assert output.strip() == b"[]"
+
+
+def test_lazy_attributes():
+    assert mime_types.RMVReplay is RMVReplay
+    assert mime_types.MIME_TYPES["application/x-metasweeper"] is EVFReplay
+    assert mime_types.MIME_TYPES["application/x-minesweeper-x"] is NotImplemented
+    assert "application/x-minesweeper-x" not in mime_types.supported()
+    with pytest.raises(AttributeError):
+        mime_types.MVFReplay
+
+
+def test_register_mime_type(monkeypatch):
+    # MIME_TYPES is built once, and get_class() sees what is added to it
+    assert mime_types.MIME_TYPES is mime_types.MIME_TYPES
+    monkeypatch.setitem(mime_types.MIME_TYPES, "application/x-test", RMVReplay)
+    assert mime_types.get_class("application/x-test") is RMVReplay
+    assert "application/x-test" in mime_types.supported()
@@ -0,0 +1,108 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.evf import EVFReplay
+from sweeping_view.game import simulate
+from sweeping_view.playback import CLOSED, STATE_CODES, STATES, Playback
+from sweeping_view.rmv import RMVReplay
+
+FILES = [
+    (RMVReplay, "test_subject.rmv"),
+    (RMVReplay, "test_subject_2.rmv"),
+    (EVFReplay, "test_subject.evf"),
+    (AVFReplay, "test_subject.avf"),
+]
+
+
+def naive_states(replay, events):
+    # (gametime, board) after every mouse event, walking the events from the
+    # start
+    state = bytearray(replay.rows * replay.cols)
+    result = []
+    gametime = 0
+    for event in events:
+        if event["type"] == "mouse" and event["gametime"] >= 0:
+            if event["gametime"] != gametime:
+                result.append((gametime, bytes(state)))
+            gametime = event["gametime"]
+        elif event["type"] == "board":
+            state[event["row"] * replay.cols + event["col"]] = STATE_CODES[
+                event["subtype"]
+            ]
+    result.append((gametime, bytes(state)))
+    return result
+
+
+@pytest.mark.parametrize("cls, fname", FILES)
+@pytest.mark.parametrize("interval", [1, 7, 256])
+def test_playback(replay_path, cls, fname, interval):
+    replay = cls.from_file(replay_path / fname)
+    playback = Playback(replay, interval=interval)
+    assert playback.result == "win"
+    assert playback.duration == max(
+        event["gametime"] for event in replay.events if event["type"] == "mouse"
+    )
+    assert len(playback.snapshots) == len(playback) // interval + 1
+
+    events = replay.events if cls is RMVReplay else list(simulate(replay))
+    for gametime, state in naive_states(replay, events):
+        assert playback.state_at(gametime) == state
+
+    assert playback.state_at(-1) == bytes([CLOSED]) * (replay.rows * replay.cols)
+    final = playback.state_at(playback.duration + 1000)
+    assert final == playback.state_after(len(playback))
+    # won, so every cell is open or flagged - or a mine that's still closed
+    grid = playback.grid_at(playback.duration)
+    assert sum(1 for row in grid for name in row if name.startswith("open")) == (
+        replay.rows * replay.cols - replay.num_mines
+    )
+    assert all(name in STATES for row in grid for name in row)
+    with pytest.raises(IndexError):
+        playback.state_after(len(playback) + 1)
+
+
+def test_playback_simulated(replay_path):
+    # RMV's own board events and simulated ones give the same boards
+    replay = RMVReplay.from_file(replay_path / "test_subject_2.rmv", event_table=True)
+    recorded = Playback(replay, interval=16)
+    simulated = Playback(replay, interval=16, simulate_board=True)
+    assert len(recorded) == len(simulated)
+    for ms in range(0, recorded.duration + 100, 50):
+        assert recorded.state_at(ms) == simulated.state_at(ms)
+
+
+def test_playback_mouse(replay_path):
+    replay = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    playback = Playback(replay)
+    mouse = [event for event in replay.events if event["type"] == "mouse"]
+    first = mouse[0]
+    assert playback.mouse_at(first["gametime"] - 1) is None
+    last = mouse[-1]
+    assert playback.mouse_at(last["gametime"] + 1) == (
+        last["subtype"],
+        last["xpos"],
+        last["ypos"],
+    )
+
+    with pytest.raises(ValueError):
+        Playback(
+            RMVReplay.from_file(replay_path / "test_subject.rmv", metadata_only=True)
+        )
+
+
+def test_playback_open(replay_path):
+    # RMV has a board event for opening a cell without saying its number
+    replay = RMVReplay.from_file(replay_path / "test_subject.rmv")
+    index, event = next(
+        (index, event)
+        for index, event in enumerate(replay.events)
+        if event["type"] == "board"
+    )
+    opened = dict(event, subtype="open")
+    replay.events = replay.events[: index + 1] + [opened] + replay.events[index + 1 :]
+
+    playback = Playback(replay)
+    cell = event["row"] * replay.cols + event["col"]
+    # after the first board event and the added one
+    assert playback.state_after(2)[cell] == STATE_CODES["open"]
+    assert STATES[-1] == "open"
@@ -0,0 +1,112 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import (
+    InvalidReplayError,
+    LimitExceededError,
+    TruncatedReplayError,
+)
+from sweeping_view.reader import UINT16, BufferReader
+from sweeping_view.rmv import RMVReplay
+
+
+def test_buffer_reader():
+    reader = BufferReader(b"\x01\x02\x03abc\0rest")
+
+    assert reader.uint8() == 1
+    assert reader.unpack(UINT16) == (0x0203,)
+    assert reader.c_string() == b"abc"
+    assert reader.find(b"st") == 9
+    assert bytes(reader.view(2)) == b"re"
+    assert reader.read_rest() == b"st"
+    with pytest.raises(TruncatedReplayError):
+        reader.uint8()
+
+    reader.seek(2)
+    with pytest.raises(InvalidReplayError):
+        reader.skip(-1)
+    assert reader.tell() == 2
+
+
+def test_buffer_reader_max_scan():
+    reader = BufferReader(b"abcdef\0rest", max_scan=6)
+    assert reader.find(b"\0") == 6
+    assert reader.c_string() == b"abcdef"
+
+    reader = BufferReader(b"abcdefg\0rest", max_scan=6)
+    assert reader.find(b"\0") == -1
+    with pytest.raises(LimitExceededError):
+        reader.c_string()
+
+    # running out of data first is still truncation
+    reader = BufferReader(b"abc", max_scan=6)
+    with pytest.raises(TruncatedReplayError):
+        reader.read_until(b"\0")
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_truncated(replay_path, cls, fname):
+    raw = (replay_path / fname).read_bytes()
+
+    for size in (0, 1, 20, len(raw) // 2):
+        with pytest.raises(InvalidReplayError):
+            cls.from_bytes(raw[:size])
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+def test_mmap(replay_path, cls, fname):
+    mapped = cls.from_file(replay_path / fname)
+    read = cls.from_file(replay_path / fname, use_mmap=False)
+
+    assert mapped.events == read.events
+    assert mapped.timeth == read.timeth
+
+    # stop halfway, the mapping still has to be closed cleanly
+    with cls.iter_events(replay_path / fname) as stream:
+        next(stream)
+    assert stream.file is None
+
+
+@pytest.mark.parametrize(
+    "cls,fname",
+    [
+        (RMVReplay, "test_subject.rmv"),
+        (EVFReplay, "test_subject.evf"),
+        (AVFReplay, "test_subject.avf"),
+    ],
+)
+@pytest.mark.parametrize("metadata_only", [False, True])
+def test_memoryview(replay_path, cls, fname, metadata_only):
+    data = bytearray((replay_path / fname).read_bytes())
+    view = memoryview(data)
+    replay = cls.from_bytes(view, metadata_only=metadata_only)
+
+    assert vars(replay) == vars(
+        cls.from_bytes(bytes(data), metadata_only=metadata_only)
+    )
+    # the replay keeps copies, not views
+    view.release()
+    data.extend(b"more")
+
+
+def test_mmap_empty_file(tmp_path):
+    path = tmp_path / "empty.rmv"
+    path.write_bytes(b"")
+
+    with pytest.raises(InvalidReplayError):
+        RMVReplay.from_file(path)
@@ -1,6 +1,12 @@
 from datetime import datetime
 
-from sweeping_view.rmv import RMVReplay
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.evf import EVFReplay
+from sweeping_view.exceptions import EncodingError, InvalidReplayError
+from sweeping_view.incremental import IncrementalParser
+from sweeping_view.rmv import EVENT_SIZES, MOUSE_EVENT, RMVReplay
 
 def test_rmv(replay_path):
     rmv = RMVReplay.from_file(replay_path / "test_subject.rmv")
@@ -49,3 +55,113 @@ def test_rmv2(replay_path):
         {'col': 7, 'row': 7, 'subtype': 'open_1', 'type': 'board'},
         {'how': 'win', 'type': 'terminate'},
     ]
+
+
+def test_rmv_metadata_only(replay_path):
+    for fname in ("test_subject.rmv", "test_subject_2.rmv"):
+        full = RMVReplay.from_file(replay_path / fname)
+        meta = RMVReplay.from_file(replay_path / fname, metadata_only=True)
+
+        assert meta.events is None
+        assert meta.timeth == full.timeth
+        assert meta.checksum == full.checksum
+        assert meta.bbbv == full.bbbv
+        assert meta.properties == full.properties
+        assert meta.get_best_token_source() == full.get_best_token_source()
+
+
+def test_rmv_video_size(replay_path):
+    # version 2, the video size follows 12 bytes of header and 6 section sizes
+    data = bytearray((replay_path / "test_subject_2.rmv").read_bytes())
+    data[24:28] = (0).to_bytes(4, "big")
+    for metadata_only in (False, True):
+        with pytest.raises(InvalidReplayError):
+            RMVReplay.from_bytes(bytes(data), metadata_only=metadata_only)
+
+
+def test_rmv_round_trip(replay_path, tmp_path):
+    for fname in ("test_subject.rmv", "test_subject_2.rmv"):
+        data = (replay_path / fname).read_bytes()
+        rmv = RMVReplay.from_file(replay_path / fname)
+        assert rmv.to_bytes() == data
+        table = RMVReplay.from_file(replay_path / fname, event_table=True)
+        assert table.to_bytes() == data
+
+        rmv.to_file(tmp_path / fname)
+        assert (tmp_path / fname).read_bytes() == data
+
+    with pytest.raises(EncodingError):
+        RMVReplay.from_file(replay_path / fname, metadata_only=True).to_bytes()
+
+
+def test_rmv_full_moves(replay_path):
+    # a client may write a full move where a reduced one would do
+    original = (replay_path / "test_subject_2.rmv").read_bytes()
+    rmv = RMVReplay.from_bytes(original)
+    data = bytearray(original)
+    pos = rmv.events_offset
+    for event in rmv.events:
+        if data[pos] == 28:
+            break
+        pos += EVENT_SIZES[data[pos]]
+    data[pos : pos + 3] = b"\1" + MOUSE_EVENT.pack(
+        event["gametime"] << 8 | event["nFlags"], event["xpos"], event["ypos"]
+    )
+    # the file and video sizes
+    for start in (8, 24):
+        size = int.from_bytes(data[start : start + 4], "big")
+        data[start : start + 4] = (size + 6).to_bytes(4, "big")
+
+    full = RMVReplay.from_bytes(bytes(data))
+    assert full.events == rmv.events
+    assert full.full_moves == [pos - rmv.events_offset]
+    assert full.to_bytes() == data
+    assert RMVReplay.from_bytes(bytes(data), event_table=True).to_bytes() == data
+    # also when the events arrive one byte at a time
+    parser = IncrementalParser(RMVReplay)
+    for start in range(len(data)):
+        parser.feed(data[start : start + 1])
+    parser.close()
+    assert parser.replay.to_bytes() == data
+
+
+def test_rmv_anonymize(replay_path):
+    rmv = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    rmv.player_data["name"] = "Anonymous"
+    rmv.player_data["nickname"] = ""
+
+    anonymized = RMVReplay.from_bytes(rmv.to_bytes())
+    assert anonymized.player_data["name"] == "Anonymous"
+    assert anonymized.player_data["nickname"] == ""
+    assert anonymized.events == rmv.events
+    assert anonymized.mines == rmv.mines
+
+
+def test_rmv_encode_other_formats(replay_path):
+    avf = AVFReplay.from_file(replay_path / "test_subject.avf")
+    rmv = RMVReplay.from_bytes(RMVReplay.encode(avf))
+
+    assert rmv.format_version == 2
+    assert rmv.player_data["name"] == "Tommy"
+    assert rmv.get_player_name() == avf.get_player_name()
+    assert rmv.timeth == avf.timeth
+    assert rmv.bbbv == avf.bbbv
+    assert rmv.properties["level"] == "beginner"
+    assert set(rmv.mines) == {(row - 1, col - 1) for row, col in avf.mines}
+    # without the end marker, and RMV adds nFlags
+    for event in rmv.events:
+        event.pop("nFlags", None)
+    assert rmv.events[:-1] == avf.events[:-1]
+    assert rmv.events[-1] == {"type": "terminate", "how": "other"}
+
+    # also when parsed from a file whose name differs from the player's
+    avf = AVFReplay.from_bytes(
+        (replay_path / "test_subject.avf").read_bytes(), name="upload.avf"
+    )
+    rmv = RMVReplay.from_bytes(RMVReplay.encode(avf))
+    assert rmv.get_player_name() == "Tommy"
+
+    # EVF's chord events have no RMV equivalent
+    evf = EVFReplay.from_file(replay_path / "test_subject.evf")
+    with pytest.raises(EncodingError):
+        RMVReplay.encode(evf)
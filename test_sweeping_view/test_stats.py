@@ -0,0 +1,116 @@
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.board import MINE
+from sweeping_view.evf import EVFReplay
+from sweeping_view.rmv import RMVReplay
+from sweeping_view.stats import file_stats, replay_stats, stats_many
+
+FILES = [
+    (RMVReplay, "test_subject.rmv"),
+    (RMVReplay, "test_subject_2.rmv"),
+    (EVFReplay, "test_subject.evf"),
+    (AVFReplay, "test_subject.avf"),
+]
+
+
+@pytest.mark.parametrize("cls, fname", FILES)
+def test_stats(replay_path, cls, fname):
+    replay = cls.from_file(replay_path / fname)
+    stats = replay_stats(replay)
+    assert stats.result == "win"
+    assert stats.clicks == stats.left + stats.right + stats.chord
+    assert stats.effective == (
+        stats.effective_left + stats.effective_right + stats.effective_chord
+    )
+    assert 0 < stats.effective <= stats.clicks
+    assert sum(stats.clicks_per_second) == stats.clicks
+    assert len(stats.clicks_per_second) == replay.timeth // 1000 + 1
+    assert stats.time == replay.timeth / 1000
+    assert stats.bbbv_s == pytest.approx(replay.bbbv / stats.time)
+    assert stats.ioe == pytest.approx(replay.bbbv / stats.clicks)
+    assert stats.rqp == pytest.approx(stats.time / stats.bbbv_s)
+    assert stats.path > 0
+
+    # the same from event tables, streamed events, and in batch mode
+    assert replay_stats(cls.from_file(replay_path / fname, event_table=True)) == stats
+    with cls.iter_events(str(replay_path / fname)) as stream:
+        assert replay_stats(stream.replay, stream) == stats
+    assert file_stats(str(replay_path / fname)).stats == stats
+
+    with pytest.raises(ValueError):
+        replay_stats(cls.from_file(replay_path / fname, metadata_only=True))
+
+
+def test_stats_counts(replay_path):
+    replay = RMVReplay.from_file(replay_path / "test_subject_2.rmv")
+    size = replay.get_cell_size()
+    numbers = replay.board.numbers()
+    cells = [divmod(index, replay.cols) for index in range(len(numbers))]
+    # a 1, and the mine next to it
+    number, mine = next(
+        (cell, other)
+        for cell, n in zip(cells, numbers)
+        if n == 1
+        for other in cells
+        if numbers[other[0] * replay.cols + other[1]] == MINE
+        and max(abs(cell[0] - other[0]), abs(cell[1] - other[1])) == 1
+    )
+
+    def mouse(subtype, gametime, cell):
+        row, col = cell
+        return {
+            "type": "mouse",
+            "subtype": subtype,
+            "gametime": gametime,
+            "xpos": col * size + 1,
+            "ypos": row * size + 1,
+        }
+
+    events = [
+        # opens a number, then clicks it again
+        mouse("lmb_down", 0, number),
+        mouse("lmb_up", 100, number),
+        mouse("lmb_down", 200, number),
+        mouse("lmb_up", 300, number),
+        # flags and unflags a mine
+        mouse("rmb_down", 1100, mine),
+        mouse("rmb_up", 1200, mine),
+        mouse("rmb_down", 1300, mine),
+        mouse("rmb_up", 1400, mine),
+        # a chord on the number, without the flag
+        mouse("lmb_down", 2100, number),
+        mouse("rmb_down", 2200, number),
+        mouse("lmb_up", 2300, number),
+        mouse("rmb_up", 2400, number),
+        # a right click on an opened cell
+        mouse("rmb_down", 2500, number),
+        mouse("rmb_up", 2600, number),
+        # and a blast
+        mouse("lmb_down", 3500, mine),
+        mouse("lmb_up", 3600, mine),
+    ]
+    stats = replay_stats(replay, events)
+    assert stats[:8] == (3, 3, 1, 7, 2, 2, 0, 4)
+    assert stats.clicks_per_second == (2, 2, 2, 1)
+    assert stats.result == "blast"
+    assert stats.correctness == 4 / 7
+
+    # with the flag, the chord opens the number's neighbours
+    events[6:8] = []
+    stats = replay_stats(replay, events)
+    assert stats.effective_chord == 1
+
+
+def test_stats_many(replay_path, tmp_path):
+    paths = [str(replay_path / fname) for _, fname in FILES]
+    broken = tmp_path / "broken.rmv"
+    broken.write_bytes(b"*rmv\0\1" + bytes(20))
+    paths.append(str(broken))
+    results = list(stats_many(paths, workers=2, chunksize=1))
+    assert [result.path for result in results] == paths
+    for result, (cls, fname) in zip(results, FILES):
+        assert result.error is None
+        assert result.stats == replay_stats(cls.from_file(replay_path / fname))
+    assert results[-1].stats is None
+    assert results[-1].error is not None
@@ -0,0 +1,111 @@
+from array import array
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from sweeping_view.avf import AVFReplay
+from sweeping_view.events import EventTable
+from sweeping_view.evf import EVFReplay
+from sweeping_view import store
+from sweeping_view.rmv import RMVReplay
+from sweeping_view.store import Store, StoreWriter, write_store
+
+FILES = [
+    (RMVReplay, "test_subject.rmv"),
+    (RMVReplay, "test_subject_2.rmv"),
+    (EVFReplay, "test_subject.evf"),
+    (AVFReplay, "test_subject.avf"),
+]
+
+
+@pytest.fixture
+def replays(replay_path):
+    return [
+        cls.from_file(str(replay_path / fname), event_table=index % 2 == 0)
+        for index, (cls, fname) in enumerate(FILES)
+    ]
+
+
+def test_store(replays, tmp_path):
+    path = tmp_path / "replays.store"
+    assert write_store(path, replays) == len(replays)
+    with Store(path) as store:
+        assert len(store) == len(replays)
+        for index, replay in enumerate(replays):
+            header = store.header(index)
+            assert header == {
+                "format": type(replay).__name__,
+                "level": replay.properties["level"],
+                "rows": replay.rows,
+                "cols": replay.cols,
+                "mines": replay.num_mines,
+                "bbbv": replay.bbbv,
+                "timeth": replay.timeth,
+                "boardgen_time": replay.get_boardgen_time(),
+                "player": replay.get_player_name(),
+                "name": replay.source_name,
+            }
+            events = store.events(index)
+            assert isinstance(events, EventTable)
+            assert events == replay.events
+        assert list(store.headers()) == [store.header(ii) for ii in range(4)]
+
+        # whole columns, across replays
+        gametime = store.column("events.gametime")
+        assert len(gametime) == sum(len(replay.events) for replay in replays)
+        start, end = store.event_range(2)
+        assert list(gametime[start:end]) == list(replays[2].events.gametime)
+        assert list(store.column("bbbv")) == [replay.bbbv for replay in replays]
+        del gametime
+
+        with pytest.raises(IndexError):
+            store.header(4)
+
+
+def test_store_metadata_only(replay_path, tmp_path):
+    path = tmp_path / "replays.store"
+    replay = RMVReplay.from_file(replay_path / "test_subject.rmv", metadata_only=True)
+    with StoreWriter(path) as writer:
+        writer.add(replay)
+    with Store(path) as store:
+        assert store.header(0)["timeth"] == replay.timeth
+        assert len(store.events(0)) == 0
+
+
+def test_store_invalid(replay_path, tmp_path):
+    with pytest.raises(ValueError):
+        Store(replay_path / "test_subject.rmv")
+
+    # nothing is written if adding a replay fails
+    path = tmp_path / "replays.store"
+    with pytest.raises(AttributeError):
+        write_store(path, [None])
+    assert not path.exists()
+
+
+class ForeignWriter(StoreWriter):
+    # writes stores the way a machine of the other byte order would
+    def write(self, name, values):
+        values = array(values.typecode, values)
+        values.byteswap()
+        super().write(name, values)
+
+
+def test_store_other_byteorder(replays, tmp_path, monkeypatch):
+    write_store(tmp_path / "native.store", replays)
+    other = "big" if sys.byteorder == "little" else "little"
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "sys", SimpleNamespace(byteorder=other))
+        with ForeignWriter(tmp_path / "foreign.store") as writer:
+            for replay in replays:
+                writer.add(replay)
+
+    with Store(tmp_path / "native.store") as native:
+        with Store(tmp_path / "foreign.store") as foreign:
+            assert foreign.swap
+            for name in foreign.layout:
+                assert list(foreign.column(name)) == list(native.column(name))
+            for index in range(len(replays)):
+                assert foreign.header(index) == native.header(index)
+                assert foreign.events(index) == native.events(index)